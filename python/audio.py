@@ -0,0 +1,265 @@
+""" Audio helpers for the phono-ortho-spelling project.
+
+Every WAV file we play is decoded once with simpleaudio and kept in a
+process-wide cache (`audio_cache`), so that playing a clip for the second
+time does not touch the disk. The cache has a budget in bytes of decoded
+PCM data and evicts the least recently played clips when it is full.
+
+Controllers that know which clips they are going to need (for example the
+training schedule) can ask the cache to load them in the background with
+`audio_cache.prefetch(paths)`, so that by the time a trial starts its
+sound is already in memory.
+
+Clips whose end we need to wait for (e.g. to show the next training
+picture, or to enable a button after the instructions) are played by
+`audio_player` on a worker thread instead of calling `wait_done()` on
+the Tk thread, which used to freeze the whole window for the duration
+of the clip. When a clip finishes, the worker puts a completion event on
+a thread-safe queue, which the Tk main loop polls with `after()` and
+then runs the clip's `on_done` callback on the Tk thread.
+
+simpleaudio is only imported when the first clip is loaded, so importing
+this module does not slow down the start of the program.
+
+`use_null_backend()` replaces the sound card with a silent backend whose
+clips take no time to play, for running the program headless (see
+simulate.py).
+"""
+
+import queue
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from typing import Callable, Iterable, List, NamedTuple, Optional
+
+from timing import timing
+
+
+# Enough for every talker recording of every word in Stimuli/Active
+DEFAULT_BUDGET = 128 * 1024 * 1024
+
+
+class AudioCache:
+    """ LRU cache of decoded simpleaudio.WaveObject's, keyed by file path """
+
+    def __init__(self, max_bytes: int = DEFAULT_BUDGET):
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self._waves = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._prefetch_queue = queue.Queue()
+        self._worker = None
+        self.load = self._load_with_simpleaudio
+
+    def __contains__(self, filepath: str) -> bool:
+        with self._lock:
+            return filepath in self._waves
+
+    def get(self, filepath: str) -> 'simpleaudio.WaveObject':
+        """ Return the decoded clip, reading it from disk only if it is not
+        already cached (or being loaded by the prefetch thread) """
+        with self._lock:
+            wave_obj = self._waves.get(filepath)
+            if wave_obj is not None:
+                self._waves.move_to_end(filepath)
+                return wave_obj
+            loading = self._loading.get(filepath)
+            if loading is None:
+                loading = self._loading[filepath] = threading.Event()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            # The prefetch thread is reading this file right now
+            loading.wait()
+            with self._lock:
+                wave_obj = self._waves.get(filepath)
+            if wave_obj is not None:
+                return wave_obj
+            return self.get(filepath)
+
+        try:
+            with timing.span('audio_load', filepath):
+                wave_obj = self.load(filepath)
+            self._store(filepath, wave_obj)
+        finally:
+            with self._lock:
+                del self._loading[filepath]
+            loading.set()
+        return wave_obj
+
+    @staticmethod
+    def _load_with_simpleaudio(filepath: str) -> 'simpleaudio.WaveObject':
+        import simpleaudio as sa
+        return sa.WaveObject.from_wave_file(filepath)
+
+    def _store(self, filepath: str, wave_obj: 'simpleaudio.WaveObject'):
+        size = len(wave_obj.audio_data)
+        with self._lock:
+            if size > self.max_bytes:
+                return
+            self._waves[filepath] = wave_obj
+            self.n_bytes += size
+            while self.n_bytes > self.max_bytes:
+                _, evicted = self._waves.popitem(last = False)
+                self.n_bytes -= len(evicted.audio_data)
+
+    def prefetch(self, filepaths: Iterable[str]):
+        """ Load the given clips on a background thread, in order """
+        for filepath in filepaths:
+            self._prefetch_queue.put(filepath)
+        if self._worker is None:
+            self._worker = threading.Thread(target = self._prefetch_worker,
+                                            name = 'audio-prefetch',
+                                            daemon = True)
+            self._worker.start()
+
+    def _prefetch_worker(self):
+        while True:
+            filepath = self._prefetch_queue.get()
+            try:
+                self.get(filepath)
+            except Exception:
+                # Missing or broken files are reported when they are played
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._waves.clear()
+            self.n_bytes = 0
+
+
+audio_cache = AudioCache()
+
+
+def play_audio(filepath, wait = False):
+    play_obj = audio_cache.get(filepath).play()
+    if wait:
+        play_obj.wait_done()
+    return play_obj
+
+
+#==============================================================================
+# Non-blocking playback
+#==============================================================================
+
+class PlaybackRecord(NamedTuple):
+    """ When a clip actually started and stopped, in time.perf_counter() """
+    filepath: str
+    onset: float
+    offset: float
+
+
+class AudioPlayer:
+    """ Plays clips one after the other on a worker thread and hands
+    completion events back to the Tk main loop """
+
+    def __init__(self, cache: AudioCache = audio_cache, poll_ms: int = 5):
+        self.cache = cache
+        self.poll_ms = poll_ms
+        self.history: List[PlaybackRecord] = []
+        self._requests = queue.Queue()
+        self._completed = queue.Queue()
+        self._worker = None
+        self._root = None
+        self.null = False
+
+    def attach(self, root):
+        """ Start delivering completion callbacks on the given Tk root """
+        self._root = root
+        if not self.null:
+            root.after(self.poll_ms, self._poll)
+
+    def play(self, filepath: str, on_done: Optional[Callable] = None):
+        """ Queue a clip for playback and return immediately. `on_done` is
+        called on the Tk thread once the clip has finished playing. """
+        if self.null:
+            onset = time.perf_counter()
+            self.history.append(PlaybackRecord(filepath, onset, onset))
+            if on_done is not None:
+                self._root.after(0, on_done)
+            return
+        self._requests.put((filepath, on_done))
+        if self._worker is None:
+            self._worker = threading.Thread(target = self._play_worker,
+                                            name = 'audio-player',
+                                            daemon = True)
+            self._worker.start()
+
+    def onset_intervals(self) -> List[float]:
+        """ Onset-to-onset intervals, in seconds, of the clips played so far """
+        onsets = [record.onset for record in self.history]
+        return [b - a for a, b in zip(onsets, onsets[1:])]
+
+    def _play_worker(self):
+        while True:
+            filepath, on_done = self._requests.get()
+            try:
+                wave_obj = self.cache.get(filepath)
+                onset = time.perf_counter()
+                wave_obj.play().wait_done()
+                offset = time.perf_counter()
+                self._completed.put((on_done,
+                                     PlaybackRecord(filepath, onset, offset)))
+            except Exception:
+                traceback.print_exc()
+                self._completed.put((on_done, None))
+
+    def _poll(self):
+        while True:
+            try:
+                on_done, record = self._completed.get_nowait()
+            except queue.Empty:
+                break
+            if record is not None:
+                self.history.append(record)
+                timing.add('audio_play', record.onset, record.offset,
+                           record.filepath)
+            if on_done is not None:
+                # A failing callback must not stop the polling, or no
+                # later clip would ever report that it finished
+                try:
+                    on_done()
+                except Exception:
+                    traceback.print_exc()
+        self._root.after(self.poll_ms, self._poll)
+
+
+audio_player = AudioPlayer()
+
+
+#==============================================================================
+# Playing without a sound card
+#==============================================================================
+
+class NullPlayObject:
+    def wait_done(self):
+        pass
+
+    def is_playing(self) -> bool:
+        return False
+
+    def stop(self):
+        pass
+
+
+class NullWaveObject:
+    """ A silent clip that finishes as soon as it starts """
+    audio_data = b''
+
+    def play(self) -> NullPlayObject:
+        return NullPlayObject()
+
+
+NULL_WAVE = NullWaveObject()
+
+
+def use_null_backend():
+    """ Play every clip silently, without loading it. Call this before
+    `audio_player.attach`. """
+    audio_cache.clear()
+    audio_cache.load = lambda filepath: NULL_WAVE
+    audio_player.null = True
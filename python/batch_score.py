@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+
+""" Score a whole cohort without the GUI.
+
+Pairs every pretest workbook in output_pretest/ (pretest_<code>.xlsx, or
+pretest_<code>.csv) with the post-test results of the same participant in
+output_test/ (<code>_test_results.csv). For every pair it writes
+
+    output_final/<code>_final.csv   the final report (see final.py)
+    output_final/<code>_ld.csv      the same rows with edit distances
+
+Participants are scored in parallel in a pool of processes, one per CPU
+core by default, and a per-participant timing summary is printed at the
+end.
+
+Edit distances are remembered between runs in distance_cache.json (see
+distance_cache.py): every worker starts from the pairs in the file, and
+the pairs they compute are added to it at the end of the run, so scoring
+a cohort again only computes the pairs it has not seen before.
+
+Usage (from the python/ directory):
+
+    python batch_score.py [--pretest-dir DIR] [--test-dir DIR]
+                          [--out-dir DIR] [--jobs N]
+                          [--cache FILE | --no-cache]
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, NamedTuple, Tuple
+
+import distance_cache
+import final
+import lexicon
+import phonology
+from distance_cache import CacheStats, DistanceCache, Entry
+from levenshtein_distance.levenshtein_distance import editDistanceCache
+
+LD_HEADER = ["Phase", "Condition", "Ortho Target", "Ortho Production", "LD",
+             "Phono Target", "Phono production", "LD"]
+
+PRETEST_PREFIX = "pretest_"
+TEST_SUFFIX = "_test_results.csv"
+
+
+class Participant(NamedTuple):
+    code: str
+    pretest_path: str
+    test_path: str
+
+
+class Timing(NamedTuple):
+    code: str
+    n_rows: int
+    seconds: float
+
+
+class Scored(NamedTuple):
+    """ What a worker sends back for one participant """
+    timing: Timing
+    # cache name -> the pairs computed for this participant
+    new_distances: Dict[str, List[Entry]]
+    # cache name -> (hits, misses) for this participant
+    lookups: Dict[str, Tuple[int, int]]
+
+
+#==============================================================================
+# Finding the participants
+#==============================================================================
+
+def find_participants(pretest_dir: str, test_dir: str
+                      ) -> Tuple[List[Participant], List[str]]:
+    """ Pair pretest and post-test files by participant code. Returns the
+    pairs and the codes that only have one of the two files. """
+    pretests = {}
+    for name in os.listdir(pretest_dir):
+        stem, ext = os.path.splitext(name)
+        if stem.startswith(PRETEST_PREFIX) and ext in ('.xlsx', '.csv'):
+            code = stem[len(PRETEST_PREFIX):]
+            # Prefer the workbook if there is both a .xlsx and a .csv
+            if ext == '.xlsx' or code not in pretests:
+                pretests[code] = os.path.join(pretest_dir, name)
+    tests = {}
+    for name in os.listdir(test_dir):
+        if name.endswith(TEST_SUFFIX):
+            tests[name[:-len(TEST_SUFFIX)]] = os.path.join(test_dir, name)
+
+    participants = [Participant(code, pretests[code], tests[code])
+                    for code in sorted(pretests.keys() & tests.keys())]
+    unpaired = sorted(pretests.keys() ^ tests.keys())
+    return participants, unpaired
+
+#==============================================================================
+# Scoring one participant (runs in a worker process)
+#==============================================================================
+
+_phono: Dict[str, str] = None
+
+def score_participant(participant: Participant, out_dir: str,
+                      phono_path: str = final.PHONO_PATH) -> Timing:
+    global _phono
+    start = time.perf_counter()
+    if _phono is None:
+        _phono = lexicon.transcriptions(phono_path)
+    # Each worker process has its own scorer, which remembers the
+    # spellings of every participant it has scored
+    scorer = phonology.scorer()
+
+    rows = list(final.report_rows(
+            final.read_rows(participant.pretest_path, 'Pretest'),
+            final.read_rows(participant.test_path),
+            _phono, scorer))
+    # Spelling is scored case-insensitively, and the phono production with
+    # the weighted phoneme distance of phonology.py. Rows without a
+    # production get an empty LD rather than the length of the target.
+    ortho_ld = editDistanceCache.distances([row[2].lower() for row in rows],
+                                           [row[3].lower() for row in rows])
+    phono_ld = scorer.distances.distances([row[5] for row in rows],
+                                          [row[6] for row in rows])
+    ortho_ld = [ld if row[3] else "" for row, ld in zip(rows, ortho_ld)]
+    phono_ld = [ld if row[6] else "" for row, ld in zip(rows, phono_ld)]
+
+    final_path = os.path.join(out_dir, participant.code + "_final.csv")
+    with open(final_path, "w", newline='') as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(final.HEADER)
+        writer.writerows(rows)
+
+    ld_path = os.path.join(out_dir, participant.code + "_ld.csv")
+    with open(ld_path, "w", newline='') as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(LD_HEADER)
+        for row, ld1, ld2 in zip(rows, ortho_ld, phono_ld):
+            writer.writerow(row[0:4] + [ld1] + row[5:7] + [ld2])
+
+    return Timing(participant.code, len(rows), time.perf_counter() - start)
+
+def distance_caches() -> List[DistanceCache]:
+    return [editDistanceCache, phonology.scorer().distances]
+
+def init_worker(cache_path: str):
+    if cache_path:
+        distance_cache.load(cache_path, distance_caches())
+
+def score_and_report(participant: Participant, out_dir: str) -> Scored:
+    """ score_participant, along with what it added to the caches """
+    caches = distance_caches()
+    before = [cache.stats() for cache in caches]
+    for cache in caches:
+        cache.take_new()
+    timing = score_participant(participant, out_dir)
+    lookups = {}
+    for cache, old in zip(caches, before):
+        new = cache.stats()
+        lookups[cache.name] = (new.hits - old.hits, new.misses - old.misses)
+    return Scored(timing, {cache.name: cache.take_new() for cache in caches},
+                  lookups)
+
+
+#==============================================================================
+# Command line interface
+#==============================================================================
+
+def print_summary(timings: List[Timing], failures: List[str], elapsed: float,
+                  lookups: Dict[str, List[int]] = None):
+    print()
+    print(f"{'Participant':<24}{'Rows':>6}{'Time (ms)':>12}")
+    for timing in sorted(timings, key = lambda t: t.seconds, reverse = True):
+        print(f"{timing.code:<24}{timing.n_rows:>6}{timing.seconds*1000:>12.1f}")
+    total = sum(timing.seconds for timing in timings)
+    print()
+    print(f"Scored {len(timings)} participants in {elapsed:.2f} s "
+          f"({total:.2f} s of work)")
+    for name, (hits, misses) in sorted((lookups or {}).items()):
+        stats = CacheStats(hits, misses, 0, 0)
+        print(f"{name} distances: {hits} cached, {misses} computed "
+              f"({stats.hit_rate:.0%} hit rate)")
+    for failure in failures:
+        print("FAILED:", failure)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__.split('\n\n')[0])
+    parser.add_argument('--pretest-dir', default = 'output_pretest')
+    parser.add_argument('--test-dir', default = 'output_test')
+    parser.add_argument('--out-dir', default = 'output_final')
+    parser.add_argument('--jobs', type = int, default = os.cpu_count(),
+                        help = "number of worker processes "
+                               "(default: number of CPU cores)")
+    parser.add_argument('--cache', default = distance_cache.DEFAULT_PATH,
+                        help = "file the edit distances are remembered in "
+                               "(default: %(default)s)")
+    parser.add_argument('--no-cache', dest = 'cache', action = 'store_const',
+                        const = None, help = "do not read or write the file")
+    args = parser.parse_args(argv)
+
+    participants, unpaired = find_participants(args.pretest_dir, args.test_dir)
+    for code in unpaired:
+        print(f"Skipping {code}: no matching pretest/post-test file")
+    os.makedirs(args.out_dir, exist_ok = True)
+
+    start = time.perf_counter()
+    timings, failures = [], []
+    caches = {cache.name: cache for cache in distance_caches()}
+    lookups = {name: [0, 0] for name in caches}
+    init_worker(args.cache)
+    with ProcessPoolExecutor(max_workers = args.jobs,
+                             initializer = init_worker,
+                             initargs = (args.cache,)) as pool:
+        futures = {pool.submit(score_and_report, participant, args.out_dir):
+                   participant for participant in participants}
+        for future in as_completed(futures):
+            participant = futures[future]
+            try:
+                scored = future.result()
+            except Exception as e:
+                failures.append(f"{participant.code}: {e!r}")
+                continue
+            timings.append(scored.timing)
+            for name, entries in scored.new_distances.items():
+                caches[name].update(entries)
+            for name, (hits, misses) in scored.lookups.items():
+                lookups[name][0] += hits
+                lookups[name][1] += misses
+    if args.cache:
+        distance_cache.save(args.cache, caches.values())
+    print_summary(timings, failures, time.perf_counter() - start, lookups)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+""" Compare two benchmark results files written by hot_paths.py.
+
+Prints, for every benchmark and cohort size found in both files, the old
+and new times and their ratio, and marks the ones that got slower by
+more than the threshold. Exits with status 1 if any did.
+
+Usage (from the python/ directory):
+
+    python benchmarks/compare.py OLD.json NEW.json [--threshold 1.25]
+
+Timings of the small cohorts are noisy; the 100,000 participant cohort
+is the one to trust.
+"""
+
+import argparse
+import json
+import sys
+
+DEFAULT_THRESHOLD = 1.25
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+def compare(old: dict, new: dict, threshold: float = DEFAULT_THRESHOLD) -> int:
+    """ Print the comparison and return the number of regressions """
+    print(f"{'Benchmark':<24}{'size':>8}{old['commit']:>14}{new['commit']:>14}"
+          f"{'ratio':>8}")
+    regressions = 0
+    for name, sizes in sorted(new['results'].items()):
+        for size, result in sorted(sizes.items(), key = lambda item: int(item[0])):
+            before = old['results'].get(name, {}).get(size)
+            if before is None:
+                continue
+            ratio = result['seconds'] / before['seconds']
+            flag = ''
+            if ratio > threshold:
+                flag = '  slower'
+                regressions += 1
+            elif ratio < 1 / threshold:
+                flag = '  faster'
+            print(f"{name:<24}{size:>8}{before['seconds']:>13.4f}s"
+                  f"{result['seconds']:>13.4f}s{ratio:>8.2f}{flag}")
+    return regressions
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__.split('\n\n')[0])
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type = float, default = DEFAULT_THRESHOLD,
+                        help = "new/old time ratio that counts as a "
+                               "regression (default: %(default)s)")
+    args = parser.parse_args(argv)
+    regressions = compare(load(args.old), load(args.new), args.threshold)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+
+""" Benchmarks of the scoring, scheduling and reporting hot paths.
+
+Every benchmark runs over a synthetic cohort of participants, built with
+a fixed seed so that every run (and every commit) sees the same data.
+By default the cohorts have 10, 1,000 and 100,000 participants. A
+participant has done the pretest on every word of word_list.csv, had 12
+of their misses trained and done both post-tests; see `make_participant`.
+
+    edit_distance.minimum   minimumEditDistance on the pre- and post-test
+                            spellings, one pair at a time
+    edit_distance.batch     batchEditDistance on the same pairs
+    edit_distance.cached    the same pairs through a DistanceCache that
+                            starts empty on every chunk
+    schedule                training_trials and a full no_repeat_stream
+    assign_nouns            assign_nouns (and so splitList)
+    use_pretest_nouns       matching the 12 picked words to the nouns
+    foil_choices            FoilIndex.choices for the 12 trained words
+    phono_scoring           transcribing and scoring the pre- and post-test
+                            spellings with a fresh phonology.Scorer per
+                            chunk
+    final_report            the final.py join, written to memory
+
+Cohorts are generated, and the benchmarks run, in chunks of CHUNK
+participants so that memory stays bounded; only the benchmarked calls
+are timed. Every benchmark is run `--repeat` times on each chunk and the
+fastest run is kept. (TrainingController.no_reps no longer exists; the
+schedule benchmark covers what replaced it.)
+
+Results are printed and saved as JSON in benchmarks/results/, named
+after the current git commit, so that two commits can be compared with
+benchmarks/compare.py.
+
+Usage (from the python/ directory):
+
+    python benchmarks/hot_paths.py [--sizes 10 1000 100000] [--repeat N]
+                                   [--only NAME ...] [--output FILE]
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import final
+import foils
+import lexicon
+import phono_ortho_spelling as phono
+import phonology
+import schedule
+from distance_cache import DistanceCache
+from levenshtein_distance.levenshtein_distance import (batchEditDistance,
+                                                       minimumEditDistance)
+from simulate import SyntheticParticipant
+from workbook import PretestRow
+
+SEED = 20190601
+SIZES = (10, 1000, 100000)
+CHUNK = 1000
+N_TRAINED = 12
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'results')
+
+
+#==============================================================================
+# Synthetic cohorts
+#==============================================================================
+
+class CohortParticipant(NamedTuple):
+    pretest: List[PretestRow]
+    trained: List[PretestRow]
+    production: List[str]
+    forced: List[str]
+
+
+class TrainingNoun(NamedTuple):
+    """ What schedule.training_trials needs to know about a noun """
+    name: str
+    variability: str
+    audios: List[str]
+    pretest_correct: bool
+
+
+class Lexicon:
+    """ Everything the benchmarks share: the nouns, their stimuli, the
+    foils and the phonology lexicon """
+
+    def __init__(self):
+        self.short_nouns, self.long_nouns = phono.make_nouns()
+        self.nouns = self.short_nouns + self.long_nouns
+        self.nouns_by_name = {noun.name: noun for noun in self.nouns}
+        self.foil_index = foils.FoilIndex.from_csv()
+        self.phonology = lexicon.transcriptions()
+        self.g2p = phonology.scorer().g2p
+
+
+def make_participant(lexicon: Lexicon, rng: random.Random) -> CohortParticipant:
+    speller = SyntheticParticipant(rng)
+    pretest = []
+    for noun in lexicon.nouns:
+        spelling = speller.spell(noun.name)
+        pretest.append(PretestRow(noun.name, spelling,
+                                  int(spelling == noun.name.lower()),
+                                  rng.choice(('high', 'low'))))
+    misses = [row for row in pretest if not row.correct]
+    trained = rng.sample(misses, min(N_TRAINED, len(misses)))
+    production = [speller.spell(row.word, trained = True) for row in trained]
+    forced = [speller.choose(row.word, [row.word.lower(), row.answer])
+              for row in trained]
+    return CohortParticipant(pretest, trained, production, forced)
+
+def cohort(lexicon: Lexicon, n_participants: int,
+           seed: int = SEED) -> Iterator[List[CohortParticipant]]:
+    """ The cohort, in chunks of at most CHUNK participants. The first
+    participants are the same whatever the size of the cohort. """
+    rng = random.Random(seed)
+    for start in range(0, n_participants, CHUNK):
+        size = min(CHUNK, n_participants - start)
+        yield [make_participant(lexicon, rng) for i in range(size)]
+
+
+#==============================================================================
+# The benchmarks
+#
+# Each benchmark has a setup function, which is not timed, that turns a
+# chunk of participants into the arguments of the timed function.
+#==============================================================================
+
+class Benchmark(NamedTuple):
+    name: str
+    setup: Callable
+    run: Callable
+    # Larger cohorts are skipped (the function is too slow for them)
+    max_participants: Optional[int] = None
+
+
+def _pairs(lexicon, chunk):
+    targets, productions = [], []
+    for participant in chunk:
+        for row in participant.pretest:
+            targets.append(row.word.lower())
+            productions.append(row.answer.lower())
+        for row, spelling in zip(participant.trained, participant.production):
+            targets.append(row.word.lower())
+            productions.append(spelling.lower())
+    return targets, productions
+
+def _minimum_edit_distance(targets, productions):
+    return [minimumEditDistance(target, production)
+            for target, production in zip(targets, productions)]
+
+def _cached_edit_distance(targets, productions):
+    DistanceCache('ortho', batchEditDistance).distances(targets, productions)
+
+def _training_nouns(lexicon, chunk):
+    schedules = []
+    for participant in chunk:
+        schedules.append([TrainingNoun(row.word, row.condition,
+                                       lexicon.nouns_by_name[row.word].audios,
+                                       False)
+                          for row in participant.trained])
+    return schedules, random.Random(SEED)
+
+def _schedule(schedules, rng):
+    for nouns in schedules:
+        trials = schedule.training_trials(nouns, rng)
+        for trial in schedule.no_repeat_stream(trials, rng):
+            pass
+
+def _assign_nouns_setup(lexicon, chunk):
+    random.seed(SEED)
+    return lexicon, len(chunk)
+
+def _assign_nouns(lexicon, n):
+    for i in range(n):
+        phono.assign_nouns(list(lexicon.short_nouns), list(lexicon.long_nouns))
+
+def _use_pretest_nouns_setup(lexicon, chunk):
+    picked = [[{'Word': row.word, 'Participant Answer': row.answer,
+                'T/F': row.correct, 'Condition': row.condition}
+               for row in participant.trained] for participant in chunk]
+    return lexicon.nouns, picked
+
+def _use_pretest_nouns(nouns, picked):
+    for dicts in picked:
+        phono.dicts = dicts
+        phono.use_pretest_nouns(nouns)
+
+def _foil_choices_setup(lexicon, chunk):
+    return lexicon.foil_index, chunk, random.Random(SEED)
+
+def _foil_choices(foil_index, chunk, rng):
+    for participant in chunk:
+        for row, spelling in zip(participant.trained, participant.production):
+            foil_index.choices(row.word, spelling, rng = rng)
+
+def _phono_scoring_setup(lexicon, chunk):
+    targets, productions = _pairs(lexicon, chunk)
+    phono_targets = [lexicon.phonology.get(target, '') for target in targets]
+    return lexicon.g2p, phono_targets, productions
+
+def _phono_scoring(g2p, targets, productions):
+    phonology.Scorer(g2p).score(targets, productions)
+
+def _final_report_setup(lexicon, chunk):
+    reports = []
+    for participant in chunk:
+        pretest = list(final.answer_rows(participant.pretest))
+        test = [[row.condition, row.word, spelling,
+                 str(spelling == row.word.lower()), forced,
+                 str(forced == row.word.lower())]
+                for row, spelling, forced in zip(participant.trained,
+                                                 participant.production,
+                                                 participant.forced)]
+        reports.append((pretest, test))
+    return reports, lexicon.phonology
+
+def _final_report(reports, phonology):
+    for pretest, test in reports:
+        final.write_report(pretest, test, phonology, io.StringIO())
+
+
+BENCHMARKS = [
+    Benchmark('edit_distance.minimum', _pairs, _minimum_edit_distance,
+              max_participants = 1000),
+    Benchmark('edit_distance.batch', _pairs, batchEditDistance),
+    Benchmark('edit_distance.cached', _pairs, _cached_edit_distance),
+    Benchmark('schedule', _training_nouns, _schedule),
+    Benchmark('assign_nouns', _assign_nouns_setup, _assign_nouns),
+    Benchmark('use_pretest_nouns', _use_pretest_nouns_setup,
+              _use_pretest_nouns),
+    Benchmark('foil_choices', _foil_choices_setup, _foil_choices),
+    Benchmark('phono_scoring', _phono_scoring_setup, _phono_scoring),
+    Benchmark('final_report', _final_report_setup, _final_report),
+]
+
+
+#==============================================================================
+# Running and saving
+#==============================================================================
+
+def time_run(benchmark: Benchmark, args: tuple, repeat: int) -> float:
+    """ Seconds of the fastest of `repeat` calls """
+    best = float('inf')
+    for i in range(repeat):
+        start = time.perf_counter()
+        benchmark.run(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def time_cohort(benchmarks: List[Benchmark], lexicon: Lexicon,
+                n_participants: int, repeat: int) -> Dict[str, float]:
+    """ benchmark name -> seconds spent in its run function over the whole
+    cohort. Each chunk of the cohort is generated once and used by all
+    the benchmarks. """
+    seconds = {benchmark.name: 0.0 for benchmark in benchmarks}
+    for chunk in cohort(lexicon, n_participants):
+        for benchmark in benchmarks:
+            args = benchmark.setup(lexicon, chunk)
+            seconds[benchmark.name] += time_run(benchmark, args, repeat)
+    return seconds
+
+def run_benchmarks(benchmarks: List[Benchmark], sizes: List[int],
+                   repeat: int) -> Dict[str, Dict[str, Dict]]:
+    lexicon = Lexicon()
+    results = {benchmark.name: {} for benchmark in benchmarks}
+    for size in sizes:
+        included = [benchmark for benchmark in benchmarks
+                    if not benchmark.max_participants or
+                    size <= benchmark.max_participants]
+        seconds = time_cohort(included, lexicon, size, repeat)
+        for benchmark in benchmarks:
+            if benchmark.name not in seconds:
+                print(f"{benchmark.name:<24}{size:>8}      skipped")
+                continue
+            elapsed = seconds[benchmark.name]
+            results[benchmark.name][str(size)] = {
+                    'seconds': elapsed,
+                    'us_per_participant': elapsed / size * 1e6}
+            print(f"{benchmark.name:<24}{size:>8}{elapsed:>12.4f} s"
+                  f"{elapsed / size * 1e6:>12.1f} us/participant", flush = True)
+    return results
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                capture_output = True, text = True,
+                                check = True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain',
+                                '--untracked-files=no'],
+                               capture_output = True, text = True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if dirty.strip() else '')
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type = int, nargs = '+',
+                        default = list(SIZES))
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--only', nargs = '+', metavar = 'NAME',
+                        help = "run only these benchmarks")
+    parser.add_argument('--output', help = "JSON file to write "
+                        "(default: benchmarks/results/<commit>.json)")
+    args = parser.parse_args(argv)
+
+    benchmarks = [benchmark for benchmark in BENCHMARKS
+                  if not args.only or benchmark.name in args.only]
+    commit = git_commit()
+    results = run_benchmarks(benchmarks, args.sizes, args.repeat)
+
+    output = args.output or os.path.join(RESULTS_DIR, commit + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok = True)
+    with open(output, 'w') as f:
+        json.dump({'commit': commit,
+                   'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'python': platform.python_version(),
+                   'machine': platform.machine(),
+                   'seed': SEED,
+                   'repeat': args.repeat,
+                   'results': results}, f, indent = 2, sort_keys = True)
+    print(f"Wrote {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+""" Check how long the experiment takes to show its login window.
+
+Starts each entry point in a fresh Python process, waits until the login
+window has been drawn and reports the time from launching the process.
+Exits with an error if the slowest run is over the budget.
+
+Usage (from the python/ directory, with a display available):
+
+    python benchmarks/startup.py [--budget SECONDS] [--repeat N]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ENTRY_POINTS = ['phono_ortho_spelling', 'pretest']
+
+DEFAULT_BUDGET = 1.0
+
+# Run in the child process: build the main window, draw it, report the
+# time spent in Python and exit
+CHILD = """
+import time
+start = time.perf_counter()
+import {module}
+app = {module}.MainApplication()
+app.update()
+print(time.perf_counter() - start, flush = True)
+app.destroy()
+"""
+
+
+def time_startup(module: str) -> tuple:
+    """ (seconds from launch to login window, seconds spent in our code) """
+    start = time.perf_counter()
+    child = subprocess.Popen([sys.executable, '-c', CHILD.format(module = module)],
+                             stdout = subprocess.PIPE, universal_newlines = True)
+    line = child.stdout.readline()
+    elapsed = time.perf_counter() - start
+    child.wait()
+    if child.returncode != 0 or not line:
+        raise RuntimeError(f"{module} failed to start")
+    return elapsed, float(line)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__.split('\n\n')[0])
+    parser.add_argument('--budget', type = float, default = DEFAULT_BUDGET,
+                        help = "maximum seconds until the login window "
+                               f"is drawn (default: {DEFAULT_BUDGET})")
+    parser.add_argument('--repeat', type = int, default = 5)
+    args = parser.parse_args(argv)
+
+    os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    worst = 0.0
+    for module in ENTRY_POINTS:
+        runs = [time_startup(module) for _ in range(args.repeat)]
+        total = max(run[0] for run in runs)
+        inside = max(run[1] for run in runs)
+        worst = max(worst, total)
+        print(f"{module:<24} login window after {total*1000:7.1f} ms "
+              f"({inside*1000:7.1f} ms after interpreter start)")
+
+    if worst > args.budget:
+        print(f"FAILED: {worst:.3f} s is over the budget of {args.budget:.3f} s")
+        return 1
+    print(f"OK: all entry points start within {args.budget:.3f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
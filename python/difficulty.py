@@ -0,0 +1,285 @@
+""" Word difficulty and foil attractiveness, fitted from the results store.
+
+Two tables are fitted from the rows of the results store (results.py):
+
+    difficulty       for every word, how often it is missed in the pretest,
+                     as a smoothed miss rate and as its log-odds
+    attractiveness   for every word and every wrong spelling chosen for it
+                     in the perception post-test, how often that spelling
+                     was chosen per trial of the word
+
+Both are plain counts, so the fit keeps the counts themselves and adding
+sessions only adds to them. `DifficultyTables.update` reads the chunks of
+the store it has not seen yet (in one vectorized pass over their columns)
+and remembers the names of the appended chunks it has counted. A chunk
+written by compacting the store records the chunks it merged
+(results.ResultsStore.sources), so it is not counted twice. If rows that
+were counted are no longer in the store, or were merged with rows that
+were not, the tables are fitted again from the whole store.
+
+The tables are saved next to the store, in output_results/difficulty.npz,
+as a few small arrays. They are updated offline, with the command below,
+never during a session; the programs only read them:
+
+    - the adaptive pretest (pretest.py --adaptive) tests the most often
+      missed words first, and
+    - the perception post-test draws the more attractive foils more often
+      (foils.FoilIndex.sample).
+
+A word or foil nobody has seen yet gets the prior (a miss rate of 0.5, an
+attractiveness of one in N_CHOICES), so with no tables at all both behave
+as they did without them. The store does not record which spellings were
+on screen, only the one that was chosen, so attractiveness is counted per
+trial of the word rather than per showing of the foil.
+
+To update the tables with the sessions added since the last run, or to
+fit them again from scratch (from the python/ directory):
+
+    python difficulty.py [--dir output_results] [--refit]
+"""
+
+import argparse
+import math
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+import foils
+import results
+
+TABLES = 'difficulty.npz'
+# Change this whenever the arrays saved change
+TABLES_VERSION = 2
+
+
+def normalize(word: str) -> str:
+    return word.strip().lower()
+
+
+class DifficultyTables:
+    def __init__(self):
+        self.words: List[str] = []
+        self.index: Dict[str, int] = {}
+        # Per word: pretest responses, pretest misses, perception trials
+        self.n = np.zeros(0, np.int64)
+        self.misses = np.zeros(0, np.int64)
+        self.shown = np.zeros(0, np.int64)
+        # (word, chosen spelling) -> times chosen, for wrong choices only
+        self.chosen: Dict[Tuple[str, str], int] = {}
+        # The appended chunks whose rows are counted (see
+        # results.ResultsStore.sources)
+        self.sources: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    #--------------------------------------------------------------------------
+    # Fitting
+    #--------------------------------------------------------------------------
+
+    def _word_indices(self, categories: np.ndarray) -> np.ndarray:
+        """ The index of every word of `categories` in the tables, adding
+        the words that are not there yet """
+        indices = []
+        for word in categories:
+            word = normalize(str(word))
+            if word not in self.index:
+                self.index[word] = len(self.words)
+                self.words.append(word)
+            indices.append(self.index[word])
+        grow = len(self.words) - len(self.n)
+        if grow:
+            self.n, self.misses, self.shown = (
+                    np.concatenate([counts, np.zeros(grow, np.int64)])
+                    for counts in (self.n, self.misses, self.shown))
+        return np.asarray(indices, np.int64)
+
+    def add(self, columns: Dict):
+        """ Count the rows of `columns` (as from results.ResultsStore) """
+        if not len(columns['correct']):
+            return
+        words = self._word_indices(columns['word'].categories)[
+                    columns['word'].codes]
+        phases = columns['phase'].categories[columns['phase'].codes]
+        correct = columns['correct'].astype(bool)
+        size = len(self.words)
+
+        pretest = phases == 'pretest'
+        self.n += np.bincount(words[pretest], minlength = size)
+        self.misses += np.bincount(words[pretest & ~correct],
+                                   minlength = size)
+
+        perception = phases == 'post_test_perception'
+        self.shown += np.bincount(words[perception], minlength = size)
+        wrong = perception & ~correct
+        productions = columns['production']
+        pairs, counts = np.unique(
+                np.stack([words[wrong], productions.codes[wrong]]),
+                axis = 1, return_counts = True)
+        for (word, production), count in zip(pairs.T, counts):
+            key = (self.words[word],
+                   normalize(str(productions.categories[production])))
+            self.chosen[key] = self.chosen.get(key, 0) + int(count)
+
+    def update(self, store: results.ResultsStore) -> int:
+        """ Count the chunks of the store that have not been counted yet.
+        Returns the number of rows added. """
+        paths = {os.path.basename(path): path for path in store.chunks()}
+        sources = {name: ({name} if name in self.sources
+                          else set(store.sources(path)))
+                   for name, path in paths.items()}
+        new = [name for name in paths if not sources[name] <= self.sources]
+        in_store = set().union(*sources.values())
+        if (not self.sources <= in_store
+                or any(sources[name] & self.sources for name in new)):
+            # Rows that were counted were deleted, or merged with rows that
+            # were not: count everything again
+            self.__init__()
+            new = list(paths)
+        if not new:
+            return 0
+        columns = store.columns([paths[name] for name in new])
+        self.add(columns)
+        for name in new:
+            self.sources |= sources[name]
+        return len(columns['time'])
+
+    #--------------------------------------------------------------------------
+    # Queries
+    #--------------------------------------------------------------------------
+
+    def miss_rates(self) -> Dict[str, float]:
+        """ normalized word -> pretest miss rate, for the words that were
+        in a pretest; the same as results.miss_rates over the rows counted """
+        rates = results.smoothed_miss_rate(self.n, self.misses)
+        return {word: float(rate) for word, rate, n
+                in zip(self.words, rates, self.n) if n}
+
+    def difficulty(self) -> Dict[str, float]:
+        """ normalized word -> log-odds of missing it in the pretest """
+        return {word: math.log(rate / (1 - rate))
+                for word, rate in self.miss_rates().items()}
+
+    def attractiveness(self, word: str, spellings: Iterable[str],
+                       n_choices: int = foils.N_CHOICES) -> Dict[str, float]:
+        """ spelling -> how often it was chosen per perception trial of
+        word, smoothed towards one in n_choices """
+        word = normalize(word)
+        i = self.index.get(word)
+        shown = int(self.shown[i]) if i is not None else 0
+        return {spelling: (self.chosen.get((word, normalize(spelling)), 0)
+                           + 1) / (shown + n_choices)
+                for spelling in spellings}
+
+    #--------------------------------------------------------------------------
+    # Saving to disk
+    #--------------------------------------------------------------------------
+
+    def save(self, path: str):
+        """ Write the tables, replacing the file in one step """
+        pairs = list(self.chosen.items())
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok = True)
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as f:
+            np.savez_compressed(
+                    f, version = np.int32(TABLES_VERSION),
+                    words = np.asarray(self.words, dtype = str),
+                    n = self.n.astype(np.int32),
+                    misses = self.misses.astype(np.int32),
+                    shown = self.shown.astype(np.int32),
+                    foil_words = np.asarray([self.index[word] for
+                                             (word, _), _ in pairs], np.int32),
+                    foils = np.asarray([foil for (_, foil), _ in pairs],
+                                       dtype = str),
+                    chosen = np.asarray([count for _, count in pairs],
+                                        np.int32),
+                    sources = np.asarray(sorted(self.sources), dtype = str))
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'DifficultyTables':
+        """ The tables saved in `path`; empty tables if there is no such
+        file or it was written by another version """
+        tables = cls()
+        try:
+            with np.load(path) as arrays:
+                if int(arrays['version']) != TABLES_VERSION:
+                    return tables
+                tables.words = [str(word) for word in arrays['words']]
+                tables.n = arrays['n'].astype(np.int64)
+                tables.misses = arrays['misses'].astype(np.int64)
+                tables.shown = arrays['shown'].astype(np.int64)
+                tables.chosen = {
+                        (tables.words[word], str(foil)): int(count)
+                        for word, foil, count in zip(arrays['foil_words'],
+                                                     arrays['foils'],
+                                                     arrays['chosen'])}
+                tables.sources = {str(name) for name in arrays['sources']}
+        except (OSError, ValueError, KeyError):
+            return cls()
+        tables.index = {word: i for i, word in enumerate(tables.words)}
+        return tables
+
+
+def tables_path(store: results.ResultsStore) -> str:
+    return os.path.join(store.directory, TABLES)
+
+def update(store: Optional[results.ResultsStore] = None,
+           refit: bool = False) -> DifficultyTables:
+    """ Bring the saved tables of the store up to date and save them """
+    store = store or results.results_store
+    path = tables_path(store)
+    fitted = DifficultyTables() if refit else DifficultyTables.load(path)
+    if fitted.update(store) or refit:
+        fitted.save(path)
+    return fitted
+
+
+_tables = None
+_tables_lock = threading.Lock()
+
+def tables() -> DifficultyTables:
+    """ The saved tables of the results store, loaded the first time they
+    are asked for """
+    global _tables
+    with _tables_lock:
+        if _tables is None:
+            _tables = DifficultyTables.load(tables_path(results.results_store))
+        return _tables
+
+def use_tables(fitted: DifficultyTables):
+    """ Use these tables instead of the saved ones (e.g. in simulate.py) """
+    global _tables
+    with _tables_lock:
+        _tables = fitted
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__.split('\n\n')[0])
+    parser.add_argument('--dir', default = results.RESULTS_DIR)
+    parser.add_argument('--refit', action = 'store_true',
+                        help = "fit the tables again from the whole store")
+    args = parser.parse_args(argv)
+    store = results.ResultsStore(args.dir)
+    path = tables_path(store)
+    fitted = DifficultyTables() if args.refit else DifficultyTables.load(path)
+    added = fitted.update(store)
+    fitted.save(path)
+    print(f"{added} rows added, {len(fitted)} words, {len(fitted.chosen)} "
+          f"foils in {path}")
+    print(f"\n{'Word':<20}{'pretests':>10}{'miss rate':>11}{'difficulty':>12}"
+          f"  most chosen foil")
+    rates, difficulty = fitted.miss_rates(), fitted.difficulty()
+    for word in sorted(rates, key = rates.get, reverse = True):
+        chosen = [(count, foil) for (target, foil), count
+                  in fitted.chosen.items() if target == word]
+        foil = f"{max(chosen)[1]} ({max(chosen)[0]})" if chosen else ''
+        print(f"{word:<20}{fitted.n[fitted.index[word]]:>10}"
+              f"{rates[word]:>11.2f}{difficulty[word]:>12.2f}  {foil}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+""" Memoized edit distances.
+
+The same misspellings come up again and again across participants
+("vacule" for vacuole, ...), so every distance that is computed is kept
+in a `DistanceCache`, keyed by (target, production). A cache holds at
+most `maxsize` pairs and forgets the least recently used ones first. It
+counts its hits and misses, and is safe to share between the threads of
+a process.
+
+Processes do not share memory, so between processes (e.g. the workers
+of batch_score.py) the caches are shared through a file: every process
+loads the file when it starts, sends back the pairs it computed, and the
+parent process merges them and saves the file once the run is over. The
+next run then only computes the pairs it has never seen.
+
+    cache = DistanceCache('ortho', batchEditDistance)
+    distance_cache.load('distance_cache.json', [cache])
+    cache.distances(['vacuole'], ['vacule'])
+    distance_cache.save('distance_cache.json', [cache])
+
+The file is JSON: for every cache, its version and its pairs. A cache
+whose version changed (because the way its distance is computed
+changed) ignores the pairs saved under the old version.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterable, List, NamedTuple, Sequence, Tuple
+
+DEFAULT_PATH = 'distance_cache.json'
+MAXSIZE = 200000
+FILE_VERSION = 1
+
+Entry = Tuple[str, str, float]
+
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    size: int
+
+    @property
+    def hit_rate(self) -> float:
+        looked_up = self.hits + self.misses
+        return self.hits / looked_up if looked_up else 0.0
+
+
+class DistanceCache:
+    def __init__(self, name: str,
+                 batch: Callable[[List[str], List[str]], List[float]],
+                 maxsize: int = MAXSIZE, version: str = '1'):
+        """ batch(targets, productions) computes the distances that are not
+        in the cache """
+        self.name = name
+        self.batch = batch
+        self.maxsize = maxsize
+        self.version = version
+        self._pairs: 'OrderedDict[Tuple[str, str], float]' = OrderedDict()
+        # Pairs computed since the last call to take_new()
+        self._new: List[Entry] = []
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._pairs)
+
+    def _store(self, key: Tuple[str, str], distance: float):
+        self._pairs[key] = distance
+        self._pairs.move_to_end(key)
+        while len(self._pairs) > self.maxsize:
+            self._pairs.popitem(last = False)
+            self.evictions += 1
+
+    def distances(self, targets: Sequence[str],
+                  productions: Sequence[str]) -> List[float]:
+        """ The distance of every production to its target. The pairs that
+        are not in the cache are computed in one call to `batch`. """
+        results = []
+        missing = {}
+        with self._lock:
+            for key in zip(targets, productions):
+                distance = self._pairs.get(key)
+                if distance is None:
+                    self.misses += 1
+                    missing.setdefault(key, []).append(len(results))
+                else:
+                    self.hits += 1
+                    self._pairs.move_to_end(key)
+                results.append(distance)
+        if not missing:
+            return results
+        keys = list(missing)
+        computed = self.batch([key[0] for key in keys],
+                              [key[1] for key in keys])
+        with self._lock:
+            for key, distance in zip(keys, computed):
+                self._store(key, distance)
+                self._new.append((key[0], key[1], distance))
+                for i in missing[key]:
+                    results[i] = distance
+        return results
+
+    def distance(self, target: str, production: str) -> float:
+        return self.distances([target], [production])[0]
+
+    def update(self, entries: Iterable[Entry]):
+        """ Add pairs computed elsewhere (e.g. by another process) """
+        with self._lock:
+            for target, production, distance in entries:
+                self._store((target, production), distance)
+
+    def entries(self) -> List[Entry]:
+        """ Every pair in the cache, least recently used first """
+        with self._lock:
+            return [(target, production, distance) for
+                    (target, production), distance in self._pairs.items()]
+
+    def take_new(self) -> List[Entry]:
+        """ The pairs computed since the last call """
+        with self._lock:
+            new, self._new = self._new, []
+            return new
+
+    def stats(self) -> CacheStats:
+        return CacheStats(self.hits, self.misses, self.evictions,
+                          len(self._pairs))
+
+
+#==============================================================================
+# Saving to disk
+#==============================================================================
+
+def load(path: str, caches: Iterable[DistanceCache]) -> int:
+    """ Fill the caches with the pairs saved in `path`. Returns the number
+    of pairs loaded; a missing or unreadable file loads nothing. """
+    try:
+        with open(path, encoding = 'utf-8') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if saved.get('version') != FILE_VERSION:
+        return 0
+    n_pairs = 0
+    for cache in caches:
+        section = saved.get('caches', {}).get(cache.name)
+        if section is None or section.get('version') != cache.version:
+            continue
+        cache.update(section['entries'])
+        n_pairs += len(section['entries'])
+    return n_pairs
+
+def save(path: str, caches: Iterable[DistanceCache]):
+    """ Write the caches to `path`, replacing the file in one step so
+    that a crash never leaves half a file behind. The caches of other
+    names already in the file are kept. """
+    try:
+        with open(path, encoding = 'utf-8') as f:
+            saved = json.load(f)
+        if saved.get('version') != FILE_VERSION:
+            saved = {}
+    except (OSError, ValueError):
+        saved = {}
+    sections = saved.get('caches', {})
+    for cache in caches:
+        sections[cache.name] = {'version': cache.version,
+                                'entries': cache.entries()}
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok = True)
+    temporary = path + '.tmp'
+    with open(temporary, 'w', encoding = 'utf-8') as f:
+        json.dump({'version': FILE_VERSION, 'caches': sections}, f,
+                  separators = (',', ':'))
+    os.replace(temporary, path)
@@ -0,0 +1,223 @@
+""" Cohort exports for analysis.
+
+Every session appends its rows (see results.py) to one table per phase
+in output_cohort/,
+
+    output_cohort/pretest.tsv
+    output_cohort/post_test_production.tsv
+    output_cohort/post_test_perception.tsv
+
+so that the whole cohort is always at hand in files that any program can
+open. Appending a session only writes that session's rows; nothing that
+is already in the files is read or rewritten.
+
+For analysts who prefer Excel, `write_workbook` puts the cohort into one
+workbook with one sheet per phase. It uses openpyxl's write-only mode,
+in which each row is written out as soon as it is appended, so memory
+use stays the same whatever the size of the cohort. The rows are read
+from the tables (or from the results store) one at a time.
+
+    python export.py xlsx [--output output_cohort/cohort.xlsx] [--from-store]
+    python export.py csv|tsv [--from-store]
+
+The second form writes the tables again, as comma- or tab-separated
+files, e.g. from the results store after importing old final reports.
+
+The per-participant pretest workbook (output_pretest/pretest_<code>.xlsx),
+which the training program loads, is written the same way, by
+`write_pretest_workbook`.
+"""
+
+import argparse
+import csv
+import os
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+import results
+
+EXPORT_DIR = 'output_cohort'
+WORKBOOK = 'cohort.xlsx'
+
+SHEETS = {'pretest': 'Pretest',
+          'post_test_production': 'Post-test production',
+          'post_test_perception': 'Post-test perception'}
+
+HEADER = ['Participant', 'Word', 'Condition', 'Length', 'Production',
+          'Correct', 'LD', 'Phono LD']
+
+DIALECTS = {'.csv': 'excel', '.tsv': 'excel-tab'}
+
+PRETEST_HEADER = ['', 'ORTHO TARGET', 'PRODUCTION', 'T/F', 'Condition']
+
+
+def _number(value: float):
+    """ A distance as written out: '' if there is none, 2 rather than 2.0 """
+    if value != value:
+        return ''
+    return int(value) if value == int(value) else float(value)
+
+def _parse(value: str):
+    """ A number read back from a table """
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+def table_row(result: results.Result) -> List:
+    return [result.participant, result.word, result.condition, result.length,
+            result.production, result.correct, _number(result.ld),
+            _number(result.phono_ld)]
+
+
+#==============================================================================
+# One table per phase
+#==============================================================================
+
+class CohortTables:
+    """ Appends rows to one CSV or TSV file per phase """
+
+    def __init__(self, directory: str = EXPORT_DIR, extension: str = '.tsv'):
+        self.directory = directory
+        self.extension = extension
+
+    def path(self, phase: str) -> str:
+        return os.path.join(self.directory, phase + self.extension)
+
+    def append(self, rows: Iterable[results.Result]):
+        """ Add the rows to the tables of their phases, writing the header
+        of a table that does not exist yet """
+        by_phase: Dict[str, List[List]] = {}
+        for row in rows:
+            by_phase.setdefault(row.phase, []).append(table_row(row))
+        if not by_phase:
+            return
+        os.makedirs(self.directory, exist_ok = True)
+        for phase, table in by_phase.items():
+            with open(self.path(phase), 'a', newline = '',
+                      encoding = 'utf-8') as f:
+                writer = csv.writer(f, DIALECTS[self.extension],
+                                    lineterminator = '\n')
+                if not f.tell():
+                    writer.writerow(HEADER)
+                writer.writerows(table)
+
+    def rows(self, phase: str) -> Iterator[List[str]]:
+        """ The rows of a phase's table (without the header), one at a
+        time """
+        try:
+            f = open(self.path(phase), newline = '', encoding = 'utf-8')
+        except FileNotFoundError:
+            return
+        with f:
+            reader = csv.reader(f, DIALECTS[self.extension])
+            next(reader, None)
+            for row in reader:
+                yield row[:5] + [_parse(value) for value in row[5:]]
+
+    def rewrite(self, rows_by_phase: Dict[str, Iterable[List]]):
+        """ Replace the tables """
+        os.makedirs(self.directory, exist_ok = True)
+        for phase, rows in rows_by_phase.items():
+            with open(self.path(phase), 'w', newline = '',
+                      encoding = 'utf-8') as f:
+                writer = csv.writer(f, DIALECTS[self.extension],
+                                    lineterminator = '\n')
+                writer.writerow(HEADER)
+                writer.writerows(rows)
+
+
+cohort_tables = CohortTables()
+
+
+def store_rows(store: results.ResultsStore) -> Dict[str, Iterator[List]]:
+    """ phase -> the rows of the results store for that phase """
+    columns = store.columns()
+    phases = columns['phase']
+
+    def rows(phase: str) -> Iterator[List]:
+        matches = (phases.categories == phase).nonzero()[0]
+        if not len(matches):
+            return
+        selected = (phases.codes == matches[0]).nonzero()[0]
+        values = {name: columns[name].categories[
+                            columns[name].codes[selected]]
+                  for name in ('participant', 'word', 'condition', 'length',
+                               'production')}
+        correct = columns['correct'][selected]
+        ld = columns['ld'][selected]
+        phono_ld = columns['phono_ld'][selected]
+        for i in range(len(selected)):
+            yield [str(values['participant'][i]), str(values['word'][i]),
+                   str(values['condition'][i]), str(values['length'][i]),
+                   str(values['production'][i]), int(correct[i]),
+                   _number(float(ld[i])), _number(float(phono_ld[i]))]
+
+    return {phase: rows(phase) for phase in SHEETS}
+
+
+#==============================================================================
+# Workbooks
+#==============================================================================
+
+def write_sheets(path: str, sheets: Iterable[Tuple[str, Sequence[str],
+                                                   Iterable[Sequence]]]):
+    """ Write a workbook in openpyxl's write-only mode. `sheets` is a list
+    of (title, header, rows). """
+    import openpyxl
+    wb = openpyxl.Workbook(write_only = True)
+    for title, header, rows in sheets:
+        ws = wb.create_sheet(title)
+        ws.append(list(header))
+        for row in rows:
+            ws.append(list(row))
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok = True)
+    wb.save(path)
+
+def write_workbook(path: str, rows_by_phase: Dict[str, Iterable[List]]):
+    """ The cohort workbook, one sheet per phase """
+    write_sheets(path, [(SHEETS[phase], HEADER, rows_by_phase[phase])
+                        for phase in SHEETS])
+
+def write_pretest_workbook(path: str, answers: Sequence[Dict]):
+    """ A participant's pretest answers (pretest.PretestModel.dicts), laid
+    out as workbook.read_pretest expects them """
+    write_sheets(path, [('Pretest', PRETEST_HEADER,
+                         ([i, answer['ORTHO TARGET'], answer['PRODUCTION'],
+                           answer['T/F'], answer['Condition']]
+                          for i, answer in enumerate(answers)))])
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__.split('\n\n')[0])
+    parser.add_argument('format', choices = ('xlsx', 'csv', 'tsv'))
+    parser.add_argument('--output', default = os.path.join(EXPORT_DIR,
+                                                           WORKBOOK),
+                        help = "workbook to write (default: %(default)s)")
+    parser.add_argument('--from-store', action = 'store_true',
+                        help = "read the rows from the results store "
+                               "instead of the cohort tables")
+    parser.add_argument('--dir', default = EXPORT_DIR)
+    args = parser.parse_args(argv)
+    if args.format == 'tsv' and not args.from_store:
+        parser.error("the tables are already TSV files; "
+                     "use --from-store to write them again")
+
+    if args.from_store:
+        rows_by_phase = store_rows(results.results_store)
+    else:
+        tables = CohortTables(args.dir)
+        rows_by_phase = {phase: tables.rows(phase) for phase in SHEETS}
+    if args.format == 'xlsx':
+        write_workbook(args.output, rows_by_phase)
+        print(f"Wrote {args.output}")
+    else:
+        CohortTables(args.dir, '.' + args.format).rewrite(rows_by_phase)
+        print(f"Wrote {args.dir}/*.{args.format}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,42 +1,128 @@
+""" Build a participant's final report from their pretest and post-test
+results.
+
+The report has one 'Post' row for every word in the post-test results,
+preceded by the 'Pre' row(s) for the same word from the pretest. Each
+input is parsed exactly once: the pretest rows and the phonology lexicon
+are indexed by lower-cased word in dictionaries, and the joined rows are
+written out as the post-test file is read, so the work grows linearly
+with the size of the inputs.
+
+It can be used as a library,
+
+    import final
+    final.build_report('output_pretest/pretest_1E.xlsx',
+                       'output_test/1E_test_results.csv',
+                       'output_final/1E_final.csv')
+
+or from the command line,
+
+    python final.py output_pretest/pretest_1E.xlsx output_test/1E_test_results.csv 1E
+"""
+
+import csv
 import sys
+from typing import Dict, Iterable, List, TextIO
+
+import lexicon
+import phonology
+import workbook
+
+PHONO_PATH = lexicon.PHONOLOGY
+
+HEADER = ["Phase", "Condition", "Ortho Target", "Ortho Production",
+          "Production Correct", "Phono Target", "Phono production",
+          "Forced Selection", "Forced Correct"]
+
 
-def get_phono(phono, word):
-   for line in phono:
-      line = line.strip().split(',')
-      if line[0].lower() == word.lower():
-         return line[1]
+def read_rows(path: str, sheet: str = None) -> Iterable[List[str]]:
+   """ Yield the rows of a CSV file or Excel sheet, skipping the header """
+   return workbook.read_rows(path, sheet)
+
+def answer_rows(answers: Iterable[workbook.PretestRow]) -> Iterable[List[str]]:
+   """ Pretest answers (e.g. from the participant database) laid out like
+   the rows of a pretest workbook """
+   for i, answer in enumerate(answers):
+      yield [str(i), answer.word, answer.answer, str(answer.correct),
+             answer.condition]
+
+def get_phono(phono: Dict[str, str], word: str) -> str:
+   return phono.get(word.lower(), "")
+
+def index_pretest(pretest: Iterable[List[str]]) -> Dict[str, List[List[str]]]:
+   """ lower-cased word -> the pretest rows for that word, in file order.
+   Pretest rows are [index, word, production, T/F, condition]. """
+   index = {}
+   for pre in pretest:
+      index.setdefault(pre[1].lower(), []).append(pre)
+   return index
+
+def pretest_correct(value: str) -> str:
+   try:
+      num = int(float(value))
+   except ValueError:
+      return "N/A"
+   if num == 1:
+      return "True"
+   elif num == 0:
+      return "False"
+   return "N/A"
+
+def phono_production(scorer: phonology.Scorer, production: str) -> str:
+   """ The transcription of what the participant typed, "" if nothing """
+   return scorer.transcribe(production) if production else ""
+
+def report_rows(pretest: Iterable[List[str]], test: Iterable[List[str]],
+                phono: Dict[str, str],
+                scorer: phonology.Scorer = None) -> Iterable[List[str]]:
+   """ Join the pretest and post-test rows, yielding the rows of the report
+   (without the header). Post-test rows are [condition, word, production,
+   correct, forced, forced correct]. The productions are transcribed by
+   `scorer` (by default the shared phonology.scorer()). """
+   if scorer is None:
+      scorer = phonology.scorer()
+   pre_index = index_pretest(pretest)
+   for post in test:
+      pTarget = get_phono(phono, post[1])
+      for pre in pre_index.get(post[1].lower(), ()):
+         yield ["Pre", "N/A", pre[1], pre[2],
+                pretest_correct(pre[3]), pTarget,
+                phono_production(scorer, pre[2]), "N/A", "N/A"]
+      yield ["Post", post[0], post[1], post[2], post[3],
+             pTarget, phono_production(scorer, post[2]), post[4], post[5]]
+
+def write_report(pretest: Iterable[List[str]], test: Iterable[List[str]],
+                 phono: Dict[str, str], out: TextIO) -> int:
+   """ Join the pretest and post-test rows and write the report to `out`.
+   Returns the number of rows written. """
+   writer = csv.writer(out, lineterminator="\n")
+   writer.writerow(HEADER)
+   n_rows = 0
+   for row in report_rows(pretest, test, phono):
+      writer.writerow(row)
+      n_rows += 1
+   return n_rows
+
+def build_report(pretest, test_path: str, final_path: str,
+                 phono_path: str = PHONO_PATH) -> int:
+   """ Read the pretest (the path of a workbook or CSV file, or a list of
+   PretestRow's) and post-test files and write the final report to
+   final_path. Returns the number of rows written. """
+   phono = lexicon.transcriptions(phono_path)
+   if isinstance(pretest, str):
+      pretest_rows = read_rows(pretest, 'Pretest')
+   else:
+      pretest_rows = answer_rows(pretest)
+   with open(final_path, "w", newline='') as final:
+      return write_report(pretest_rows,
+                          read_rows(test_path),
+                          phono, final)
 
 def main(one, two, three):
-   pretest = open(one).readlines() #open(sys.argv[1]).readlines()
-   test = open(two).readlines() #open(sys.argv[2]).readlines()
-   name = three #sys.argv[3]
-   phono = open("Stimuli/orthography_and_phonology.csv").readlines()
+   name = three
    print(name)
-   final = open("output_final/"+name+"_final.csv","w")
+   build_report(one, two, "output_final/"+name+"_final.csv")
 
-   PRE = "Pre,"
-   POST = "Post,"
 
-   to_write = "Phase,Condition,Ortho Target,Ortho Production,Production Correct,Phono Target,"+\
-           "Phono production,Forced Selection,Forced Correct\n"
-   final.write(to_write)
-   for post in test[1:]:
-      post = post.strip().split(",")
-      pTarget = get_phono(phono, post[1])
-      for pre in pretest[1:]:
-         pre = pre.strip().split(",")
-         to_write = ""
-         if post[1].lower() == pre[1].strip('"').lower():
-            to_write += PRE + "N/A,"+ pre[1] +","+ pre[2] +","  
-            num = (int(float(pre[3].strip('"'))))
-            if num == 1:
-               to_write += "True," 
-            elif num == 0:
-               to_write += "False," 
-            else:
-               to_write += "N/A," 
-            to_write += pTarget +",,N/A,N/A\n"
-            final.write(to_write)
-      to_write = POST + post[0] + "," + post[1] +","+ post[2] +","+ post[3] +\
-      ","+ pTarget +",,"+ post[4] + ","+post[5] + "\n"
-      final.write(to_write)
+if __name__ == '__main__':
+   main(sys.argv[1], sys.argv[2], sys.argv[3])
@@ -0,0 +1,96 @@
+""" Foil spellings for the perception post-test.
+
+In the perception post-test the participant sees six spellings of each
+word: the correct one, their own misspelling from the production
+post-test (if they got it wrong), and foils from
+Stimuli/plausible_spellings.csv to fill the rest.
+
+`FoilIndex` reads that file once and keeps, for every word, a tuple of
+its foils: lower-cased, with duplicates and the correct spelling itself
+removed. Drawing foils for a word is then a single `random.sample` over
+the foils that are left after taking out the participant's misspelling,
+so, unlike retrying until the misspelling is not drawn, it always
+finishes.
+
+Given weights (e.g. how attractive each foil has been to earlier
+participants, see difficulty.py), the draw favours the heavier foils:
+every candidate gets the key u ** (1 / weight), u uniform in (0, 1), and
+the n largest keys win, which draws without replacement with probability
+in proportion to the weights.
+"""
+
+import csv
+import random
+from typing import Dict, Iterable, List, Optional, Tuple
+
+PLAUSIBLE_SPELLINGS = 'Stimuli/plausible_spellings.csv'
+
+N_CHOICES = 6
+
+
+class FoilIndex:
+    """ word -> foil spellings, keyed and stored in lower case """
+
+    def __init__(self, foils: Dict[str, Iterable[str]]):
+        self._foils = {}
+        for word, spellings in foils.items():
+            word = word.strip().lower()
+            unique = dict.fromkeys(spelling.strip().lower()
+                                   for spelling in spellings)
+            unique.pop(word, None)
+            unique.pop('', None)
+            self._foils[word] = tuple(unique)
+
+    @classmethod
+    def from_csv(cls, path: str = PLAUSIBLE_SPELLINGS) -> 'FoilIndex':
+        """ Read a CSV file with one word per line, followed by its foils """
+        with open(path, newline = '', encoding = 'utf-8') as f:
+            return cls({row[0]: row[1:] for row in csv.reader(f) if row})
+
+    @classmethod
+    def from_stimuli(cls, stimuli: Iterable) -> 'FoilIndex':
+        """ Use the foils stored in the stimulus registry, which are already
+        lower-cased and deduplicated """
+        index = cls({})
+        index._foils = {stimulus.name.lower(): stimulus.foils
+                        for stimulus in stimuli}
+        return index
+
+    def __contains__(self, word: str) -> bool:
+        return word.lower() in self._foils
+
+    def foils(self, word: str) -> Tuple[str, ...]:
+        return self._foils[word.lower()]
+
+    def sample(self, word: str, n: int, exclude: Iterable[str] = (),
+               rng: random.Random = random,
+               weights: Optional[Dict[str, float]] = None) -> List[str]:
+        """ Draw n distinct foils for word, none of them in exclude. If
+        there are fewer than n foils to draw from, all of them are returned.
+        With weights (foil -> positive weight), heavier foils are drawn
+        more often. """
+        excluded = {spelling.lower() for spelling in exclude}
+        candidates = [foil for foil in self.foils(word)
+                      if foil not in excluded]
+        if weights is None:
+            return rng.sample(candidates, min(n, len(candidates)))
+        keys = {foil: rng.random() ** (1 / weights[foil])
+                for foil in candidates}
+        return sorted(candidates, key = keys.get, reverse = True)[:n]
+
+    def choices(self, word: str, misspelling: Optional[str] = None,
+                n_choices: int = N_CHOICES,
+                rng: random.Random = random,
+                weights: Optional[Dict[str, float]] = None) -> List[str]:
+        """ The shuffled, lower-case set of spellings to show for word: the
+        correct spelling, the participant's misspelling (if any) and as
+        many foils as needed to make n_choices (drawn by weight, if given) """
+        correct = word.lower()
+        spellings = [correct]
+        if misspelling and misspelling.lower() != correct:
+            spellings.append(misspelling.lower())
+        spellings += self.sample(word, n_choices - len(spellings),
+                                 exclude = spellings, rng = rng,
+                                 weights = weights)
+        rng.shuffle(spellings)
+        return spellings
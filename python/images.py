@@ -0,0 +1,106 @@
+""" Image helpers for the phono-ortho-spelling project.
+
+Every stimulus picture is decoded once and kept in a process-wide cache
+(`image_cache`) as a ready-to-use ImageTk.PhotoImage. Pictures larger than
+the requested display size are scaled down once, when they are decoded.
+All the views share the same PhotoImage for a given picture, so showing
+the same word again (as high-variability training does for every talker)
+costs nothing but a `configure(image = ...)`.
+
+The cache holds at most `max_bytes` of decoded pixels and evicts the
+least recently shown pictures when it is full. Tk stores photo images
+with 4 bytes per pixel, which is what we count.
+
+PhotoImage objects belong to the Tk interpreter, so `image_cache.get`
+must be called from the Tk thread after the main window was created.
+PIL is only imported when the first picture is decoded. Without a screen,
+`use_null_backend()` makes every picture an empty `NullPhoto` instead.
+"""
+
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from timing import timing
+
+
+# All our stimulus pictures are 500x400
+DISPLAY_SIZE = (500, 400)
+
+DEFAULT_BUDGET = 32 * 1024 * 1024
+
+
+class ImageCache:
+    """ LRU cache of decoded and scaled PhotoImage's, keyed by file path
+    and display size """
+
+    def __init__(self, max_bytes: int = DEFAULT_BUDGET):
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self._photos = OrderedDict()
+        self.decode = self._decode_with_pil
+
+    def __contains__(self, filepath: str) -> bool:
+        return any(key[0] == filepath for key in self._photos)
+
+    def get(self, filepath: str,
+            size: Optional[Tuple[int, int]] = DISPLAY_SIZE
+            ) -> 'ImageTk.PhotoImage':
+        """ Return the picture as a PhotoImage no larger than `size`.
+        Pass size = None to keep the original resolution. """
+        key = (filepath, size)
+        photo = self._photos.get(key)
+        if photo is not None:
+            self._photos.move_to_end(key)
+            return photo
+
+        with timing.span('image_decode', filepath):
+            photo = self.decode(filepath, size)
+
+        n_bytes = photo.width() * photo.height() * 4
+        if n_bytes <= self.max_bytes:
+            self._photos[key] = photo
+            self.n_bytes += n_bytes
+            while self.n_bytes > self.max_bytes:
+                _, evicted = self._photos.popitem(last = False)
+                self.n_bytes -= evicted.width() * evicted.height() * 4
+        return photo
+
+    @staticmethod
+    def _decode_with_pil(filepath: str, size: Optional[Tuple[int, int]]
+                         ) -> 'ImageTk.PhotoImage':
+        from PIL import Image, ImageTk
+        image = Image.open(filepath)
+        if size is not None and (image.width > size[0] or
+                                 image.height > size[1]):
+            image.thumbnail(size, Image.LANCZOS)
+        photo = ImageTk.PhotoImage(image)
+        image.close()
+        return photo
+
+    def preload(self, filepaths, size = DISPLAY_SIZE):
+        """ Decode the given pictures ahead of time """
+        for filepath in filepaths:
+            self.get(filepath, size)
+
+    def clear(self):
+        self._photos.clear()
+        self.n_bytes = 0
+
+
+image_cache = ImageCache()
+
+
+class NullPhoto:
+    """ Stands in for a PhotoImage when there is no screen """
+
+    def width(self) -> int:
+        return 0
+
+    def height(self) -> int:
+        return 0
+
+
+def use_null_backend():
+    """ Do not decode any pictures; every picture is a NullPhoto """
+    image_cache.clear()
+    image_cache.decode = lambda filepath, size: NullPhoto()
@@ -0,0 +1,149 @@
+""" Crash-safe session journal.
+
+Every response is appended to output_journal/<participant>_journal.jsonl
+as soon as it is made, one JSON object per line:
+
+    {"event": "session", "code": ..., "seed": ..., "nouns": [...]}
+    {"event": "training", "word": ..., "audio": ...}
+    {"event": "phase", "phase": "post_test_production"}
+    {"event": "production", "Word": ..., "Participant Answer": ..., ...}
+    {"event": "phase", "phase": "post_test_perception"}
+    {"event": "perception", "Word": ..., "Forced": ...}
+    {"event": "end"}
+
+Each line is flushed to the operating system straight away, so nothing is
+lost if the program crashes. Forcing it onto the disk (fsync) is slower,
+so that is done every FSYNC_EVERY records and at every change of phase;
+after a power cut at most the last few responses are lost.
+
+The file is only ever appended to. `replay` reads it back into a
+`SessionState`, which is what the program needs to resume an unfinished
+session from the last completed trial: the nouns and their conditions,
+the seed of the training schedule, how many training trials were done
+and the post-test answers. A line that was cut short by a crash is
+ignored, and the next record starts on a new line.
+"""
+
+import json
+import os
+from typing import Dict, List, Optional
+
+JOURNAL_DIR = 'output_journal'
+
+FSYNC_EVERY = 10
+
+# Records that are always forced to disk
+FSYNC_EVENTS = {'session', 'phase', 'end'}
+
+
+def journal_path(participant_code: str, output_dir: str = JOURNAL_DIR) -> str:
+    return os.path.join(output_dir,
+                        participant_code.strip().replace(" ", "_") +
+                        "_journal.jsonl")
+
+
+class SessionState:
+    """ What a journal says about the last session in it """
+
+    def __init__(self, record: Dict):
+        self.code: str = record['code']
+        self.examiner: str = record.get('examiner', '')
+        self.seed: int = record['seed']
+        self.nouns: List[Dict] = record['nouns']
+        self.phase = 'training'
+        self.n_training = 0
+        self.production: List[Dict] = []
+        self.perception: Dict[str, str] = {}
+        self.finished = False
+
+    def apply(self, record: Dict):
+        event = record['event']
+        if event == 'training':
+            self.n_training += 1
+        elif event == 'phase':
+            self.phase = record['phase']
+        elif event == 'production':
+            answer = dict(record)
+            del answer['event']
+            self.production.append(answer)
+        elif event == 'perception':
+            self.perception[record['Word']] = record['Forced']
+        elif event == 'end':
+            self.finished = True
+
+
+def replay(path: str) -> Optional[SessionState]:
+    """ Read a journal back. Returns the state of the last session in it,
+    or None if there is no session. """
+    state = None
+    try:
+        f = open(path, encoding = 'utf-8')
+    except FileNotFoundError:
+        return None
+    with f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line that was cut short by a crash
+                continue
+            if record['event'] == 'session':
+                state = SessionState(record)
+            elif state is not None:
+                state.apply(record)
+    return state
+
+def unfinished_session(participant_code: str,
+                       output_dir: str = JOURNAL_DIR) -> Optional[SessionState]:
+    """ The participant's last session, if it was never finished """
+    state = replay(journal_path(participant_code, output_dir))
+    if state is None or state.finished:
+        return None
+    return state
+
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+class Journal:
+    def __init__(self):
+        self._file = None
+        self._unsynced = 0
+
+    def open(self, participant_code: str, output_dir: str = JOURNAL_DIR):
+        """ Start appending to the participant's journal """
+        self.close()
+        os.makedirs(output_dir, exist_ok = True)
+        path = journal_path(participant_code, output_dir)
+        self._file = open(path, 'a', encoding = 'utf-8')
+        if self._file.tell() and not _ends_with_newline(path):
+            # Do not append to a line that was cut short
+            self._file.write("\n")
+
+    def write(self, event: str, **fields):
+        """ Append a record. Does nothing if no journal is open. """
+        if self._file is None:
+            return
+        fields['event'] = event
+        self._file.write(json.dumps(fields, separators = (',', ':')) + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if event in FSYNC_EVENTS or self._unsynced >= FSYNC_EVERY:
+            self.sync()
+
+    def sync(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+
+journal = Journal()
@@ -0,0 +1,76 @@
+""" Compare the throughput of minimumEditDistance and batchEditDistance.
+
+Builds a synthetic cohort of (target, production) pairs from the words in
+word_list.csv, with productions made by randomly deleting, inserting and
+substituting letters, checks that both functions agree on every pair and
+prints how many pairs per second each one scores.
+
+Usage (from the python/ directory):
+
+    python levenshtein_distance/benchmark_levenshtein.py [n_pairs]
+"""
+
+import csv
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from levenshtein_distance import minimumEditDistance, batchEditDistance
+
+SEED = 20180101
+WORD_LIST = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         '..', 'word_list.csv')
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+
+def misspell(word, rng):
+    """ Apply up to three random single-letter edits to word """
+    letters = list(word)
+    for _ in range(rng.randint(0, 3)):
+        i = rng.randrange(len(letters) + 1)
+        edit = rng.choice('dis')
+        if edit == 'd' and i < len(letters):
+            del letters[i]
+        elif edit == 'i':
+            letters.insert(i, rng.choice(LETTERS))
+        elif i < len(letters):
+            letters[i] = rng.choice(LETTERS)
+    return ''.join(letters)
+
+def make_pairs(n_pairs, seed = SEED):
+    rng = random.Random(seed)
+    with open(WORD_LIST, encoding = 'utf-8') as f:
+        words = [row['Word'] for row in csv.DictReader(f)]
+    targets = [rng.choice(words) for _ in range(n_pairs)]
+    productions = [misspell(word, rng) for word in targets]
+    return targets, productions
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def main(n_pairs = 100000):
+    targets, productions = make_pairs(n_pairs)
+
+    reference, t_reference = timed(
+            lambda: [minimumEditDistance(s1, s2)
+                     for s1, s2 in zip(targets, productions)])
+    batch, t_batch = timed(batchEditDistance, targets, productions)
+
+    if batch != reference:
+        mismatches = sum(a != b for a, b in zip(batch, reference))
+        sys.exit(f"batchEditDistance disagrees on {mismatches} pairs")
+
+    print(f"{n_pairs} pairs, all distances agree")
+    print(f"minimumEditDistance: {t_reference:8.3f} s "
+          f"({n_pairs / t_reference:12.0f} pairs/s)")
+    print(f"batchEditDistance:   {t_batch:8.3f} s "
+          f"({n_pairs / t_batch:12.0f} pairs/s)")
+    print(f"speed-up: {t_reference / t_batch:.1f}x")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
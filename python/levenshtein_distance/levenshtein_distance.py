@@ -1,8 +1,14 @@
+import os
 import sys
 import tkinter as tk
-import xlrd
 from tkinter import filedialog
 import csv
+from itertools import groupby
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import workbook
+import distance_cache
+from distance_cache import DistanceCache
 
 
 def open_file():
@@ -13,29 +19,9 @@ def open_file():
     file_path = filedialog.askopenfilename()
     return file_path
  
-def csv_from_excel(path):
-    wb = xlrd.open_workbook(path)
-    sh = wb.sheet_by_name('Sheet1')
-    your_csv_file = open('ld.csv', 'w')
-    wr = csv.writer(your_csv_file, quoting=csv.QUOTE_ALL)
-
-    for rownum in range(sh.nrows):
-        wr.writerow(sh.row_values(rownum))
-    your_csv_file.close()
-
-
-
-
-
-input_file = open_file()
-
-csv_from_excel(input_file)
-
-csv_file = 'ld.csv'
-
 
 cur_sub = 0 #subject number to make the new file
-in_file = None #the to be input file
+header = None #the first row of the input sheet
 out_file = None #the to be output file
 
 # minimumEditDistance function
@@ -64,37 +50,112 @@ def minimumEditDistance(s1,s2):
     return distances[-1]
 
 
-def main():
-   global in_file
+# batchEditDistance function
+#     computes the minimum edit distance for many pairs of strings at
+#     once, using Myers' bit-parallel algorithm (as modified by Hyyrö for
+#     the Levenshtein distance). Each column of the DP table is kept as
+#     the bits of two integers, so a whole column is updated with a
+#     handful of integer operations instead of one Python step per cell.
+#     The character masks of each target are built once per batch, since
+#     the same targets come up on every participant's spreadsheet.
+#
+# Parameters:
+#     targets: the correct spelling strings
+#     productions: the strings that are spelled incorrect, in the same
+#                  order as targets
+#
+# Returns a list with the edit distance from productions[i] -> targets[i],
+# which is the same number minimumEditDistance gives for each pair
+def batchEditDistance(targets, productions):
+    masks = {}
+    scores = []
+    for s1, s2 in zip(targets, productions):
+        if not s1:
+            scores.append(len(s2))
+            continue
+        peq = masks.get(s1)
+        if peq is None:
+            peq = {}
+            for i, char in enumerate(s1):
+                peq[char] = peq.get(char, 0) | (1 << i)
+            masks[s1] = peq
+        scores.append(_myersDistance(peq, len(s1), s2))
+    return scores
+
+
+# _myersDistance function
+#     the inner loop of batchEditDistance
+#
+# Parameters:
+#     peq: dictionary from each character of the target to a bit mask of
+#          the positions where it occurs
+#     m: the length of the target
+#     s2: the string that is spelled incorrect
+#
+# Returns the edit distance from s2 -> target
+def _myersDistance(peq, m, s2):
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv, mv = full, 0
+    score = m
+    for char in s2:
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+    return score
+
+
+# editDistanceCache
+#     batchEditDistance behind a memo of every (target, production) pair
+#     already scored, shared by everything in the process that scores
+#     spellings (see distance_cache.py)
+editDistanceCache = DistanceCache('ortho', batchEditDistance)
+
+
+# main function
+#     reads the rows of the input workbook (or CSV file) one at a time,
+#     scores each subject's rows in one batch and writes them out to
+#     that subject's output file. The distances are remembered in
+#     distance_cache.json for the next run.
+#
+# Parameters:
+#     path: the .xlsx workbook (sheet 'Sheet1') or .csv file to score
+#
+# Returns None
+def main(path):
+   global header
+
+   distance_cache.load(distance_cache.DEFAULT_PATH, [editDistanceCache])
+   rows = workbook.read_rows(path, 'Sheet1', skip_header=False)
+   header = next(rows, [])
 
-   in_file = open(csv_file).readlines() #thows every line from the file into a list
-   for i in range(1,len(in_file)):
-      to_write = ""
-      line = in_file[i].strip().split(",") #gets the current line splits it by ','
-      
-      if line[0] == "": #for empty lines
-          continue
+   #groups the rows by the first 'cell', which should be the subject identifier
+   for line_sub, lines in groupby(rows, key=lambda line: int(line[0][0])):
+      lines = list(lines)
+      createOutputFile(line_sub) #create a new file for that subject
 
-      line_sub = int(line[0].strip('"')[0]) 
-      #gets the first 'cell' which should be the subject identifier
-      
-      if line_sub is not cur_sub: #if there is a new subject idenifier 
-         createOutputFile(line_sub) #create a new file for that subject
-      
-      score1 = minimumEditDistance(line[3],line[4]) #find the score for the current pair of words
-      score2 = minimumEditDistance(line[5],line[6]) #find the score for the current pair of words
-      
-      
-      #creates the basic line to write to output
-      to_write += line[1]+','+line[2]+','+line[3]+','+line[4]+','+str(score1)+','
-      to_write += line[5]+','+line[6]+','+str(score2)+"\n"
-      #   ^ this is kinda ugly to look at so I'll explain how this line looks
-      
-      #TEST PHASE,Condition,ORTHO Target ,Production,LD,PHONO,Phono production,LD
-      #   ^ that's the basic look for each line 
+      #find the scores for every pair of words in one go
+      scores1 = editDistanceCache.distances([line[3] for line in lines],
+                                            [line[4] for line in lines])
+      scores2 = editDistanceCache.distances([line[5] for line in lines],
+                                            [line[6] for line in lines])
 
+      for line, score1, score2 in zip(lines, scores1, scores2):
+         #TEST PHASE,Condition,ORTHO Target ,Production,LD,PHONO,Phono production,LD
+         #   ^ that's the basic look for each line 
+         out_file.writerow(line[1:5] + [score1] + line[5:7] + [score2])
 
-      out_file.write(to_write) #write out the line to the current output file
+   distance_cache.save(distance_cache.DEFAULT_PATH, [editDistanceCache])
 
 
 # createOutputFile function
@@ -108,22 +169,18 @@ def main():
 # Returns None
 def createOutputFile(new_subject):
    global cur_sub
-   global in_file
    global out_file 
    
    cur_sub = new_subject 
-   out_file = open("levenshtein_distance_"+str(cur_sub)+".csv","w")
-   first_line = in_file[0].strip().split(",")
-   to_write = ""
-   for i in range(1, len(first_line)):
-      cur_col = first_line[i]
-      to_write += cur_col.strip() + ","
+   f = open("levenshtein_distance_"+str(cur_sub)+".csv","w",newline='')
+   out_file = csv.writer(f, quoting=csv.QUOTE_NONNUMERIC, lineterminator='\n')
+   columns = []
+   for cur_col in header[1:]:
+      columns.append(cur_col.strip())
       if("Production" in cur_col or "production" in cur_col):
-         to_write += "LD,"
-   out_file.write(to_write[:-1]+'\n')
-   #print(to_write[:-1])
-
-
-main()
+         columns.append("LD")
+   out_file.writerow(columns)
 
 
+if __name__ == '__main__':
+   main(open_file())
@@ -0,0 +1,219 @@
+""" Everything known about the words, from one place.
+
+What we know about each word is spread over four files:
+
+    word_list.csv                           IPA, number of phonemes and
+                                            orthographic transparency of
+                                            the words of the experiment
+    WordLearningOrthography.csv             the same for the original word
+                                            list (Mac Roman encoded, the IPA
+                                            symbols it could not encode
+                                            replaced by '_')
+    Stimuli/orthography_and_phonology.csv   phonological transcription
+    Stimuli/plausible_spellings.csv         foil spellings
+
+`Lexicon` reads all four once into one `LexiconEntry` per word, keyed by
+the normalized (stripped, lower-case) word, so that every lookup is one
+dictionary access. The strings are interned, so a word, a transcription
+or a foil is only held once however many entries, sessions and result
+rows refer to it. Where both word lists have a word, word_list.csv wins.
+
+Building the lexicon is quick, but it is needed by every entry point,
+so it is also pickled to Stimuli/lexicon.pickle along with a SHA-1 of
+each source file. As long as the files are unchanged, later runs load
+the pickle instead of parsing the files; if any file changes, the
+lexicon is rebuilt and the pickle rewritten.
+
+    import lexicon
+    lexicon.lexicon()['Vacuole'].phonology     # 'v@kyuol'
+"""
+
+import csv
+import hashlib
+import os
+import pickle
+import sys
+import threading
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+import foils
+
+WORD_LIST = 'word_list.csv'
+WORD_LEARNING_ORTHOGRAPHY = 'WordLearningOrthography.csv'
+PHONOLOGY = 'Stimuli/orthography_and_phonology.csv'
+PLAUSIBLE_SPELLINGS = foils.PLAUSIBLE_SPELLINGS
+
+CACHE_PATH = 'Stimuli/lexicon.pickle'
+# Change this whenever LexiconEntry or Lexicon change
+CACHE_VERSION = 1
+
+
+class LexiconEntry(NamedTuple):
+    word: str
+    ipa: str = ''
+    phonemes: int = 0
+    # Orthographic transparency, from 0 to 1
+    transparency: float = 0.0
+    # Phonological transcription (see phonology.py)
+    phonology: str = ''
+    foils: Tuple[str, ...] = ()
+
+
+def normalize(word: str) -> str:
+    return word.strip().lower()
+
+def _fraction(percent: str) -> float:
+    try:
+        return float(percent.strip().rstrip('%')) / 100
+    except ValueError:
+        return 0.0
+
+def _int(value: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+
+#==============================================================================
+# Reading the sources
+#==============================================================================
+
+def read_word_list(path: str, encoding: str = 'utf-8'
+                   ) -> Dict[str, Tuple[str, int, float]]:
+    """ normalized word -> (IPA, phonemes, transparency), in file order """
+    words = {}
+    with open(path, newline = '', encoding = encoding) as f:
+        for row in csv.DictReader(f):
+            words[normalize(row['Word'])] = (
+                    row.get('IPA', ''), _int(row.get('phonemes', '')),
+                    _fraction(row.get('orthographic transparency', '')))
+    return words
+
+def read_phonology(path: str = PHONOLOGY) -> Dict[str, str]:
+    """ normalized word -> phonological transcription """
+    with open(path, newline = '', encoding = 'utf-8') as f:
+        return {normalize(row[0]): row[1].strip()
+                for row in csv.reader(f) if len(row) > 1}
+
+
+class Lexicon:
+    def __init__(self, entries: Dict[str, LexiconEntry],
+                 word_list: Tuple[str, ...]):
+        self.entries = entries
+        # The words of the experiment (word_list.csv), in order
+        self.word_list = word_list
+
+    @classmethod
+    def from_files(cls, word_list: str = WORD_LIST,
+                   word_learning_orthography: str = WORD_LEARNING_ORTHOGRAPHY,
+                   phonology: str = PHONOLOGY,
+                   plausible_spellings: str = PLAUSIBLE_SPELLINGS
+                   ) -> 'Lexicon':
+        words = read_word_list(word_list)
+        original = read_word_list(word_learning_orthography, 'mac_roman')
+        transcriptions = read_phonology(phonology)
+        foil_index = foils.FoilIndex.from_csv(plausible_spellings)
+        entries = {}
+        for word in list(words) + [word for word in original
+                                   if word not in words]:
+            ipa, phonemes, transparency = words.get(word) or original[word]
+            word = sys.intern(word)
+            entries[word] = LexiconEntry(
+                    word, sys.intern(ipa), phonemes, transparency,
+                    sys.intern(transcriptions.get(word, '')),
+                    tuple(sys.intern(foil) for foil in foil_index.foils(word))
+                    if word in foil_index else ())
+        return cls(entries, tuple(words))
+
+    def __setstate__(self, state: Dict):
+        """ Intern the strings again when loaded from the cache """
+        self.__dict__.update(state)
+        self.word_list = tuple(sys.intern(word) for word in self.word_list)
+        self.entries = {sys.intern(word): entry._replace(
+                            word = sys.intern(entry.word),
+                            ipa = sys.intern(entry.ipa),
+                            phonology = sys.intern(entry.phonology),
+                            foils = tuple(sys.intern(foil)
+                                          for foil in entry.foils))
+                        for word, entry in self.entries.items()}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[LexiconEntry]:
+        return iter(self.entries.values())
+
+    def __contains__(self, word: str) -> bool:
+        return normalize(word) in self.entries
+
+    def __getitem__(self, word: str) -> LexiconEntry:
+        return self.entries[normalize(word)]
+
+    def get(self, word: str) -> Optional[LexiconEntry]:
+        return self.entries.get(normalize(word))
+
+    def phonology(self) -> Dict[str, str]:
+        """ normalized word -> phonological transcription, for the words
+        that have one """
+        return {word: entry.phonology for word, entry in self.entries.items()
+                if entry.phonology}
+
+
+#==============================================================================
+# The cache on disk
+#==============================================================================
+
+def source_hashes(paths: Tuple[str, ...]) -> Tuple[str, ...]:
+    hashes = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            hashes.append(hashlib.sha1(f.read()).hexdigest())
+    return tuple(hashes)
+
+def load(sources: Tuple[str, ...] = (WORD_LIST, WORD_LEARNING_ORTHOGRAPHY,
+                                     PHONOLOGY, PLAUSIBLE_SPELLINGS),
+         cache_path: Optional[str] = CACHE_PATH) -> Lexicon:
+    """ The lexicon of the four source files, from the cache if they have
+    not changed since it was written. With cache_path None, the files are
+    always read and no cache is written. """
+    if cache_path is None:
+        return Lexicon.from_files(*sources)
+    key = (CACHE_VERSION, source_hashes(sources))
+    try:
+        with open(cache_path, 'rb') as f:
+            cached_key, cached = pickle.load(f)
+        if cached_key == key:
+            return cached
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError,
+            ImportError, ValueError, TypeError):
+        pass
+    built = Lexicon.from_files(*sources)
+    try:
+        temporary = cache_path + '.tmp'
+        with open(temporary, 'wb') as f:
+            pickle.dump((key, built), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, cache_path)
+    except OSError:
+        # The cache is only an optimization
+        pass
+    return built
+
+
+_lexicon = None
+_lexicon_lock = threading.Lock()
+
+def lexicon() -> Lexicon:
+    """ The shared lexicon, loaded the first time it is asked for """
+    global _lexicon
+    with _lexicon_lock:
+        if _lexicon is None:
+            _lexicon = load()
+        return _lexicon
+
+def transcriptions(path: str = PHONOLOGY) -> Dict[str, str]:
+    """ normalized word -> phonological transcription: from the shared
+    lexicon for the default file, read from the file for any other """
+    if path == PHONOLOGY:
+        return lexicon().phonology()
+    return read_phonology(path)
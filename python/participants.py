@@ -0,0 +1,159 @@
+""" Local database of participants.
+
+Keeps, in an SQLite file (participants.sqlite3), every participant we
+have seen, their sessions, their pretest answers and the variability
+condition each of their words was assigned to. The pretest program saves
+a participant's answers here when the pretest ends, so that when the
+participant signs in to the training program the next time, their missed
+words and conditions are found with a single indexed query on their
+participant code, instead of the examiner picking the pretest workbook
+by hand.
+
+The connection is only opened the first time the store is used.
+"""
+
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional
+
+from workbook import PretestRow
+
+DB_PATH = 'participants.sqlite3'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS participants (
+    code     TEXT PRIMARY KEY COLLATE NOCASE,
+    examiner TEXT,
+    created  REAL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id       INTEGER PRIMARY KEY,
+    code     TEXT NOT NULL COLLATE NOCASE REFERENCES participants (code),
+    phase    TEXT NOT NULL,
+    started  REAL NOT NULL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS sessions_code ON sessions (code);
+CREATE TABLE IF NOT EXISTS pretest_answers (
+    code      TEXT NOT NULL COLLATE NOCASE REFERENCES participants (code),
+    position  INTEGER NOT NULL,
+    word      TEXT NOT NULL COLLATE NOCASE,
+    answer    TEXT NOT NULL,
+    correct   INTEGER NOT NULL,
+    condition TEXT,
+    PRIMARY KEY (code, word)
+);
+CREATE TABLE IF NOT EXISTS conditions (
+    code        TEXT NOT NULL COLLATE NOCASE REFERENCES participants (code),
+    word        TEXT NOT NULL COLLATE NOCASE,
+    variability TEXT NOT NULL,
+    PRIMARY KEY (code, word)
+);
+"""
+
+
+class ParticipantStore:
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        self._db = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path)
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    #==========================================================================
+    # Participants and sessions
+    #==========================================================================
+
+    def known(self, code: str) -> bool:
+        """ Has this participant done the pretest? """
+        row = self.db.execute(
+                "SELECT 1 FROM pretest_answers WHERE code = ? LIMIT 1",
+                (code.strip(),)).fetchone()
+        return row is not None
+
+    def add_participant(self, code: str, examiner: Optional[str] = None):
+        with self.db:
+            self.db.execute(
+                    "INSERT OR IGNORE INTO participants (code, examiner, created)"
+                    " VALUES (?, ?, ?)", (code.strip(), examiner, time.time()))
+            if examiner:
+                self.db.execute(
+                        "UPDATE participants SET examiner = ? WHERE code = ?",
+                        (examiner, code.strip()))
+
+    def start_session(self, code: str, phase: str) -> int:
+        self.add_participant(code)
+        with self.db:
+            cursor = self.db.execute(
+                    "INSERT INTO sessions (code, phase, started) VALUES (?, ?, ?)",
+                    (code.strip(), phase, time.time()))
+        return cursor.lastrowid
+
+    def finish_session(self, session_id: int):
+        with self.db:
+            self.db.execute("UPDATE sessions SET finished = ? WHERE id = ?",
+                            (time.time(), session_id))
+
+    #==========================================================================
+    # Pretest answers and conditions
+    #==========================================================================
+
+    def save_pretest(self, code: str, answers: Iterable[PretestRow]):
+        """ Store (or replace) the participant's pretest answers, and the
+        condition each word was assigned to """
+        code = code.strip()
+        answers = list(answers)
+        self.add_participant(code)
+        with self.db:
+            self.db.execute("DELETE FROM pretest_answers WHERE code = ?", (code,))
+            self.db.executemany(
+                    "INSERT OR REPLACE INTO pretest_answers"
+                    " (code, position, word, answer, correct, condition)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    [(code, i, row.word, row.answer, row.correct, row.condition)
+                     for i, row in enumerate(answers)])
+            self.db.executemany(
+                    "INSERT OR REPLACE INTO conditions (code, word, variability)"
+                    " VALUES (?, ?, ?)",
+                    [(code, row.word, row.condition) for row in answers
+                     if row.condition])
+
+    def save_conditions(self, code: str, conditions: Dict[str, str]):
+        """ Store the variability condition (word -> 'high'/'low') """
+        with self.db:
+            self.db.executemany(
+                    "INSERT OR REPLACE INTO conditions (code, word, variability)"
+                    " VALUES (?, ?, ?)",
+                    [(code.strip(), word, variability)
+                     for word, variability in conditions.items()])
+
+    def pretest_answers(self, code: str) -> List[PretestRow]:
+        """ All of the participant's pretest answers, in pretest order """
+        rows = self.db.execute(
+                "SELECT word, answer, correct, condition FROM pretest_answers"
+                " WHERE code = ? ORDER BY position", (code.strip(),))
+        return [PretestRow(*row) for row in rows]
+
+    def pretest_misses(self, code: str) -> List[PretestRow]:
+        """ The words the participant got wrong at pretest, with the
+        condition they were assigned to """
+        rows = self.db.execute(
+                "SELECT a.word, a.answer, a.correct,"
+                "       COALESCE(c.variability, a.condition)"
+                " FROM pretest_answers AS a"
+                " LEFT JOIN conditions AS c ON c.code = a.code AND c.word = a.word"
+                " WHERE a.code = ? AND a.correct = 0"
+                " ORDER BY a.position", (code.strip(),))
+        return [PretestRow(*row) for row in rows]
+
+
+participant_store = ParticipantStore()
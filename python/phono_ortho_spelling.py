@@ -31,17 +31,21 @@ data attributes can be of different types - 'name' is a string,
 
 """
 
-import xlrd
-import csv
-import os, PIL, random
+import os, random, traceback
 from random import randint
 from os.path import normpath
-import pandas as pd
-from pandas import ExcelWriter
-from pandas import ExcelFile
-import simpleaudio as sa
-from glob import glob
-from PIL import Image, ImageTk
+import session
+from session import Noun, make_nouns
+import final
+import workbook
+import schedule
+import foils
+from audio import audio_cache, audio_player, play_audio
+from images import image_cache
+from timing import timing
+from participants import participant_store
+from journal import journal, unfinished_session
+import csv
 import itertools
 from tkinter import filedialog
 import typing
@@ -51,7 +55,6 @@ from tkinter import ttk
 from tkinter import *
 from tkinter import Tk
 from tkinter.scrolledtext import ScrolledText
-import pandas as pd
 import time
 
 
@@ -59,7 +62,6 @@ input_file = None
 dicts = []
 var = None
 test = False
-see = True
 
 
 to_output = []
@@ -68,13 +70,6 @@ to_output = []
 #==============================================================================
 # Some helper functions
 #==============================================================================
-def play_audio(filepath, wait = False):
-    wave_obj = sa.WaveObject.from_wave_file(filepath)
-    play_obj = wave_obj.play()
-    if wait:
-        play_obj.wait_done()
-
-
 def open_file():
    global input_file
    #root = tk.Tk()
@@ -83,101 +78,54 @@ def open_file():
    file_path = filedialog.askopenfilename()
    return file_path
 
-def csv_from_excel(path):
-    wb = xlrd.open_workbook(path)
-    sh = wb.sheet_by_name('Pretest')
-    your_csv_file = open('pretest.csv', 'w')
-    wr = csv.writer(your_csv_file, quoting=csv.QUOTE_ALL)
-
-    for rownum in range(sh.nrows):
-        wr.writerow(sh.row_values(rownum))
-
-    your_csv_file.close()
-
-
-def load_everything_in():
-    for i in range(1, len(input_file)):
-       if input_file[i].strip() == "":
-          continue
-          
-       line = input_file[i].strip()
-       print(line)
-
-       line = line.split(",")[1:]
-       
-       tf = int(line[2].replace('.0','').replace('"',''))
-       
+def load_everything_in(rows):
+    """ Fill dicts with the answers read from the pretest workbook """
+    del dicts[:]
+    for row in rows:
        toAdd = {
-                  'Word' : line[0].replace('"',""),
-                  'Participant Answer' : line[1].replace('"',""),
-                  'T/F' : tf,
-                  'Condition' : line[3].replace('"',"")
+                  'Word' : row.word,
+                  'Participant Answer' : row.answer,
+                  'T/F' : row.correct,
+                  'Condition' : row.condition
                }
        dicts.append(toAdd)
 
 
-def pick_12():
+def pick_12(rng = random):
+    """ Keep the 12 missed words to train in dicts: six design pairs both
+    words of which were missed (session.design_pairs), the two words of
+    each pair in different conditions. Raises ValueError if a word is not
+    in the word list, or if no design pair was missed. """
     global dicts
-    to_do = dicts
-    new_dicts = []
-    i = 0
-    num = 12
-
-    while i < num:
-        sel_word = randint(0,len(dicts)-1)
-        if(dicts[sel_word] in new_dicts):
-            continue
-        else:
-            new_dicts.append(dicts[sel_word]) 
-            i += 1
-    dicts =  new_dicts
+    misses = {session.normalize(word['Word']) : word
+              for word in dicts if not word['T/F']}
+    session.check_words(word['Word'] for word in misses.values())
+    pairs = session.pick_training_words(misses, rng = rng)
+    if not pairs:
+        raise ValueError("No pair of matched words was missed in the pretest")
+    conditions = session.assign_pair_conditions(pairs,
+            {name : word['Condition'] for name, word in misses.items()}, rng)
+    dicts = [dict(misses[name], Condition = conditions[name])
+             for pair in pairs for name in pair]
     
 def use_pretest_nouns(nouns): 
+    """ The nouns of the words in dicts, with their pretest answers and
+    conditions """
     new_nouns = []
+    by_name = session.index_nouns(nouns)
+    if test:
+        print(len(dicts))
 
     for word in dicts:
-        if test or see:
-            print(len(dicts))
-            print(word)
-        for noun in nouns:
-           if word["Word"] == noun.name:
-               noun.pretest_correct = False
-               noun.production_spelling = word["Participant Answer"]
-               new_nouns.append(noun)
-               break
+        noun = by_name.get(session.normalize(word["Word"]))
+        if noun is None:
+            continue
+        noun.pretest_correct = False
+        noun.production_spelling = word["Participant Answer"]
+        if word["Condition"] in ("high", "low"):
+            noun.variability = word["Condition"]
+        new_nouns.append(noun)
     return new_nouns
-#==============================================================================
-# Noun helper class and noun lists
-#==============================================================================
-
-class Noun(object):
-    def __init__(self, name: str, length: int):
-        self.name = name
-        self.length = length
-        self.img = f"Stimuli/Active/{self.name}/pic_{self.name.lower()}.jpg"
-        self.audios = glob(f"Stimuli/Active/{self.name}/*.wav")
-        random.shuffle(self.audios)
-        self.novel_talker = f"Stimuli/pretest_talker/pretest_talker_{name.lower()}.wav"
-        self.production_spelling = None
-        self.production_spelling_is_correct = None
-        self.perception_spelling = None
-        self.variability = None
-        self.pretest_correct = None
-    
-    def __str__(self):
-        return self.name + " " + str(self.length) + " " + str(self.production_spelling) + " " + str(self.perception_spelling)
-
-# List of nouns, divided into short and long nouns
-
-nouns = {}
-
-df = pd.read_csv('word_list.csv', encoding = 'utf-8')
-
-nouns['long'] = df[df['phonemes'] >= 9]['Word'].tolist()
-nouns['short'] = df[df['phonemes'] <= 8]['Word'].tolist()
-
-short_nouns = [Noun(name.capitalize(),'short') for name in nouns['short']]
-long_nouns = [Noun(name.capitalize(),'long') for name in nouns['long']]
 
 
 class LoginWindow(ttk.Frame):
@@ -188,6 +136,7 @@ class LoginWindow(ttk.Frame):
         
         self.ready = False
         self.incorrect_file = False
+        self.pretest_answers = []
 
         super().__init__(parent)
         self.controller = controller
@@ -231,10 +180,36 @@ class LoginWindow(ttk.Frame):
         self.participant_code_entry.focus()
 
     def login(self, *args):
+        code = self.participant_code_entry.get().strip()
+        state = unfinished_session(code) if code else None
+        if state is not None:
+            # The last session was cut short: carry on where it stopped
+            self.controller.participant_code = self.participant_code_entry.get()
+            self.controller.examiner = self.examiner_entry.get() or state.examiner
+            timing.open(self.controller.participant_code)
+            self.controller.session_id = participant_store.start_session(
+                    code, 'training')
+            self.controller.resume(state)
+            return
+        if not self.ready and code and participant_store.known(code):
+            # Returning participant: their pretest is already in the database
+            load_everything_in(participant_store.pretest_misses(code))
+            try:
+                pick_12()
+            except ValueError as error:
+                self.load_label['text'] = str(error)
+                return
+            self.ready = True
         if(self.ready):
-            self.controller.show_training_instructions()
+            if code and self.pretest_answers:
+                participant_store.save_pretest(code, self.pretest_answers)
             self.controller.participant_code = self.participant_code_entry.get()
+            timing.open(self.controller.participant_code)
             self.controller.examiner = self.examiner_entry.get()
+            self.controller.show_training_instructions()
+            participant_store.add_participant(code, self.controller.examiner)
+            self.controller.session_id = participant_store.start_session(
+                    code, 'training')
         else:
             if(not self.incorrect_file):
                 self.load_label['text'] = 'Please select a file'
@@ -247,13 +222,20 @@ class LoginWindow(ttk.Frame):
             self.load_label['text'] = 'Please select a file'
         else:
             if(".xlsx" in to_Open or ".csv" in to_Open):
+                self.pretest_answers = list(workbook.read_pretest(to_Open))
+                load_everything_in(self.pretest_answers)
+                try:
+                    pick_12()
+                except ValueError as error:
+                    self.ready = False
+                    self.incorrect_file = True
+                    self.load_label['text'] = ('Current file: ' + file_name +
+                                               '\n' + str(error))
+                    return
                 self.ready = True
                 self.incorrect_file = False
-                csv_from_excel(to_Open)
                 self.load_label['text'] = "Selected File: "+ file_name
-                input_file = open("pretest.csv").readlines()
-                load_everything_in()
-                pick_12()
+                input_file = to_Open
             else:
                 self.incorrect_file = True
                 self.load_label['text'] = 'Current file: ' + file_name + '\nPlease select an Excel file (.xlsx)'
@@ -271,16 +253,17 @@ class TrainingInstructionsWindow(ttk.Frame):
         training_instructions.insert(tk.END, data)
         training_instructions.grid()
         replay_button = ttk.Button(self, text = "Replay instructions",
-            command = lambda: play_audio("instructions_audio_files/",
-                                         "directions_training.wav"))
+            command = lambda: play_audio(
+                "instructions_audio_files/directions_training.wav"))
         self.ready_button = ttk.Button(self, text = 'Ready', 
                 command = self.controller.start_training, state='disabled')
         self.ready_button.grid()
         self.controller.after(500, self.play_training_instructions)
 
     def play_training_instructions(self, *args):
-        play_audio("instructions_audio_files/directions_training.wav", wait = True)
-        self.controller.after(3000, self.enable_ready_button)
+        audio_player.play("instructions_audio_files/directions_training.wav",
+            on_done = lambda: self.controller.after(3000,
+                                                    self.enable_ready_button))
 
     def enable_ready_button(self, *args):
         self.ready_button['state'] = 'normal'
@@ -318,24 +301,24 @@ def assign_nouns(short_nouns, long_nouns):
 
 
 class TrainingModel:
-    def __init__(self, controller):
+    def __init__(self, controller, skip = 0):
         self.controller = controller
-        self.controller.root.assigned_nouns = use_pretest_nouns(self.controller.root.assigned_nouns)
         self.nouns = self.controller.root.assigned_nouns
         
         self.results = []
-
-    def myGenerator(self):
-        for noun in self.nouns:
-           if noun.pretest_correct == False:
-              photo = PIL.ImageTk.PhotoImage(PIL.Image.open(noun.img))
-              if noun.variability == "high":
-                 for audio in noun.audios:
-                    yield noun, photo, audio 
-              elif noun.variability == "low":
-                 audio = random.choice(noun.audios)
-                 for i in range(10):
-                    yield noun, photo, audio 
+        self.nouns_by_name = {noun.name: noun for noun in self.nouns}
+        # The schedule is drawn from the session's seed, so that a resumed
+        # session gets the same schedule again
+        self.rng = random.Random(self.controller.root.seed)
+        self.trials = schedule.training_trials(self.nouns, self.rng)
+        self.skip = skip
+
+    def trial_stream(self):
+        """ The training trials, shuffled with no word twice in a row,
+        without the first `skip` trials that were done before a resume """
+        return itertools.islice(
+                schedule.no_repeat_stream(self.trials, self.rng),
+                self.skip, None)
 
 class TrainingView(ttk.Frame):
     def __init__(self, parent, controller):
@@ -346,41 +329,21 @@ class TrainingView(ttk.Frame):
         self.ImageBox.grid()
     
 class TrainingController:
-    def __init__(self, root):
+    view_class = TrainingView
+
+    def __init__(self, root, skip = 0):
         self.root = root
-        self.model = TrainingModel(self)
-        self.view = TrainingView(root.container, self)
-        self.mylist = list(self.model.myGenerator())
-        if test:
-            print()
-            print()
-            print()
-            for word in self.mylist:
-                print(word[0].name)
-        
-        random.shuffle(self.mylist)
-        self.no_reps(self.mylist)
-        i = 0
-        for word in self.mylist:
-            i += 1
-        
-        self.iterator = iter(self.mylist)
+        self.model = TrainingModel(self, skip)
+        self.view = self.view_class(root.container, self)
+        audio_cache.prefetch(schedule.clips(self.model.trials))
+        self.iterator = self.model.trial_stream()
         self.set_image()
-    
-    def no_reps(self, in_list):
-        i = 0
-        while i < len(in_list)-1:
-           if i != len(in_list):
-              if(in_list[i][0].name == in_list[i+1][0].name):
-                 temp = in_list.pop(i+1)
-                 in_list.append(temp)
-           i += 1
-
- 
-    
+
     def set_image(self):
         try:
-            noun, photo, audio = next(self.iterator) 
+            word, audio = self.trial = next(self.iterator)
+            noun = self.model.nouns_by_name[word]
+            photo = image_cache.get(noun.img)
             mydict = {
                     'Word' : noun.name,
                     'Talker' : (audio.split('.')[0]).split('_')[1],
@@ -389,15 +352,24 @@ class TrainingController:
             self.model.results.append(mydict)
             self.view.ImageBox.configure(image = photo)
             self.view.ImageBox.image=photo
+            self.view.update_idletasks()
+            self.image_onset = timing.now()
             self.root.after(1000, self.play_image_audio, audio)
         except StopIteration:
             self.root.show_post_test_production_instructions()
             pass
 
     def play_image_audio(self, filepath):
-        wave_obj = sa.WaveObject.from_wave_file(filepath)
-        play_obj = wave_obj.play()
-        play_obj.wait_done()
+        audio_player.play(filepath, on_done = self.audio_finished)
+
+    def audio_finished(self):
+        """ Log when the sound started relative to the picture, then move
+        on to the next trial """
+        record = audio_player.history[-1] if audio_player.history else None
+        if record is not None and record.onset > self.image_onset:
+            timing.add('image_to_audio', self.image_onset, record.onset,
+                       record.filepath)
+        journal.write('training', word = self.trial[0], audio = self.trial[1])
         self.set_image()
 
     def ready(self, *args):
@@ -411,14 +383,11 @@ class PostTestProductionInstructions(ttk.Frame):
         # Define the elements
         self.ImageBox = ttk.Label(self)
         self.ImageBox.grid()
-        photo = PIL.ImageTk.PhotoImage(
-                PIL.Image.open('fixation_images/fixationpic_pencil1.jpg'))
+        photo = image_cache.get('fixation_images/fixationpic_pencil1.jpg')
         self.ImageBox.configure(image = photo)
         self.ImageBox.image=photo
         
-        wave_obj = sa.WaveObject.from_wave_file(
-                'instructions_audio_files/directions_posttestproduction.wav')
-        play_obj = wave_obj.play()
+        play_audio('instructions_audio_files/directions_posttestproduction.wav')
 
         ttk.Button(self, text = 'Ready', 
                 command = self.controller.start_post_test_production).grid()
@@ -428,9 +397,11 @@ class PostTestProductionInstructions(ttk.Frame):
         self.controller.start_post_test_production()
 
 class PostTestProductionModel:
-    def __init__(self, assigned_nouns):
-        self.nouns = iter(assigned_nouns)
-        self.result_dicts = []
+    def __init__(self, assigned_nouns, answered = ()):
+        self.result_dicts = list(answered)
+        done = {answer['Word'] for answer in self.result_dicts}
+        self.nouns = iter([noun for noun in assigned_nouns
+                           if noun.name not in done])
 
 class PostTestProductionView(ttk.Frame):
     def __init__(self, parent, controller):
@@ -442,37 +413,32 @@ class PostTestProductionView(ttk.Frame):
         self.SpellingEntry.focus()
         self.EnterButton = ttk.Button(self, text = 'Enter')
         self.EnterButton.grid(row=1, column=1)
-
-
-        
-
+        self.ImageBox = ttk.Label(self)
+        self.ImageBox.grid(row=0,columnspan=2,
+                           padx=10,pady=10,sticky="nsew")
 
     def set_image(self,noun):
         self.noun = noun
-        photo = PIL.ImageTk.PhotoImage(PIL.Image.open(self.noun.img))
-        self.ImageBox = ttk.Label(self, image = photo)
+        photo = image_cache.get(self.noun.img)
+        self.ImageBox.configure(image = photo)
         self.ImageBox.image=photo
-        self.ImageBox.grid(row=0,columnspan=2,
-                           padx=10,pady=10,sticky="nsew")
 
 class PostTestProductionController:
-    def __init__(self, root):
+    view_class = PostTestProductionView
+
+    def __init__(self, root, answered = ()):
         self.root = root
-        self.model = PostTestProductionModel(self.root.assigned_nouns)
-        self.view = PostTestProductionView(root.container, self)
+        self.model = PostTestProductionModel(self.root.assigned_nouns, answered)
+        audio_cache.prefetch(noun.novel_talker
+                             for noun in self.root.assigned_nouns)
+        self.view = self.view_class(root.container, self)
         self.NextWord()
         self.view.EnterButton.config(command=self.test_spelling)
         root.bind('<Return>', self.test_spelling)
         self.view.set_image(self.noun)
 
-    def start_post_test_production(self):
-        random.shuffle(self.root.assigned_nouns)
-        for noun in assigned_nouns:
-            wave_obj = sa.WaveObject.from_wave_file(noun.novel_talker)
-            play_obj = wave_obj.play()
-            play_obj.wait_done()
-
     def test_spelling(self, *args):
+        start = timing.now()
         spelling = self.view.SpellingEntry.get()
         self.view.SpellingEntry.delete(0, 'end')
         if len(spelling) > 0 and (spelling.isalpha() or " " in spelling):
@@ -491,7 +457,11 @@ class PostTestProductionController:
                 self.model.result_dicts.append(mydict)
                 self.production_spelling_is_correct = False
             self.noun.production_spelling = spelling
+            journal.write('production', **mydict)
             self.NextWord()
+            self.view.update_idletasks()
+            timing.add('response_to_next_trial', start, timing.now(),
+                       'post-test production')
 
     def NextWord(self, *args):
         try:
@@ -528,14 +498,11 @@ class PostTestPerceptionInstructions(ttk.Frame):
         # Define the elements
         self.ImageBox = ttk.Label(self)
         self.ImageBox.grid()
-        photo = PIL.ImageTk.PhotoImage(PIL.Image.open('fixation_images'
-                                        '/fixationpic_pencil2.jpg'))
+        photo = image_cache.get('fixation_images/fixationpic_pencil2.jpg')
         self.ImageBox.configure(image = photo)
         self.ImageBox.image=photo
         
-        wave_obj = sa.WaveObject.from_wave_file('instructions_audio_files/'
-                                        'directions_posttestrecognition.wav')
-        play_obj = wave_obj.play()
+        play_audio('instructions_audio_files/directions_posttestrecognition.wav')
 
         ttk.Button(self, text = 'Ready', 
                 command = self.controller.start_post_test_perception).grid()
@@ -545,14 +512,25 @@ class PostTestPerceptionInstructions(ttk.Frame):
         self.controller.start_post_test_perception()
 
 class PostTestPerceptionModel:
-    def __init__(self, assigned_nouns):
+    def __init__(self, assigned_nouns, answered = ()):
         random.shuffle(assigned_nouns)
-        self.nouns = iter(assigned_nouns)
+        self.nouns = iter([noun for noun in assigned_nouns
+                           if noun.name not in answered])
         self.list_of_words = []
-        self.plausible_spellings_table = pd.read_csv('Stimuli/'
-            'plausible_spellings.csv', index_col=0, header = None).T
         self.results = []
 
+        # Work out the six spellings to show for every word up front,
+        # favouring the foils that earlier participants fell for
+        import difficulty
+        tables = difficulty.tables()
+        foil_index = foils.FoilIndex.from_stimuli(noun.stimulus
+                                                  for noun in assigned_nouns)
+        self.choices = {noun.name : foil_index.choices(
+                            noun.name, noun.production_spelling,
+                            weights = tables.attractiveness(
+                                noun.name, foil_index.foils(noun.name)))
+                        for noun in assigned_nouns}
+
 class PostTestPerceptionView(ttk.Frame):
     def __init__(self, parent, controller):
         super().__init__(parent)
@@ -586,17 +564,23 @@ class PostTestPerceptionView(ttk.Frame):
 
 
 class PostTestPerceptionController:
-    def __init__(self, root):
+    view_class = PostTestPerceptionView
+    variable_class = StringVar
+
+    def __init__(self, root, answered = ()):
         self.root = root
-        self.var = StringVar()
-        self.model = PostTestPerceptionModel(self.root.assigned_nouns)
-        self.view = PostTestPerceptionView(root.container, self)
+        self.var = self.variable_class()
+        self.model = PostTestPerceptionModel(self.root.assigned_nouns, answered)
+        audio_cache.prefetch(['instructions_audio_files/directions_goodnowlets.wav',
+                              'instructions_audio_files/directions_oops.wav'])
+        audio_cache.prefetch(noun.novel_talker
+                             for noun in self.root.assigned_nouns)
+        self.view = self.view_class(root.container, self)
         self.set_training_image()
 
     def set_training_image(self):
         self.noun = 'earth'
-        photo = PIL.ImageTk.PhotoImage(PIL.Image.open('fixation_images/'
-            'earthpic1.jpg')) 
+        photo = image_cache.get('fixation_images/earthpic1.jpg')
         audio = 'instructions_audio_files/directions_Earth.wav'
         self.view.ImageBox.configure(image = photo)
         self.view.ImageBox.image=photo
@@ -621,41 +605,21 @@ class PostTestPerceptionController:
     
     def set_image(self, *args):
         self.noun = next(self.model.nouns)
-        photo = PIL.ImageTk.PhotoImage(PIL.Image.open(self.noun.img)) 
+        photo = image_cache.get(self.noun.img)
         audio = self.noun.novel_talker
         self.view.ImageBox.configure(image = photo)
         self.view.ImageBox.image=photo
-        wrong_spellings = self.model.plausible_spellings_table[
-                self.noun.name.lower()].tolist()
-        self.model.plausible_spellings = [self.noun.name]
-        if self.noun.name.lower() != self.noun.production_spelling.lower():
-            #
-            #this is where I'm going to need to figure out how to replace the 
-            #incorrect spelling word assuming that the user spelled the word
-            #that matches one of the pre disposed spellings
-            # 
-            #
-            #print(self.noun.production_spelling)
-            #print("no")
-            self.model.plausible_spellings.append(self.noun.production_spelling)
-            adding = random.sample(wrong_spellings,4)
-            while(self.noun.production_spelling in adding):
-               adding = random.sample(wrong_spellings,4)
-            self.model.plausible_spellings+= adding
-        else:
-            #print("yes")
-            self.model.plausible_spellings+= random.sample(wrong_spellings, 5)
-        random.shuffle(self.model.plausible_spellings)
-        for i in range(0,6):
-            to_put = self.model.plausible_spellings[i].lower()
-            self.view.spellings[i].config(
-                    text = to_put, value = to_put)
+        self.model.plausible_spellings = self.model.choices[self.noun.name]
+        for button, to_put in zip(self.view.spellings,
+                                  self.model.plausible_spellings):
+            button.config(text = to_put, value = to_put)
         self.root.after(500, self.play_image_audio, audio)
 
     def Nothing(self):
         return
 
     def check_spelling(self, word):
+        start = timing.now()
         mydict = {}
         selected_spelling = word
         mydict['Participant Answer'] = selected_spelling
@@ -680,9 +644,11 @@ class PostTestPerceptionController:
             for dic in to_output:
                 if self.noun.name == dic['Word']:
                    dic['Forced'] = selected_spelling
+            journal.write('perception', Word = self.noun.name,
+                          Forced = selected_spelling)
             mydict['Word'] = self.noun.name
             mydict['Condition'] = self.noun.variability
-            if self.noun.name == selected_spelling:
+            if self.noun.name.lower() == selected_spelling:
                 mydict['T/F'] = 1
             else:
                 mydict['T/F'] = 0
@@ -692,6 +658,9 @@ class PostTestPerceptionController:
 
             try:
                 self.set_image()
+                self.view.update_idletasks()
+                timing.add('response_to_next_trial', start, timing.now(),
+                           'post-test perception')
             except StopIteration:
                 if test:
                     print('post test perception finished')
@@ -699,8 +668,7 @@ class PostTestPerceptionController:
                 self.root.show_final_screen()
 
     def play_image_audio(self, filepath):
-        wave_obj = sa.WaveObject.from_wave_file(filepath)
-        play_obj = wave_obj.play()
+        play_audio(filepath)
                 
 class FinalScreen(ttk.Frame):
     def __init__(self, parent, controller):
@@ -717,62 +685,35 @@ class FinalScreen(ttk.Frame):
         self.closeButton.grid(row = 2, column = 2)   
 
 
-    def get_phono(self, phono, word):
-        for line in phono:
-            line = line.strip().split(',')
-            if line[0].lower() == word.lower():
-                return line[1]
-    
     def fin(self):
-        pretest = open("pretest.csv").readlines()
-        test = open("output_test/" + self.test_name +"_test_results.csv").readlines()
-        phono = open("Stimuli/orthography_and_phonology.csv").readlines()
-        final = open("output_final/"+ self.test_name +"_final.csv","w")
-
-        PRE = "Pre,"
-        POST = "Post,"
-
-        to_write = "Phase,Condition,Ortho Target,Ortho Production,Production Correct,Phono Target,"+\
-                   "Phono production,Forced Selection,Forced Correct\n"
-        final.write(to_write)
-        for post in test[1:]:
-            post = post.strip().split(",")
-            pTarget = self.get_phono(phono, post[1])
-            for pre in pretest[1:]:
-                pre = pre.strip().split(",")
-                to_write = ""
-                if post[1].lower() == pre[1].strip('"').lower():
-                    to_write += PRE + "N/A,"+ pre[1] +","+ pre[2] +","  
-                    num = (int(float(pre[3].strip('"'))))
-                    if num == 1:
-                        to_write += "True," 
-                    elif num == 0:
-                        to_write += "False," 
-                    else:
-                        to_write += "N/A," 
-                    to_write += pTarget +",,N/A,N/A\n"
-                    final.write(to_write)
-            to_write = POST + post[0] + "," + post[1] +","+ post[2] +","+ post[3] +\
-                       ","+ pTarget +",,"+ post[4] + ","+post[5] + "\n"
-            final.write(to_write)
+        if input_file:
+            pretest = input_file
+        else:
+            pretest = participant_store.pretest_answers(
+                    self.controller.participant_code)
+        final.build_report(pretest,
+                           "output_test/" + self.test_name +"_test_results.csv",
+                           "output_final/"+ self.test_name +"_final.csv")
         self.close_game()
 
 
     def close_game(self):
-        os.remove("pretest.csv")
         exit()
         
 
 class MainApplication(tk.Tk):
     def __init__(self):
         super().__init__()
+        audio_player.attach(self)
         self.container = ttk.Frame(self, height = 300, width = 400)
         self.container.grid()
         self.show_login_window()
         self.examiner = 'default_examiner'
         self.participant_code = 'default_participant_code'
-        self.assigned_nouns = assign_nouns(short_nouns, long_nouns)
+        self.assigned_nouns = None
         self.writer = None
+        self.session_id = None
+        self.seed = None
 
     def show_login_window(self):
         self.LoginWindow = LoginWindow(self.container, self)
@@ -780,14 +721,62 @@ class MainApplication(tk.Tk):
         self.LoginWindow.grid(row = 0, column = 0, sticky = "nsew")
     
     def show_training_instructions(self):
+        self.assigned_nouns = use_pretest_nouns(assign_nouns(*make_nouns()))
+        self.seed = random.randrange(2**32)
+        journal.open(self.participant_code)
+        journal.write('session', code = self.participant_code,
+                      examiner = self.examiner, seed = self.seed,
+                      nouns = [{'name' : noun.name,
+                                'length' : noun.length,
+                                'variability' : noun.variability,
+                                'audios' : noun.audios,
+                                'pretest_spelling' : noun.production_spelling}
+                               for noun in self.assigned_nouns])
         self.TrainingInstructionsWindow = TrainingInstructionsWindow(
                 self.container, self)
         self.title("Training instructions")
         self.TrainingInstructionsWindow.grid(row = 0, column = 0, sticky = "nsew")
         self.TrainingInstructionsWindow.tkraise()
     
-    def start_training(self):
-        self.TrainingController = TrainingController(self)
+    def resume(self, state):
+        """ Carry on with a session that was cut short, from the last
+        response in its journal """
+        nouns_by_name = {noun.name : noun
+                         for nouns in make_nouns() for noun in nouns}
+        self.assigned_nouns = []
+        for saved in state.nouns:
+            noun = nouns_by_name[saved['name']]
+            noun.variability = saved['variability']
+            noun.audios = saved['audios']
+            noun.production_spelling = saved['pretest_spelling']
+            noun.pretest_correct = False
+            self.assigned_nouns.append(noun)
+        self.seed = state.seed
+        journal.open(self.participant_code)
+
+        if state.phase == 'training':
+            self.start_training(skip = state.n_training)
+            return
+        for answer in state.production:
+            nouns_by_name[answer['Word']].production_spelling = \
+                    answer['Participant Answer']
+        if (state.phase == 'post_test_production' and
+                len(state.production) < len(self.assigned_nouns)):
+            self.start_post_test_production(answered = state.production)
+        else:
+            del to_output[:]
+            for answer in state.production:
+                answer = dict(answer)
+                if answer['Word'] in state.perception:
+                    answer['Forced'] = state.perception[answer['Word']]
+                to_output.append(answer)
+            if len(state.perception) < len(self.assigned_nouns):
+                self.start_post_test_perception(answered = state.perception)
+            else:
+                self.show_final_screen()
+
+    def start_training(self, skip = 0):
+        self.TrainingController = TrainingController(self, skip)
         self.title("Training")
         self.TrainingController.view.grid(row=0,column=0,sticky="nsew")
         self.TrainingController.view.tkraise()
@@ -799,8 +788,10 @@ class MainApplication(tk.Tk):
         self.PostTestProductionInstructions.grid(row = 0, column = 0, sticky = "nsew")
         self.PostTestProductionInstructions.tkraise()
 
-    def start_post_test_production(self):
-        self.PostTestProductionController = PostTestProductionController(self)
+    def start_post_test_production(self, answered = ()):
+        journal.write('phase', phase = 'post_test_production')
+        self.PostTestProductionController = PostTestProductionController(
+                self, answered)
         self.title("Post Test Production")
         self.PostTestProductionController.view.grid(row=0,column=0,sticky="nsew")
         self.PostTestProductionController.view.tkraise()
@@ -812,8 +803,10 @@ class MainApplication(tk.Tk):
         self.PostTestPerceptionInstructions.grid(row = 0, column = 0, sticky = "nsew")
         self.PostTestPerceptionInstructions.tkraise()
 
-    def start_post_test_perception(self):
-        self.PostTestPerceptionController = PostTestPerceptionController(self)
+    def start_post_test_perception(self, answered = ()):
+        journal.write('phase', phase = 'post_test_perception')
+        self.PostTestPerceptionController = PostTestPerceptionController(
+                self, answered)
         self.title("Post Test Perception")
         self.PostTestPerceptionController.view.grid(row=0,column=0,sticky="nsew")
         self.PostTestPerceptionController.view.tkraise()
@@ -822,24 +815,40 @@ class MainApplication(tk.Tk):
         name = self.LoginWindow.participant_code.get().replace(" ","_")
         test_output = "output_test/" + name + "_test_results.csv"
         
-        output_file = open(test_output,'w')
-        output_file.write("Condition,Ortho Target,Ortho Production,Production Correct,"+\
-               "Forced,Forced Correct\n")
-        for word in to_output:
-            output_file.write(word['Condition']+ "," + word['Word']+ "," +\
-            word['Participant Answer']+","+\
-            str(word['Participant Answer'].lower() == word['Word'].lower()) +","+\
-            word['Forced']+","+\
-            str(word['Word'].lower() == word['Forced'].lower()) + "\n")
-
-        output_file.close()
+        with open(test_output, 'w', newline = '') as output_file:
+            writer = csv.writer(output_file, lineterminator = "\n")
+            writer.writerow(["Condition", "Ortho Target", "Ortho Production",
+                             "Production Correct", "Forced", "Forced Correct"])
+            for word in to_output:
+                writer.writerow([word['Condition'], word['Word'],
+                    word['Participant Answer'],
+                    word['Participant Answer'].lower() == word['Word'].lower(),
+                    word['Forced'],
+                    word['Word'].lower() == word['Forced'].lower()])
+
+    def save_results(self):
+        """ Add the post-test answers to the cohort's results store and
+        tables. Both can be rebuilt from the output files, so a failure is
+        only reported. """
+        import export, results
+        try:
+            rows = results.post_test_results(self.participant_code, to_output)
+            results.results_store.append(rows)
+            export.cohort_tables.append(rows)
+        except Exception:
+            traceback.print_exc()
 
     def show_final_screen(self):
         self.FinalScreen = FinalScreen(self.container, self)
         self.title("Final Screen")
         self.FinalScreen.grid(row = 0, column = 0, sticky = "nsew")
         self.final_output()
-        
+        journal.write('end')
+        journal.close()
+        timing.close()
+        participant_store.finish_session(self.session_id)
+        self.save_results()
+
         if test:
             print("done")
     
@@ -847,4 +856,6 @@ class MainApplication(tk.Tk):
 def main():
     app = MainApplication()
     app.mainloop()
-main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,377 @@
+""" Phonological scoring of the participants' spellings.
+
+The final report has a "Phono Target" column, the transcription of the
+word from Stimuli/orthography_and_phonology.csv, and a "Phono production"
+column, the transcription of what the participant typed. Transcriptions
+use the same one-character-per-phoneme alphabet as the CSV file (Klattese,
+e.g. 'glYkalxsIs' for glycolysis).
+
+A typed spelling is turned into phonemes by a grapheme-to-phoneme model
+that is learnt from the lexicon itself:
+
+ 1. Every word of the lexicon is aligned with its transcription, chunks
+    of one to three letters (e.g. 'ph', 'qu', 'x') to zero, one or two
+    phonemes, by dynamic programming. The first alignment is guided by
+    the letter-to-sound correspondences of English in SEED; the next ones
+    by how often each correspondence was used in the previous alignment.
+ 2. The aligned lexicon is a sequence of graphones, (chunk, phonemes)
+    pairs, for every word. The model counts how often each graphone
+    follows each of the one or two graphones before it ('ph' read as /f/
+    after 'os' read as /as/, ...), and interpolates these counts down to
+    the frequency of the graphone on its own, as in a language model.
+ 3. A spelling is transcribed as the likeliest sequence of graphones that
+    spells it. A word of the lexicon is read back as its transcription,
+    and a misspelling is read like the words it looks like.
+
+The transcription is compared with the target by an edit distance in
+which replacing a phoneme by a similar one (a vowel by another vowel,
+/s/ by /z/, ...) costs less than replacing it by an unrelated one.
+
+The same misspellings come up again and again across a cohort, so a
+`Scorer` transcribes each distinct spelling once, and keeps the distance
+of every (target, transcription) pair in a distance_cache.DistanceCache.
+
+    import phonology
+    phonology.scorer().score(['glYkalxsIs'], ['glycolisis'])
+    # [('glYkalYsIs', 0.5)]
+"""
+
+import math
+import re
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+import lexicon
+from distance_cache import DistanceCache
+
+# Letter-to-sound correspondences of English that the first alignment of
+# the lexicon starts from. Every letter has at least one.
+SEED = {
+    'a': ('@', 'a', 'e', 'x', 'E'), 'b': ('b',), 'c': ('k', 's'),
+    'd': ('d',), 'e': ('E', 'i', 'x', 'I', ''), 'f': ('f',),
+    'g': ('g', 'J'), 'h': ('h', ''), 'i': ('I', 'Y', 'i', 'x'),
+    'j': ('J',), 'k': ('k',), 'l': ('l',), 'm': ('m',), 'n': ('n', 'N'),
+    'o': ('o', 'a', 'x', 'u', 'c'), 'p': ('p',), 'q': ('k',),
+    'r': ('r', 'R', 'X'), 's': ('s', 'z', 'S'), 't': ('t', 'S'),
+    'u': ('u', 'yu', 'x', '^', 'U'), 'v': ('v',), 'w': ('w',),
+    'x': ('ks', 'gz', 'z'), 'y': ('Y', 'i', 'I', 'y'), 'z': ('z',),
+    'ph': ('f',), 'ch': ('k', 'C'), 'sh': ('S',), 'th': ('T', 'D'),
+    'ck': ('k',), 'qu': ('kw',), 'ng': ('N',), 'ee': ('i',), 'ea': ('i',),
+    'oo': ('u',), 'ou': ('W', 'u'), 'oi': ('cY',), 'eu': ('yu',),
+    'ai': ('e',), 'ay': ('e',), 'er': ('X', 'R'), 'ir': ('R',),
+    'ur': ('R', 'X'), 'or': ('cr', 'X'),
+    'bb': ('b',), 'dd': ('d',), 'ff': ('f',), 'll': ('l',), 'mm': ('m',),
+    'nn': ('n',), 'pp': ('p',), 'rr': ('r',), 'ss': ('s',), 'tt': ('t',),
+}
+
+MAX_GRAPHEME = 3
+MAX_PHONEMES = 2
+ITERATIONS = 3
+# A graphone is read in the context of the ORDER - 1 graphones before it
+ORDER = 3
+# Most histories kept at every letter when transcribing
+BEAM = 64
+
+# Pseudo-count of every correspondence in SEED
+SEED_COUNT = 0.5
+# Cost of a letter-to-phonemes correspondence that is not in SEED and was
+# never used in an alignment
+UNSEEN_COST = 12.0
+
+# Phonemes that are replaced by each other at half the cost. Every vowel
+# is similar to every other vowel.
+VOWELS = frozenset('aeiouAEIOUWYOx@^cRX')
+SIMILAR = ('pb', 'td', 'kg', 'fv', 'TD', 'sz', 'SZ', 'CJ', 'mnN', 'lr',
+           'wy', 'rRX')
+SIMILAR_COST = 0.5
+# Change this whenever the costs above change, so that distances saved
+# by distance_cache.py under the old costs are not used
+DISTANCE_VERSION = '1'
+
+NON_LETTERS = re.compile('[^a-z]')
+
+# A graphone: a grapheme and the phonemes it is read as
+Unit = Tuple[str, str]
+# Stands for the start and the end of a word
+BOUNDARY: Unit = ('#', '#')
+
+
+#==============================================================================
+# Comparing transcriptions
+#==============================================================================
+
+_similar = {(a, b) for group in SIMILAR for a in group for b in group}
+
+def substitution_cost(a: str, b: str) -> float:
+    if a == b:
+        return 0.0
+    if (a, b) in _similar or (a in VOWELS and b in VOWELS):
+        return SIMILAR_COST
+    return 1.0
+
+def phoneme_distance(target: str, production: str) -> float:
+    """ Weighted edit distance between two transcriptions: inserting or
+    deleting a phoneme costs 1, replacing it by a similar one 0.5 and by
+    any other 1 """
+    previous = [float(j) for j in range(len(production) + 1)]
+    for i, a in enumerate(target, 1):
+        current = [float(i)]
+        for j, b in enumerate(production, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + substitution_cost(a, b)))
+        previous = current
+    return previous[-1]
+
+def phoneme_distances(targets: Iterable[str],
+                      productions: Iterable[str]) -> List[float]:
+    return [phoneme_distance(target, production)
+            for target, production in zip(targets, productions)]
+
+
+#==============================================================================
+# Grapheme-to-phoneme model
+#==============================================================================
+
+class G2P:
+    """ How often each grapheme was read as each phoneme sequence in the
+    lexicon, both on its own and before each following letter ('#' at
+    the end of the word), which guides the alignment; and how often each
+    graphone followed each history of graphones, which transcribes. """
+
+    def __init__(self):
+        self.graphemes: Dict[str, float] = {}
+        # grapheme -> the phoneme sequences it was read as
+        self.options: Dict[str, List[str]] = {}
+        self.readings: Dict[Tuple[str, str], float] = {}
+        self.contexts: Dict[Tuple[str, str], float] = {}
+        self.context_readings: Dict[Tuple[str, str, str], float] = {}
+        self.total = 0.0
+        # How often each graphone was seen in the aligned lexicon, and
+        # after each history of one to ORDER - 1 graphones
+        self.units: Dict[Unit, float] = {}
+        self.units_total = 0.0
+        self.ngrams: Dict[Tuple[Unit, ...], Dict[Unit, float]] = {}
+        self.history_totals: Dict[Tuple[Unit, ...], float] = {}
+        self.seed_total = SEED_COUNT * sum(map(len, SEED.values()))
+
+    def add(self, grapheme: str, phonemes: str, following: str = None,
+            count: float = 1.0):
+        self.graphemes[grapheme] = self.graphemes.get(grapheme, 0.0) + count
+        pair = (grapheme, phonemes)
+        if pair not in self.readings:
+            self.options.setdefault(grapheme, []).append(phonemes)
+        self.readings[pair] = self.readings.get(pair, 0.0) + count
+        self.total += count
+        if following is not None:
+            context = (grapheme, following)
+            self.contexts[context] = self.contexts.get(context, 0.0) + count
+            key = (grapheme, following, phonemes)
+            self.context_readings[key] = (self.context_readings.get(key, 0.0)
+                                          + count)
+
+    @classmethod
+    def seed(cls) -> 'G2P':
+        model = cls()
+        for grapheme, readings in SEED.items():
+            for phonemes in readings:
+                model.add(grapheme, phonemes, count = SEED_COUNT)
+        return model
+
+    @classmethod
+    def from_lexicon(cls, lexicon: Dict[str, str],
+                     iterations: int = ITERATIONS) -> 'G2P':
+        """ Learn the model from word -> transcription """
+        model = cls.seed()
+        for iteration in range(iterations):
+            aligned = cls.seed()
+            alignments = []
+            for word, transcription in lexicon.items():
+                word = normalize(word)
+                alignments.append(model.align(word, transcription))
+                end = 0
+                for grapheme, phonemes in alignments[-1]:
+                    end += len(grapheme)
+                    aligned.add(grapheme, phonemes, following(word, end))
+            model = aligned
+        for units in alignments:
+            model.add_sequence(units)
+        return model
+
+    def cost(self, grapheme: str, phonemes: str, following: str) -> float:
+        """ -log of the probability of reading the next letters as the
+        grapheme and the grapheme as the phonemes, before `following` """
+        seen = self.graphemes.get(grapheme)
+        if seen is None:
+            return UNSEEN_COST if len(grapheme) == 1 else math.inf
+        probability = self.readings.get((grapheme, phonemes), 0.0) / seen
+        in_context = self.contexts.get((grapheme, following))
+        if in_context:
+            # Trust the context more the more often it was seen
+            weight = in_context / (in_context + 1)
+            probability = (weight * self.context_readings.get(
+                                (grapheme, following, phonemes), 0.0)
+                           / in_context + (1 - weight) * probability)
+        if not probability:
+            # Any letter may be read as any one or two phonemes, or be
+            # silent, so that every word can be aligned
+            return UNSEEN_COST if len(grapheme) == 1 else math.inf
+        return -math.log(seen / self.total) - math.log(probability)
+
+    def align(self, word: str, transcription: str) -> List[Tuple[str, str]]:
+        """ The cheapest alignment of a word with its transcription, as a
+        list of (grapheme, phonemes) """
+        n, m = len(word), len(transcription)
+        best = [[math.inf] * (m + 1) for i in range(n + 1)]
+        back = [[None] * (m + 1) for i in range(n + 1)]
+        best[0][0] = 0.0
+        for i in range(n):
+            for j in range(m + 1):
+                if best[i][j] == math.inf:
+                    continue
+                for k in range(1, min(MAX_GRAPHEME, n - i) + 1):
+                    grapheme = word[i:i + k]
+                    after = following(word, i + k)
+                    for l in range(min(MAX_PHONEMES, m - j) + 1):
+                        cost = best[i][j] + self.cost(
+                                grapheme, transcription[j:j + l], after)
+                        if cost < best[i + k][j + l]:
+                            best[i + k][j + l] = cost
+                            back[i + k][j + l] = (i, j)
+        if best[n][m] == math.inf:
+            return []
+        pairs = []
+        i, j = n, m
+        while (i, j) != (0, 0):
+            pi, pj = back[i][j]
+            pairs.append((word[pi:i], transcription[pj:j]))
+            i, j = pi, pj
+        pairs.reverse()
+        return pairs
+
+    def add_sequence(self, units: List[Unit]):
+        """ Count the graphones of an aligned word, each after the
+        histories before it """
+        units = [BOUNDARY] * (ORDER - 1) + list(units) + [BOUNDARY]
+        for k in range(ORDER - 1, len(units)):
+            unit = units[k]
+            self.units[unit] = self.units.get(unit, 0.0) + 1
+            self.units_total += 1
+            for n in range(1, ORDER):
+                history = tuple(units[k - n:k])
+                after = self.ngrams.setdefault(history, {})
+                after[unit] = after.get(unit, 0.0) + 1
+                self.history_totals[history] = (
+                        self.history_totals.get(history, 0.0) + 1)
+
+    def probability(self, unit: Unit, history: Tuple[Unit, ...]) -> float:
+        """ P(unit | the graphones before it), interpolated from the
+        longest history seen down to the frequency of the graphone itself
+        (Witten-Bell). The correspondences in SEED keep their pseudo-count,
+        so that a spelling can always be read. """
+        probability = ((self.units.get(unit, 0.0)
+                        + SEED_COUNT * (unit[1] in SEED.get(unit[0], ())))
+                       / (self.units_total + self.seed_total))
+        for n in range(1, len(history) + 1):
+            after = self.ngrams.get(history[-n:])
+            if after is None:
+                break
+            types = len(after)
+            probability = ((after.get(unit, 0.0) + types * probability)
+                           / (self.history_totals[history[-n:]] + types))
+        return probability
+
+    def transcribe(self, spelling: str) -> str:
+        """ The most likely transcription of a spelling """
+        letters = normalize(spelling)
+        n = len(letters)
+        # best[i]: the last ORDER - 1 graphones of the ways to spell
+        # letters[:i] -> (cost, where the last graphone starts, the
+        # history before it, its phonemes)
+        best: List[Dict] = [{} for i in range(n + 1)]
+        best[0][(BOUNDARY,) * (ORDER - 1)] = (0.0, None, None, '')
+        for i in range(n):
+            if len(best[i]) > BEAM:
+                best[i] = dict(sorted(best[i].items(),
+                                      key = lambda item: item[1][0])[:BEAM])
+            for history, (cost, *_) in best[i].items():
+                for k in range(1, min(MAX_GRAPHEME, n - i) + 1):
+                    grapheme = letters[i:i + k]
+                    for phonemes in self.options.get(grapheme, ()):
+                        unit = (grapheme, phonemes)
+                        probability = self.probability(unit, history)
+                        if not probability:
+                            continue
+                        total = cost - math.log(probability)
+                        after = (history + (unit,))[1:]
+                        if total < best[i + k].get(after, (math.inf,))[0]:
+                            best[i + k][after] = (total, i, history, phonemes)
+        if not best[n]:
+            return ''
+        history = min(best[n], key = lambda history: best[n][history][0]
+                      - math.log(self.probability(BOUNDARY, history)))
+        phonemes = []
+        i = n
+        while i:
+            _, i, history, reading = best[i][history]
+            phonemes.append(reading)
+        return ''.join(reversed(phonemes))
+
+
+def following(word: str, i: int) -> str:
+    """ The letter after word[:i], or '#' at the end of the word """
+    return word[i] if i < len(word) else '#'
+
+def normalize(spelling: str) -> str:
+    """ The letters of a spelling, in lower case """
+    return NON_LETTERS.sub('', spelling.lower())
+
+
+#==============================================================================
+# Scoring
+#==============================================================================
+
+class Scorer:
+    """ Transcribes spellings and scores them against their targets,
+    remembering every spelling and every pair it has seen """
+
+    def __init__(self, g2p: G2P):
+        self.g2p = g2p
+        self._transcriptions: Dict[str, str] = {}
+        self.distances = DistanceCache('phono', phoneme_distances,
+                                       version = DISTANCE_VERSION)
+
+    @classmethod
+    def from_csv(cls, path: str = lexicon.PHONOLOGY) -> 'Scorer':
+        return cls(G2P.from_lexicon(lexicon.transcriptions(path)))
+
+    def transcribe(self, spelling: str) -> str:
+        key = normalize(spelling)
+        transcription = self._transcriptions.get(key)
+        if transcription is None:
+            transcription = self.g2p.transcribe(key)
+            self._transcriptions[key] = transcription
+        return transcription
+
+    def distance(self, target: str, transcription: str) -> float:
+        return self.distances.distance(target, transcription)
+
+    def score(self, targets: Iterable[str], spellings: Iterable[str]
+              ) -> List[Tuple[str, float]]:
+        """ (transcription, distance to the target) of every spelling """
+        targets = list(targets)
+        transcriptions = [self.transcribe(spelling) for spelling in spellings]
+        return list(zip(transcriptions,
+                        self.distances.distances(targets, transcriptions)))
+
+
+_scorer = None
+_scorer_lock = threading.Lock()
+
+def scorer() -> Scorer:
+    """ The shared scorer, trained on the lexicon the first time it is
+    asked for """
+    global _scorer
+    with _scorer_lock:
+        if _scorer is None:
+            _scorer = Scorer.from_csv()
+        return _scorer
@@ -35,61 +35,27 @@ data attributes can be of different types - 'name' is a string,
 #from flask import Flask
 #app = Flask(__name__)
 
-import os, PIL, random
+import collections, os, random, traceback
 from os.path import normpath
-import pandas as pd
-import simpleaudio as sa
-from glob import glob
-from PIL import Image, ImageTk
+import session
+from session import Noun, make_nouns
+from audio import audio_cache, audio_player, play_audio
+from images import image_cache
+from timing import timing
+from participants import participant_store
+from workbook import PretestRow
 import itertools
 import typing
 from typing import List, Tuple
 import tkinter as tk
 from tkinter import ttk
 from tkinter.scrolledtext import ScrolledText
-import pandas as pd
 import time
 
 #==============================================================================
 # Some helper functions
 #==============================================================================
 
-def play_audio(filepath, wait = False):
-    wave_obj = sa.WaveObject.from_wave_file(filepath)
-    play_obj = wave_obj.play()
-    if wait:
-        play_obj.wait_done()
-
-
-#==============================================================================
-# Noun helper class and noun lists
-#==============================================================================
-
-class Noun(object):
-    def __init__(self, name: str, length: int):
-        self.name = name
-        self.length = length
-        self.img = f"Stimuli/Active/{self.name}/pic_{self.name.lower()}.jpg"
-        self.audios = glob(f"Stimuli/Active/{self.name}/*.wav")
-        random.shuffle(self.audios)
-        self.novel_talker = f"Stimuli/pretest_talker/pretest_talker_{name.lower()}.wav"
-        self.production_spelling = None
-        self.production_spelling_is_correct = None
-        self.perception_spelling = None
-        self.variability = None
-        self.pretest_correct = None
-
-# List of nouns, divided into short and long nouns
-
-nouns = {}
-
-df = pd.read_csv('word_list.csv', encoding = 'utf-8')
-
-nouns['long'] = df[df['phonemes'] >= 9]['Word'].tolist()
-nouns['short'] = df[df['phonemes'] <= 8]['Word'].tolist()
-
-short_nouns = [Noun(name.capitalize(),'short') for name in nouns['short']]
-long_nouns = [Noun(name.capitalize(),'long') for name in nouns['long']]
 
 '''
 for words in short_nouns:
@@ -137,6 +103,9 @@ class LoginWindow(ttk.Frame):
     def login(self, *args):
         self.controller.show_pretest_instructions()
         self.controller.participant_code = self.participant_code_entry.get()
+        timing.open('pretest_' + self.controller.participant_code)
+        self.controller.session_id = participant_store.start_session(
+                self.controller.participant_code, 'pretest')
 
 class PretestInstructionsWindow(ttk.Frame):
     def __init__(self, parent, controller):
@@ -155,16 +124,17 @@ class PretestInstructionsWindow(ttk.Frame):
         self.continue_button = ttk.Button(self, text = "Continue",
                 command = self.continue_command, state = 'disabled')
         self.replay_button = ttk.Button(self, text = "Replay test words",
-            command = lambda: play_audio("instructions_audio_files/",
-                                         "directions_pretest.wav"),
+            command = lambda: play_audio(
+                "instructions_audio_files/directions_pretest.wav"),
             state = 'disabled')
         self.continue_button.grid()
         self.replay_button.grid()
         self.controller.after(500, self.play_pretest_instructions)
 
     def play_pretest_instructions(self, *args):
-        play_audio("instructions_audio_files/directions_pretest.wav", wait = True)
-        self.controller.after(3000, self.enable_continue_button)
+        audio_player.play("instructions_audio_files/directions_pretest.wav",
+            on_done = lambda: self.controller.after(3000,
+                                                    self.enable_continue_button))
 
     def enable_continue_button(self, *args):
         self.continue_button.config(state='normal')
@@ -193,11 +163,26 @@ class PretestModel:
     def __init__(self, controller):
         self.count = 0
         self.controller = controller
+        self.adaptive = controller.root.adaptive
         self.nouns = self.controller.root.assigned_nouns
-        random.shuffle(self.nouns)
-        self.nouns = iter(self.nouns) ; self.noun = next(self.nouns)
+        self.partner_of = session.partners() if self.adaptive else {}
+        if self.adaptive:
+            # The words that earlier participants missed most come first,
+            # and the words that are in no design pair, which can never be
+            # trained, come last
+            self.nouns = sorted(session.order_by_miss_rate(
+                                    self.nouns, controller.root.miss_rates),
+                                key = lambda noun: session.normalize(
+                                    noun.name) not in self.partner_of)
+        else:
+            random.shuffle(self.nouns)
+        audio_cache.prefetch(noun.novel_talker for noun in self.nouns)
+        self.nouns = collections.deque(self.nouns)
+        self.noun = self.nouns.popleft()
         self.records, self.n_wrong = {}, 0
         self.dicts = []
+        self.misses = []
+        self.finished = False
 
     def NextNoun(self, spelling):
         mydict = {  
@@ -207,37 +192,35 @@ class PretestModel:
                     'Condition' : self.noun.variability,
                  }
         self.count +=1
-        try:
-            if spelling.lower() == self.noun.name.lower():
-                mydict['T/F'] = 1
-                self.dicts.append(mydict)
-                self.noun.pretest_correct = True
-                self.noun = next(self.nouns)
-            else:
-                mydict['T/F'] = 0
-                self.dicts.append(mydict)
-                self.n_wrong += 1
-                self.noun.pretest_correct = False
-                #if self.n_wrong == 12:
-                #    print('condition met!')
-                #    self.controller.do_post_processing()
-                #    return
-                try: 
-                    self.noun = next(self.nouns)
-                except StopIteration:
-                    try: 
-                        self.noun = next(self.nouns)
-                    except StopIteration:
-                        print(self.count)
-                        print('done with iteration!')
-                        print(self.dicts)
-                        self.controller.do_post_processing()
-                        return
-        except StopIteration:
-            print(self.dicts)
-            print('done with iteration!')
-            self.controller.do_post_processing()
-            return
+        if spelling.lower() == self.noun.name.lower():
+            mydict['T/F'] = 1
+            self.noun.pretest_correct = True
+        else:
+            mydict['T/F'] = 0
+            self.n_wrong += 1
+            self.noun.pretest_correct = False
+            self.misses.append(self.noun.name)
+        self.dicts.append(mydict)
+        # The adaptive pretest stops as soon as the missed design pairs can
+        # fill the training, and tests the partner of a missed word next;
+        # otherwise every word is tested in random order
+        if self.adaptive:
+            if session.enough_misses(self.misses):
+                self.finish()
+                return
+            session.requeue_partner(self.nouns, self.noun,
+                                    not self.noun.pretest_correct,
+                                    self.partner_of)
+        if self.nouns:
+            self.noun = self.nouns.popleft()
+        else:
+            self.finish()
+
+    def finish(self):
+        self.finished = True
+        print(self.dicts)
+        print('done with iteration!')
+        self.controller.do_post_processing()
 
 class PretestView(ttk.Frame):
     def __init__(self, parent, controller):
@@ -248,20 +231,23 @@ class PretestView(ttk.Frame):
         self.EnterButton.grid(row=1, column=1)
         self.SpellingEntry = ttk.Entry(self, width=15, font = "Helvetica 25")
         self.SpellingEntry.grid(row=1, column=0)
+        self.ImageBox = ttk.Label(self)
+        self.ImageBox.grid(row=0,columnspan=2,
+                           padx=10,pady=10,sticky="nsew")
 
     def set_image(self, noun):
         self.noun = noun
-        photo = PIL.ImageTk.PhotoImage(PIL.Image.open(self.noun.img))
-        self.ImageBox = ttk.Label(self, image = photo)
+        photo = image_cache.get(self.noun.img)
+        self.ImageBox.configure(image = photo)
         self.ImageBox.image=photo
-        self.ImageBox.grid(row=0,columnspan=2,
-                           padx=10,pady=10,sticky="nsew")
 
 class PretestController:
+    view_class = PretestView
+
     def __init__(self, root):
         self.root = root
         self.model = PretestModel(self)
-        self.view = PretestView(root.container, self)
+        self.view = self.view_class(root.container, self)
         self.view.set_image(self.model.noun)
         self.view.EnterButton.config(command=self.NextImage)
         #self.view.after(3000,self.enable_stuff)
@@ -271,6 +257,7 @@ class PretestController:
         self.play_noun_audio()
 
     def NextImage(self, *args):
+        start = timing.now()
         #self.view.after(3000,self.enable_stuff)
         spelling = self.view.SpellingEntry.get()
         self.view.SpellingEntry.delete(0, 'end')
@@ -279,13 +266,15 @@ class PretestController:
         if len(spelling) > 0 and (spelling.isalpha() or " " in spelling):
             self.view.SpellingEntry.delete(0, 'end')
             self.model.NextNoun(spelling)
-            if self.model.n_wrong <= 30 and self.model.count !=  30:# or self.model.count <30:
-               #self.count +=1
-               self.play_noun_audio()
+            if self.model.finished:
+                return
+            self.play_noun_audio()
             #print(self.model.noun.name)
             self.view.set_image(self.model.noun)
             self.view.ImageBox.grid(row=0, columnspan=2, padx=10,
                                     pady=10, sticky="nsew")
+            self.view.update_idletasks()
+            timing.add('response_to_next_trial', start, timing.now(), 'pretest')
 
 
     def disable_stuff(self):
@@ -300,14 +289,32 @@ class PretestController:
     def do_post_processing(self):
         """ Do post-processing. Does the participant meet the criteria for 
             the study? """
-        self.model.results = pd.DataFrame(self.model.dicts,
-                columns = ['ORTHO TARGET', 'PRODUCTION','T/F', 'Condition'])
+        import export
         self.root.filename = 'output_pretest/pretest_'+ self.root.participant_code.replace(" ","_")
-        self.root.writer = pd.ExcelWriter(self.root.filename+'.xlsx')
-        self.model.results.to_excel(self.root.writer, 'Pretest')
-
-        self.root.writer.save()
+        export.write_pretest_workbook(self.root.filename + '.xlsx',
+                                      self.model.dicts)
+
+        # Remember the answers, so that the training program finds them
+        # from the participant code alone
+        code = self.root.participant_code
+        participant_store.save_pretest(code,
+                [PretestRow(d['ORTHO TARGET'], d['PRODUCTION'], d['T/F'],
+                            d['Condition']) for d in self.model.dicts])
+        participant_store.save_conditions(code,
+                {noun.name: noun.variability for noun in self.root.assigned_nouns})
         self.root.end_pretest()
+        self.save_results(code)
+
+    def save_results(self, code):
+        """ Add the answers to the cohort's results store and tables. Both
+        can be rebuilt from the workbooks, so a failure is only reported. """
+        import export, results
+        try:
+            rows = results.pretest_results(code, self.model.dicts)
+            results.results_store.append(rows)
+            export.cohort_tables.append(rows)
+        except Exception:
+            traceback.print_exc()
 
     def play_noun_audio(self):
         try:
@@ -356,19 +363,25 @@ def assign_nouns(short_nouns, long_nouns):
 
 
 class MainApplication(tk.Tk):
-    def __init__(self):
+    def __init__(self, adaptive = False):
         super().__init__()
+        # Stop the pretest as soon as there are enough misses to train
+        self.adaptive = adaptive
+        self.miss_rates = prior_miss_rates() if adaptive else {}
+        audio_player.attach(self)
         self.container = ttk.Frame(self, height = 300, width = 400)
         self.container.grid()
         self.show_login_window()
         self.participant_code = 'default_participant_code'
-        self.assigned_nouns = assign_nouns(short_nouns, long_nouns)
+        self.assigned_nouns = None
         self.writer = None
+        self.session_id = None
     def show_login_window(self):
         self.LoginWindow = LoginWindow(self.container, self)
         self.title('Login')
         self.LoginWindow.grid(row = 0, column = 0, sticky = "nsew")
     def show_pretest_instructions(self):
+        self.assigned_nouns = assign_nouns(*make_nouns())
         self.PretestInstructionsWindow=PretestInstructionsWindow(self.container,self)
         self.title('Pretest Instructions')
         self.PretestInstructionsWindow.grid(row = 0, column = 0, sticky = "nsew")
@@ -386,10 +399,31 @@ class MainApplication(tk.Tk):
     def end_pretest(self):
         self.EndPretestWindow = EndPretestWindow(self.container, self)
         self.EndPretestWindow.grid(row=0,column=0,sticky="nsew")
+        timing.close()
+        participant_store.finish_session(self.session_id)
 
 
 #@app.route("/")
-def main():
-    app = MainApplication()
+def prior_miss_rates(store = None):
+    """ How often the earlier participants missed each word in the
+    pretest, from the difficulty tables of the results store (see
+    difficulty.py); empty if there are none yet """
+    import difficulty
+    if store is None:
+        return difficulty.tables().miss_rates()
+    return difficulty.DifficultyTables.load(
+            difficulty.tables_path(store)).miss_rates()
+
+def main(argv = None):
+    import argparse
+    parser = argparse.ArgumentParser(description = "The pretest")
+    parser.add_argument('--adaptive', action = 'store_true',
+                        help = "test the words that earlier participants "
+                               "missed most first, and stop as soon as "
+                               "there are enough misses to train")
+    args = parser.parse_args(argv)
+    app = MainApplication(adaptive = args.adaptive)
     app.mainloop()
-main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,388 @@
+""" Columnar store of every participant's results.
+
+Besides the per-participant files in output_pretest/, output_test/ and
+output_final/, every phase appends its responses to one store in
+output_results/, one row per response:
+
+    participant   participant code
+    phase         'pretest', 'post_test_production' or 'post_test_perception'
+    word          the target word
+    condition     'high' or 'low' variability ('' if not assigned)
+    length        'short' or 'long'
+    production    what the participant typed (or chose, in perception)
+    correct       1 or 0
+    ld            edit distance between production and word
+    phono_ld      phoneme distance between their transcriptions (phonology.py)
+    time          when the row was appended (seconds since the epoch)
+
+The store is columnar: each append writes one chunk file (numpy .npz)
+holding one array per column. The text columns are dictionary-encoded,
+i.e. stored as int32 codes into a small array of the distinct values,
+so a cohort of thousands of participants takes a few megabytes and
+loads without parsing any text. `frame()` reads every chunk into one
+pandas DataFrame with categorical text columns, and the queries at the
+end of this module are vectorized numpy over the codes.
+
+Every chunk is written to a temporary file and renamed, so a crash never
+leaves half a chunk behind. Chunks add up over many sessions; `compact`
+merges them into one, which records the names of the chunks it holds the
+rows of (see `sources`).
+
+From the command line (from the python/ directory):
+
+    python results.py summary         accuracy by condition, length and phase
+    python results.py words           edit distances per word
+    python results.py compact         merge the chunks into one
+    python results.py import FILE...  add final reports (output_final/*_final.csv)
+"""
+
+import argparse
+import csv
+import glob
+import math
+import os
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+import lexicon
+import phonology
+import stimuli
+from levenshtein_distance.levenshtein_distance import editDistanceCache
+
+RESULTS_DIR = 'output_results'
+CHUNK_PREFIX = 'chunk-'
+
+PHASES = ('pretest', 'post_test_production', 'post_test_perception')
+
+# Dictionary-encoded columns
+TEXT_COLUMNS = ('participant', 'phase', 'word', 'condition', 'length',
+                'production')
+NUMERIC_COLUMNS = {'correct': np.int8, 'ld': np.float32,
+                   'phono_ld': np.float32, 'time': np.float64}
+COLUMNS = TEXT_COLUMNS + tuple(NUMERIC_COLUMNS)
+
+
+class Result(NamedTuple):
+    participant: str
+    phase: str
+    word: str
+    condition: str
+    length: str
+    production: str
+    correct: int
+    ld: float = math.nan
+    phono_ld: float = math.nan
+
+
+def make_result(participant: str, phase: str, word: str, condition: str,
+                production: str) -> Result:
+    """ The row of one response, scored """
+    entry = lexicon.lexicon().get(word)
+    production = production or ''
+    ld = phono_ld = math.nan
+    if production:
+        ld = editDistanceCache.distance(word.lower(), production.lower())
+        if entry is not None and entry.phonology:
+            phono_ld = phonology.scorer().score([entry.phonology],
+                                                [production])[0][1]
+    return Result(participant.strip(), phase, word, condition or '',
+                  stimuli.word_length(entry.phonemes) if entry else '',
+                  production, int(production.lower() == word.lower()),
+                  ld, phono_ld)
+
+def pretest_results(participant: str, answers: Iterable[Dict]) -> List[Result]:
+    """ The rows of the pretest answers (pretest.PretestModel.dicts) """
+    return [make_result(participant, 'pretest', answer['ORTHO TARGET'],
+                        answer['Condition'], answer['PRODUCTION'])
+            for answer in answers]
+
+def post_test_results(participant: str,
+                      answers: Iterable[Dict]) -> List[Result]:
+    """ The rows of the post-test answers (phono_ortho_spelling.to_output),
+    production and perception """
+    rows = []
+    for answer in answers:
+        rows.append(make_result(participant, 'post_test_production',
+                                answer['Word'], answer['Condition'],
+                                answer['Participant Answer']))
+        rows.append(make_result(participant, 'post_test_perception',
+                                answer['Word'], answer['Condition'],
+                                answer['Forced']))
+    return rows
+
+
+#==============================================================================
+# Columns
+#==============================================================================
+
+class Column(NamedTuple):
+    """ A dictionary-encoded text column """
+    codes: np.ndarray
+    categories: np.ndarray
+
+    def values(self) -> np.ndarray:
+        return self.categories[self.codes]
+
+
+def encode(values: Sequence[str]) -> Column:
+    categories, codes = np.unique(np.asarray(values, dtype = str),
+                                  return_inverse = True)
+    return Column(codes.astype(np.int32).ravel(), categories)
+
+def concatenate(columns: List[Column]) -> Column:
+    """ One column from several, with the union of their categories """
+    if not columns:
+        return encode([])
+    categories = np.unique(np.concatenate([column.categories
+                                           for column in columns]))
+    codes = [np.searchsorted(categories, column.categories)
+             .astype(np.int32)[column.codes] for column in columns]
+    return Column(np.concatenate(codes), categories)
+
+def to_columns(rows: Iterable[Result], now: float = None) -> Dict:
+    """ column name -> Column or numpy array """
+    rows = list(rows)
+    columns = {}
+    for i, name in enumerate(TEXT_COLUMNS):
+        columns[name] = encode([row[i] for row in rows])
+    for name, dtype in NUMERIC_COLUMNS.items():
+        if name == 'time':
+            columns[name] = np.full(len(rows), now or time.time(), dtype)
+        else:
+            columns[name] = np.array([getattr(row, name) for row in rows],
+                                     dtype)
+    return columns
+
+
+#==============================================================================
+# The store
+#==============================================================================
+
+class ResultsStore:
+    def __init__(self, directory: str = RESULTS_DIR):
+        self.directory = directory
+
+    def chunks(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.directory,
+                                             CHUNK_PREFIX + '*.npz')))
+
+    def _write(self, columns: Dict, sources: Sequence[str] = ()) -> str:
+        os.makedirs(self.directory, exist_ok = True)
+        name = f"{CHUNK_PREFIX}{time.time():017.6f}-{os.getpid()}"
+        path = os.path.join(self.directory, name + '.npz')
+        arrays = {}
+        if sources:
+            arrays['sources'] = np.asarray(sources, dtype = str)
+        for column, value in columns.items():
+            if isinstance(value, Column):
+                arrays[column + '_codes'] = value.codes
+                arrays[column + '_categories'] = value.categories
+            else:
+                arrays[column] = value
+        temporary = os.path.join(self.directory, name + '.tmp')
+        with open(temporary, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(temporary, path)
+        return path
+
+    def append(self, rows: Iterable[Result]) -> Optional[str]:
+        """ Write the rows as a new chunk. Returns its path, or None if
+        there were no rows. """
+        columns = to_columns(rows)
+        if not len(columns['time']):
+            return None
+        return self._write(columns)
+
+    @staticmethod
+    def _read(path: str) -> Dict:
+        with np.load(path) as arrays:
+            columns = {name: Column(arrays[name + '_codes'],
+                                    arrays[name + '_categories'])
+                       for name in TEXT_COLUMNS}
+            columns.update((name, arrays[name]) for name in NUMERIC_COLUMNS)
+        return columns
+
+    def columns(self, paths: List[str] = None) -> Dict:
+        """ Every chunk, concatenated: column name -> Column or array """
+        chunks = [self._read(path) for path in
+                  (self.chunks() if paths is None else paths)]
+        columns = {name: concatenate([chunk[name] for chunk in chunks])
+                   for name in TEXT_COLUMNS}
+        for name, dtype in NUMERIC_COLUMNS.items():
+            columns[name] = (np.concatenate([chunk[name] for chunk in chunks])
+                             if chunks else np.zeros(0, dtype))
+        return columns
+
+    def frame(self):
+        """ The whole store as a pandas DataFrame, with categorical text
+        columns """
+        import pandas as pd
+        columns = self.columns()
+        return pd.DataFrame({
+                name: (pd.Categorical.from_codes(columns[name].codes,
+                                                 columns[name].categories)
+                       if name in TEXT_COLUMNS else columns[name])
+                for name in COLUMNS}, columns = list(COLUMNS))
+
+    @staticmethod
+    def sources(path: str) -> List[str]:
+        """ The names of the appended chunks whose rows the chunk at `path`
+        holds: the chunk itself, or, for a chunk written by compact(), the
+        chunks that were merged into it """
+        with np.load(path) as arrays:
+            if 'sources' in arrays.files:
+                return [str(name) for name in arrays['sources']]
+        return [os.path.basename(path)]
+
+    def compact(self) -> int:
+        """ Merge every chunk into one. Returns the number of chunks that
+        were merged. """
+        paths = self.chunks()
+        if len(paths) < 2:
+            return len(paths)
+        self._write(self.columns(paths),
+                    [name for path in paths for name in self.sources(path)])
+        for path in paths:
+            os.remove(path)
+        return len(paths)
+
+
+results_store = ResultsStore()
+
+
+#==============================================================================
+# Cohort queries
+#==============================================================================
+
+def accuracy(columns: Dict,
+             by: Sequence[str] = ('condition', 'length', 'phase')):
+    """ Proportion of correct responses for every combination of the `by`
+    columns that occurs, as a pandas DataFrame """
+    import pandas as pd
+    dims = [len(columns[name].categories) for name in by]
+    if not len(columns['correct']) or not all(dims):
+        return pd.DataFrame(columns = list(by) + ['n', 'accuracy'])
+    cells = np.ravel_multi_index([columns[name].codes for name in by], dims)
+    size = int(np.prod(dims))
+    n = np.bincount(cells, minlength = size)
+    correct = np.bincount(cells, weights = columns['correct'],
+                          minlength = size)
+    seen = np.flatnonzero(n)
+    keys = np.unravel_index(seen, dims)
+    table = {name: columns[name].categories[key]
+             for name, key in zip(by, keys)}
+    table['n'] = n[seen]
+    table['accuracy'] = correct[seen] / n[seen]
+    return pd.DataFrame(table, columns = list(by) + ['n', 'accuracy'])
+
+def smoothed_miss_rate(n, misses, prior_misses: float = 1.0,
+                       prior_hits: float = 1.0):
+    """ misses / n, smoothed towards the prior (by default Laplace's, so
+    that a word nobody has seen yet gets 0.5); n and misses may be arrays """
+    return (misses + prior_misses) / (n + prior_misses + prior_hits)
+
+def miss_rates(columns: Dict, phase: str = 'pretest',
+               prior_misses: float = 1.0, prior_hits: float = 1.0
+               ) -> Dict[str, float]:
+    """ lower-cased word -> proportion of the responses to that word in
+    `phase` that were wrong (see smoothed_miss_rate) """
+    words, phases = columns['word'], columns['phase']
+    keep = np.isin(phases.codes,
+                   np.flatnonzero(phases.categories == phase))
+    size = len(words.categories)
+    n = np.bincount(words.codes[keep], minlength = size)
+    correct = np.bincount(words.codes[keep],
+                          weights = columns['correct'][keep], minlength = size)
+    rates = smoothed_miss_rate(n, n - correct, prior_misses, prior_hits)
+    return {str(word).lower(): float(rate)
+            for word, rate, seen in zip(words.categories, rates, n) if seen}
+
+def ld_by_word(columns: Dict, column: str = 'ld',
+               phases: Sequence[str] = None):
+    """ Distribution of the edit distance (`column`) for every word, as a
+    pandas DataFrame with its count, mean and quartiles """
+    import pandas as pd
+    words = columns['word']
+    values = columns[column]
+    keep = ~np.isnan(values)
+    if phases is not None:
+        phase = columns['phase']
+        keep &= np.isin(phase.codes, np.flatnonzero(
+                np.isin(phase.categories, list(phases))))
+    header = ['word', 'n', 'mean', 'p25', 'median', 'p75', 'max']
+    codes, values = words.codes[keep], values[keep]
+    if not len(codes):
+        return pd.DataFrame(columns = header)
+    order = np.lexsort((values, codes))
+    codes, values = codes[order], values[order]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], len(codes)]
+    table = {'word': words.categories[codes[starts]],
+             'n': ends - starts,
+             'mean': np.add.reduceat(values, starts) / (ends - starts)}
+    for label, q in (('p25', 0.25), ('median', 0.5), ('p75', 0.75)):
+        # Quartiles of each sorted run, by linear interpolation
+        position = starts + q * (ends - starts - 1)
+        low = np.floor(position).astype(int)
+        high = np.ceil(position).astype(int)
+        table[label] = values[low] + (values[high] - values[low]) * (
+                position - low)
+    table['max'] = values[ends - 1]
+    return pd.DataFrame(table, columns = header)
+
+
+#==============================================================================
+# Importing the per-participant files
+#==============================================================================
+
+def final_report_results(path: str) -> List[Result]:
+    """ The rows of a final report (output_final/<code>_final.csv) """
+    participant = os.path.basename(path)[:-len('_final.csv')]
+    rows = []
+    with open(path, newline = '') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            phase, condition, word, production = row[0], row[1], row[2], row[3]
+            if phase == 'Pre':
+                rows.append(make_result(participant, 'pretest', word, '',
+                                        production))
+            else:
+                rows.append(make_result(participant, 'post_test_production',
+                                        word, condition, production))
+                rows.append(make_result(participant, 'post_test_perception',
+                                        word, condition, row[7]))
+    return rows
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__.split('\n\n')[0])
+    parser.add_argument('command', choices = ('summary', 'words', 'compact',
+                                              'import'))
+    parser.add_argument('files', nargs = '*')
+    parser.add_argument('--dir', default = RESULTS_DIR)
+    args = parser.parse_args(argv)
+    store = ResultsStore(args.dir)
+
+    if args.command == 'import':
+        for path in args.files:
+            store.append(final_report_results(path))
+        print(f"Imported {len(args.files)} files")
+    elif args.command == 'compact':
+        print(f"Merged {store.compact()} chunks")
+    else:
+        start = time.perf_counter()
+        columns = store.columns()
+        if args.command == 'summary':
+            table = accuracy(columns)
+        else:
+            table = ld_by_word(columns)
+        elapsed = time.perf_counter() - start
+        print(table.to_string(index = False))
+        print(f"\n{len(columns['time'])} rows in {elapsed:.3f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+""" Trial schedules for the training phase.
+
+A training trial is just a word and the talker recording to play with it
+(a `Trial`). High variability words get one trial per talker, low
+variability words get `LOW_VARIABILITY_TRIALS` trials with one randomly
+chosen talker.
+
+`no_repeat_stream` shuffles those trials into a stream in which the same
+word never comes up twice in a row. It works like drawing cards from a
+hand: at each step it draws a word at random, weighted by how many of its
+trials are left, from all the words except the one just shown. The only
+exception is when one word has more than half of the remaining trials -
+then that word has to go next, or it would be impossible to finish
+without a repeat. Following that rule, the stream never gets stuck, so a
+schedule without adjacent repeats is always produced whenever one exists
+at all (i.e. as long as no word has more than half of all trials, rounded
+up). Each step looks at every distinct word once, so the stream takes
+time linear in the number of trials, and trials are produced lazily,
+one at a time.
+"""
+
+import random
+from typing import Dict, Iterable, Iterator, List, NamedTuple
+
+LOW_VARIABILITY_TRIALS = 10
+
+
+class Trial(NamedTuple):
+    word: str
+    audio: str
+
+
+def training_trials(nouns: Iterable,
+                    rng: random.Random = random) -> Dict[str, List[str]]:
+    """ word -> talker recordings to play, for the nouns that were missed
+    at pretest """
+    trials = {}
+    for noun in nouns:
+        if noun.pretest_correct == False:
+            if noun.variability == "high":
+                trials[noun.name] = list(noun.audios)
+            elif noun.variability == "low":
+                trials[noun.name] = ([rng.choice(noun.audios)]
+                                     * LOW_VARIABILITY_TRIALS)
+    return trials
+
+def clips(trials: Dict[str, List[str]]) -> List[str]:
+    """ The distinct recordings a schedule will play """
+    return list(dict.fromkeys(audio for audios in trials.values()
+                              for audio in audios))
+
+def no_repeat_stream(trials: Dict[str, List[str]],
+                     rng: random.Random = random) -> Iterator[Trial]:
+    """ Yield every trial once, in random order, never showing the same
+    word twice in a row (whenever that is possible) """
+    remaining = {}
+    for word, audios in trials.items():
+        if audios:
+            remaining[word] = list(audios)
+            rng.shuffle(remaining[word])
+    n_left = sum(len(audios) for audios in remaining.values())
+    previous = None
+
+    while n_left:
+        largest = max(remaining, key = lambda word: len(remaining[word]))
+        if 2 * len(remaining[largest]) > n_left and (
+                largest != previous or len(remaining) == 1):
+            word = largest
+        else:
+            choices = n_left - len(remaining.get(previous, ()))
+            if choices == 0:
+                # Only the previous word is left
+                word = previous
+            else:
+                pick = rng.randrange(choices)
+                for word, audios in remaining.items():
+                    if word == previous:
+                        continue
+                    if pick < len(audios):
+                        break
+                    pick -= len(audios)
+
+        audios = remaining[word]
+        yield Trial(word, audios.pop())
+        if not audios:
+            del remaining[word]
+        n_left -= 1
+        previous = word
@@ -0,0 +1,222 @@
+""" Per-participant state.
+
+What is the same for every participant - a word's picture, recordings,
+phonology and foils - is kept once per process in the stimulus registry
+(stimuli.registry()). A `Noun` is one participant's record of one word:
+the order in which its talkers are played, the condition it was assigned
+to, and the participant's answers. It points at the word's shared
+`Stimulus` instead of copying it, and has __slots__, so it carries no
+per-instance __dict__.
+
+Setting up a participant's training (which of their missed words to
+train, and in which condition) is done by the functions at the end.
+"""
+
+import random
+import threading
+from typing import Deque, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import lexicon
+import stimuli
+
+
+class Noun:
+    __slots__ = ('stimulus', 'name', 'audios', 'variability', 'pretest_correct',
+                 'production_spelling', 'production_spelling_is_correct',
+                 'perception_spelling')
+
+    def __init__(self, stimulus: stimuli.Stimulus,
+                 rng: random.Random = random):
+        self.stimulus = stimulus
+        # Looked up all the time, so kept at hand rather than a property
+        self.name = stimulus.name
+        self.audios = list(stimulus.audios)
+        rng.shuffle(self.audios)
+        self.variability = None
+        self.pretest_correct = None
+        self.production_spelling = None
+        self.production_spelling_is_correct = None
+        self.perception_spelling = None
+
+    @property
+    def length(self) -> str:
+        return self.stimulus.length
+
+    @property
+    def img(self) -> str:
+        return self.stimulus.img
+
+    @property
+    def novel_talker(self) -> str:
+        return self.stimulus.novel_talker
+
+    def __str__(self):
+        return self.name + " " + str(self.length) + " " + str(self.production_spelling) + " " + str(self.perception_spelling)
+
+
+def make_nouns(registry: Optional[Mapping[str, stimuli.Stimulus]] = None,
+               rng: random.Random = random) -> Tuple[List[Noun], List[Noun]]:
+    """ Fresh records for every word in the registry, as lists of short and
+    long nouns. The registry is built the first time this is called rather
+    than at import, so that the login window comes up without waiting for
+    the word list and the stimulus manifest. """
+    if registry is None:
+        registry = stimuli.registry()
+    short_nouns, long_nouns = [], []
+    for stimulus in registry.values():
+        if stimulus.length == 'long':
+            long_nouns.append(Noun(stimulus, rng))
+        else:
+            short_nouns.append(Noun(stimulus, rng))
+    return short_nouns, long_nouns
+
+
+#==============================================================================
+# Setting up the training
+#==============================================================================
+
+N_TRAINING_WORDS = 12
+# The words of a design pair have the same number of phonemes and an
+# orthographic transparency at most this far apart
+TRANSPARENCY_TOLERANCE = 0.10
+
+
+def normalize(word: str) -> str:
+    return word.strip().lower()
+
+def stimulus_index(registry: Optional[Mapping[str, stimuli.Stimulus]] = None
+                   ) -> Dict[str, stimuli.Stimulus]:
+    """ normalized word -> Stimulus """
+    if registry is None:
+        registry = stimuli.registry()
+    return {normalize(name): stimulus for name, stimulus in registry.items()}
+
+def index_nouns(nouns: Iterable[Noun]) -> Dict[str, Noun]:
+    """ normalized word -> Noun """
+    return {normalize(noun.name): noun for noun in nouns}
+
+def check_words(words: Iterable[str],
+                index: Optional[Dict[str, stimuli.Stimulus]] = None):
+    """ Raise a ValueError naming every word that is not in the word list """
+    if index is None:
+        index = stimulus_index()
+    unknown = [word for word in words if normalize(word) not in index]
+    if unknown:
+        raise ValueError("Not in the word list: " + ", ".join(unknown))
+
+def match_pairs(lex: Optional[lexicon.Lexicon] = None,
+                tolerance: float = TRANSPARENCY_TOLERANCE
+                ) -> List[Tuple[str, str]]:
+    """ The design pairs of the word list: words with the same number of
+    phonemes whose orthographic transparency differs by at most
+    `tolerance`. Among the words of the same length, the closest two are
+    paired first. A word with no partner within the tolerance is left out,
+    so it is never trained. """
+    if lex is None:
+        lex = lexicon.lexicon()
+    by_length = {}
+    for word in lex.word_list:
+        by_length.setdefault(lex[word].phonemes, []).append(word)
+    pairs = []
+    for words in by_length.values():
+        words.sort(key = lambda word: lex[word].transparency)
+        gaps = sorted((lex[b].transparency - lex[a].transparency, i)
+                      for i, (a, b) in enumerate(zip(words, words[1:])))
+        paired = set()
+        for gap, i in gaps:
+            if round(gap, 6) > tolerance:
+                break
+            if i not in paired and i + 1 not in paired:
+                paired.update((i, i + 1))
+                pairs.append((words[i], words[i + 1]))
+    return sorted(pairs, key = lambda pair: lex.word_list.index(pair[0]))
+
+_design_pairs = None
+_design_pairs_lock = threading.Lock()
+
+def design_pairs() -> List[Tuple[str, str]]:
+    """ The design pairs of the word list, matched the first time they are
+    asked for """
+    global _design_pairs
+    with _design_pairs_lock:
+        if _design_pairs is None:
+            _design_pairs = match_pairs()
+        return _design_pairs
+
+def missed_pairs(misses: Iterable[str],
+                 pairs: Optional[List[Tuple[str, str]]] = None
+                 ) -> List[Tuple[str, str]]:
+    """ The design pairs both words of which were missed: only these can
+    be trained """
+    if pairs is None:
+        pairs = design_pairs()
+    missed = {normalize(word) for word in misses}
+    return [pair for pair in pairs if missed.issuperset(pair)]
+
+def partners(pairs: Optional[List[Tuple[str, str]]] = None
+             ) -> Dict[str, str]:
+    """ normalized word -> the other word of its design pair """
+    if pairs is None:
+        pairs = design_pairs()
+    return {word: other for a, b in pairs for word, other in ((a, b), (b, a))}
+
+def enough_misses(misses: Iterable[str], n_words: int = N_TRAINING_WORDS,
+                  pairs: Optional[List[Tuple[str, str]]] = None) -> bool:
+    """ Whether the missed words make up enough whole design pairs to fill
+    the training """
+    return len(missed_pairs(misses, pairs)) >= n_words // 2
+
+def order_by_miss_rate(nouns: Iterable[Noun], miss_rates: Dict[str, float],
+                       rng: random.Random = random,
+                       default_rate: float = 0.5) -> List[Noun]:
+    """ The nouns, the most often missed words first, so that an adaptive
+    pretest finds the misses it needs as early as possible. Words with
+    the same miss rate, and words with no rate (taken to be
+    default_rate), come in random order. """
+    return sorted(nouns, key = lambda noun: (
+            -miss_rates.get(normalize(noun.name), default_rate),
+            rng.random()))
+
+def requeue_partner(queue: Deque[Noun], noun: Noun, missed: bool,
+                    partner_of: Dict[str, str]):
+    """ Move the partner of a word just tested in the adaptive pretest: to
+    the front of the queue if the word was missed, since only the two
+    together can be trained, and to the back if it was spelled correctly,
+    since then the pair can no longer be trained """
+    partner = partner_of.get(normalize(noun.name))
+    for queued in queue:
+        if normalize(queued.name) == partner:
+            queue.remove(queued)
+            if missed:
+                queue.appendleft(queued)
+            else:
+                queue.append(queued)
+            return
+
+def pick_training_words(words: Iterable[str],
+                        n_words: int = N_TRAINING_WORDS,
+                        rng: random.Random = random,
+                        pairs: Optional[List[Tuple[str, str]]] = None
+                        ) -> List[Tuple[str, str]]:
+    """ Pick n_words of the missed words to train: one random.sample of
+    n_words/2 of the design pairs both words of which were missed. When
+    fewer pairs were missed, every one of them is trained. """
+    missed = missed_pairs(words, pairs)
+    return rng.sample(missed, min(n_words // 2, len(missed)))
+
+def assign_pair_conditions(pairs: Iterable[Tuple[str, str]],
+                           conditions: Dict[str, str],
+                           rng: random.Random = random) -> Dict[str, str]:
+    """ word -> 'high' or 'low', so that the two words of a pair are in
+    different conditions. Pairs whose words were already given different
+    conditions (e.g. at pretest) keep them. """
+    assigned = {}
+    for pair in pairs:
+        given = [conditions.get(word) for word in pair]
+        if set(given) == {'high', 'low'}:
+            assigned.update(zip(pair, given))
+            continue
+        drawn = ['high', 'low']
+        rng.shuffle(drawn)
+        assigned.update(zip(pair, drawn))
+    return assigned
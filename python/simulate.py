@@ -0,0 +1,478 @@
+#!/usr/bin/env python
+
+""" Run simulated participants through the experiment without a screen or
+a sound card.
+
+Each simulated session goes through the same controllers and models as
+the real program - the pretest, training, and both post-tests - but with
+
+    - a null view for every phase (widgets that accept and ignore every
+      call, and a spelling box the participant types into),
+    - the silent audio backend and empty pictures (audio.use_null_backend
+      and images.use_null_backend), and
+    - a stand-in for the Tk main window whose after() runs callbacks on a
+      virtual clock, in order of their due time but without waiting.
+
+Scripted participants spell words correctly with a given probability
+(higher in the post-tests, after training), otherwise they type a
+plausible misspelling, and they pick a spelling in the perception
+post-test the same way. Their typing and thinking speeds only move the
+virtual clock, which gives the length of the session in the lab.
+
+For every phase, the CPU time (time.process_time) and the peak memory
+allocated during the phase (tracemalloc) are summed over all sessions and
+printed at the end. Nothing is written to disk.
+
+Usage (from the python/ directory):
+
+    python simulate.py [--participants N] [--seed S] [--accuracy P]
+                       [--learning P] [--think-ms MS] [--ms-per-letter MS]
+                       [--no-tracemalloc] [--adaptive] [--results DIR]
+"""
+
+import argparse
+import contextlib
+import heapq
+import itertools
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, List, Optional
+
+import audio
+import difficulty
+import images
+import phono_ortho_spelling as phono
+import pretest
+import results
+from audio import audio_player
+from images import image_cache
+from timing import timing
+from workbook import PretestRow
+
+PHASES = ('pretest', 'setup', 'training', 'post_test_production',
+          'post_test_perception')
+
+
+#==============================================================================
+# Null widgets and views
+#==============================================================================
+
+def _ignore(*args, **kwargs):
+    return None
+
+
+class NullWidget:
+    """ Accepts and ignores every call a Tk widget would get """
+
+    def __getattr__(self, name: str) -> Callable:
+        return _ignore
+
+
+class NullEntry(NullWidget):
+    """ A text box the simulated participant types into """
+
+    def __init__(self):
+        self.text = ''
+
+    def get(self) -> str:
+        return self.text
+
+    def insert(self, index, text: str):
+        self.text += text
+
+    def delete(self, first, last = None):
+        self.text = ''
+
+
+class NullVariable:
+    def __init__(self, value = None):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class NullView(NullWidget):
+    """ Stands in for the view of every phase """
+
+    def __init__(self, parent, controller):
+        self.parent, self.controller = parent, controller
+        self.ImageBox = NullWidget()
+        self.SpellingEntry = NullEntry()
+        self.EnterButton = NullWidget()
+        self.spellings = [NullWidget() for i in range(6)]
+        self.ready_button = NullWidget()
+        self.nextButton = NullWidget()
+
+    def set_image(self, noun):
+        self.noun = noun
+        photo = image_cache.get(noun.img)
+        self.ImageBox.configure(image = photo)
+        self.ImageBox.image = photo
+
+
+class HeadlessPretestController(pretest.PretestController):
+    view_class = NullView
+
+    def do_post_processing(self):
+        # The real program saves a workbook and the participant database
+        self.root.end_pretest()
+
+class HeadlessTrainingController(phono.TrainingController):
+    view_class = NullView
+
+class HeadlessPostTestProductionController(phono.PostTestProductionController):
+    view_class = NullView
+
+class HeadlessPostTestPerceptionController(phono.PostTestPerceptionController):
+    view_class = NullView
+    variable_class = NullVariable
+
+
+#==============================================================================
+# Simulated participants
+#==============================================================================
+
+class SyntheticParticipant:
+    def __init__(self, rng: random.Random, accuracy: float = 0.4,
+                 learning: float = 0.3, think_ms: float = 1500,
+                 ms_per_letter: float = 250):
+        self.rng = rng
+        self.accuracy = accuracy
+        self.trained_accuracy = min(1.0, accuracy + learning)
+        self.think_ms = think_ms
+        self.ms_per_letter = ms_per_letter
+
+    def misspell(self, word: str) -> str:
+        """ Drop, double or swap a letter """
+        letters = list(word.lower())
+        i = self.rng.randrange(len(letters))
+        kind = self.rng.randrange(3)
+        if kind == 0 and len(letters) > 1:
+            del letters[i]
+        elif kind == 1 or i == len(letters) - 1:
+            letters.insert(i, letters[i])
+        else:
+            letters[i], letters[i + 1] = letters[i + 1], letters[i]
+        spelling = ''.join(letters)
+        if spelling == word.lower():
+            return spelling + spelling[-1]
+        return spelling
+
+    def spell(self, word: str, trained: bool = False) -> str:
+        accuracy = self.trained_accuracy if trained else self.accuracy
+        if self.rng.random() < accuracy:
+            return word.lower()
+        return self.misspell(word)
+
+    def choose(self, word: str, choices: List[str]) -> str:
+        if word.lower() in choices and self.rng.random() < self.trained_accuracy:
+            return word.lower()
+        return self.rng.choice(choices)
+
+    def typing_ms(self, text: str) -> float:
+        return self.think_ms + self.ms_per_letter * len(text)
+
+
+#==============================================================================
+# A session on a virtual clock
+#==============================================================================
+
+class NullRoot:
+    """ The parts of the Tk main window the controllers use. after()
+    callbacks run in order of their due time on a virtual clock, in ms. """
+
+    def __init__(self):
+        self.container = NullWidget()
+        self.clock = 0.0
+        self._events = []
+        self._order = itertools.count()
+
+    def after(self, ms, func, *args):
+        heapq.heappush(self._events,
+                       (self.clock + ms, next(self._order), func, args))
+
+    def bind(self, *args):
+        pass
+
+    def title(self, *args):
+        pass
+
+    def mainloop(self):
+        while self._events:
+            self.clock, _, func, args = heapq.heappop(self._events)
+            func(*args)
+
+
+class SimulatedSession(NullRoot):
+    """ One participant, from the pretest to the end of the post-tests """
+
+    def __init__(self, participant: SyntheticParticipant,
+                 trace_memory: bool = True, adaptive: bool = False):
+        super().__init__()
+        self.participant = participant
+        self.rng = participant.rng
+        self.trace_memory = trace_memory
+        self.participant_code = 'simulated'
+        self.adaptive = adaptive
+        self.miss_rates = {}
+        self.assigned_nouns = None
+        self.seed = None
+        self.phase = None
+        self.cpu = dict.fromkeys(PHASES, 0.0)
+        self.peak = dict.fromkeys(PHASES, 0)
+        self.n_trials = 0
+        self.finished = False
+        self.excluded = False
+
+    def enter(self, phase: Optional[str]):
+        """ Charge the CPU time and memory used so far to the current phase
+        and start measuring the next one """
+        if self.phase is not None:
+            self.cpu[self.phase] += time.process_time() - self._cpu_start
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1] - self._mem_start
+                self.peak[self.phase] = max(self.peak[self.phase], peak)
+        self.phase = phase
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            self._mem_start = tracemalloc.get_traced_memory()[0]
+        self._cpu_start = time.process_time()
+
+    def respond(self, text: str, answer: Callable[[str], None]):
+        """ Have the participant give `text` as an answer once they had
+        time to think and type it """
+        self.after(self.participant.typing_ms(text), answer, text)
+
+    def run(self) -> 'SimulatedSession':
+        del phono.to_output[:]
+        self.enter('pretest')
+        self.assigned_nouns = pretest.assign_nouns(*pretest.make_nouns())
+        self.pretest = HeadlessPretestController(self)
+        self.next_pretest_answer()
+        self.mainloop()
+        self.enter(None)
+        return self
+
+    # Pretest ----------------------------------------------------------------
+
+    def next_pretest_answer(self):
+        word = self.pretest.model.noun.name
+        self.respond(self.participant.spell(word), self.answer_pretest)
+
+    def answer_pretest(self, spelling: str):
+        self.pretest.view.SpellingEntry.insert(0, spelling)
+        self.pretest.NextImage()
+        self.n_trials += 1
+        if self.phase == 'pretest':
+            self.next_pretest_answer()
+
+    def end_pretest(self):
+        self.enter('setup')
+        self.after(0, self.start_training)
+
+    # Training ---------------------------------------------------------------
+
+    def start_training(self):
+        misses = [PretestRow(d['ORTHO TARGET'], d['PRODUCTION'], d['T/F'],
+                             d['Condition'])
+                  for d in self.pretest.model.dicts if d['T/F'] == 0]
+        phono.load_everything_in(misses)
+        try:
+            phono.pick_12(self.rng)
+        except ValueError:
+            # Nothing to train: the participant does not take part further
+            self.excluded = True
+            return
+        self.assigned_nouns = phono.use_pretest_nouns(
+                phono.assign_nouns(*phono.make_nouns()))
+        self.seed = self.rng.randrange(2**32)
+        self.enter('training')
+        self.training = HeadlessTrainingController(self)
+
+    # Post-test production ---------------------------------------------------
+
+    def show_post_test_production_instructions(self):
+        self.enter('post_test_production')
+        self.after(self.participant.think_ms, self.start_post_test_production)
+
+    def start_post_test_production(self):
+        self.n_trials += len(self.training.model.results)
+        self.production = HeadlessPostTestProductionController(self)
+        if self.phase == 'post_test_production':
+            self.next_production_answer()
+
+    def next_production_answer(self):
+        word = self.production.noun.name
+        self.respond(self.participant.spell(word, trained = True),
+                     self.answer_production)
+
+    def answer_production(self, spelling: str):
+        self.production.view.SpellingEntry.insert(0, spelling)
+        self.production.test_spelling()
+        self.n_trials += 1
+        if self.phase == 'post_test_production':
+            self.next_production_answer()
+
+    # Post-test perception ---------------------------------------------------
+
+    def show_post_test_perception_instructions(self):
+        self.enter('post_test_perception')
+        self.after(self.participant.think_ms, self.start_post_test_perception)
+
+    def start_post_test_perception(self):
+        self.perception = HeadlessPostTestPerceptionController(self)
+        self.next_perception_answer()
+
+    def next_perception_answer(self):
+        noun = self.perception.noun
+        word = noun if noun == 'earth' else noun.name
+        choice = self.participant.choose(word,
+                                         self.perception.model.plausible_spellings)
+        self.respond(choice, self.answer_perception)
+
+    def answer_perception(self, choice: str):
+        practice = self.perception.noun == 'earth'
+        self.perception.check_spelling(choice)
+        if practice:
+            if choice == 'earth':
+                # The 'Ready' button appears after the practice word
+                self.perception.set_first_image()
+        else:
+            self.n_trials += 1
+        if self.phase == 'post_test_perception':
+            self.next_perception_answer()
+
+    def show_final_screen(self):
+        self.enter(None)
+        self.finished = len(phono.to_output) == len(self.assigned_nouns)
+
+
+#==============================================================================
+# Running many sessions
+#==============================================================================
+
+def session_results(session: SimulatedSession) -> List[results.Result]:
+    """ What the session would add to the results store """
+    return (results.pretest_results(session.participant_code,
+                                    session.pretest.model.dicts) +
+            results.post_test_results(session.participant_code,
+                                      phono.to_output))
+
+def simulate(n_participants: int, seed: int = 0, trace_memory: bool = True,
+             results_dir: str = None, adaptive: bool = False,
+             **participant) -> List[SimulatedSession]:
+    """ Run the sessions. With results_dir, the results of every session
+    that finished are appended to a results store there, the difficulty
+    tables of the store are brought up to date and the store is compacted
+    at the end. """
+    audio.use_null_backend()
+    images.use_null_backend()
+    rng = random.Random(seed)
+    # The controllers also draw from the global generator
+    random.seed(seed)
+    sessions = []
+    if results_dir:
+        store = results.ResultsStore(results_dir)
+    # The adaptive pretest and the perception foils use the word difficulty
+    # and foil attractiveness fitted from the earlier runs into results_dir
+    # (and nothing without it)
+    tables = (difficulty.update(store) if results_dir
+              else difficulty.DifficultyTables())
+    difficulty.use_tables(tables)
+    miss_rates = pretest.prior_miss_rates() if adaptive else {}
+    if trace_memory:
+        tracemalloc.start()
+    # The pretest prints its results at the end
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        try:
+            for i in range(n_participants):
+                session = SimulatedSession(
+                        SyntheticParticipant(rng, **participant), trace_memory,
+                        adaptive)
+                session.participant_code = f"simulated_{i}"
+                session.miss_rates = miss_rates
+                audio_player.attach(session)
+                sessions.append(session.run())
+                if results_dir and session.finished:
+                    store.append(session_results(session))
+                del timing.spans[:]
+                del audio_player.history[:]
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+    if results_dir:
+        # Count the new chunks before they are merged, so that the next run
+        # only has to recognize the merged chunk
+        difficulty.update(store)
+        store.compact()
+    return sessions
+
+def print_summary(sessions: List[SimulatedSession], seconds: float):
+    n = len(sessions)
+    print(f"{'Phase':<24}{'CPU ms/session':>16}{'total CPU s':>14}"
+          f"{'peak KiB':>12}")
+    for phase in PHASES:
+        cpu = sum(session.cpu[phase] for session in sessions)
+        peak = max(session.peak[phase] for session in sessions)
+        print(f"{phase:<24}{cpu / n * 1000:>16.2f}{cpu:>14.2f}"
+              f"{peak / 1024:>12.1f}")
+    n_trials = sum(session.n_trials for session in sessions)
+    lab_minutes = sum(session.clock for session in sessions) / n / 60000
+    excluded = sum(session.excluded for session in sessions)
+    unfinished = sum(not session.finished for session in sessions) - excluded
+    print(f"\n{n} sessions, {n_trials} trials in {seconds:.2f} s "
+          f"({n / seconds * 60:.0f} sessions per minute)")
+    print(f"Average session length in the lab: {lab_minutes:.1f} min")
+    pretest_items = sum(len(session.pretest.model.dicts)
+                        for session in sessions) / n
+    print(f"Average number of pretest words: {pretest_items:.1f}")
+    if excluded:
+        print(f"{excluded} participants missed no pair of matched words "
+              f"and were not trained")
+    if unfinished:
+        print(f"{unfinished} sessions did not finish")
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__.split('\n\n')[0])
+    parser.add_argument('--participants', type = int, default = 100)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--accuracy', type = float, default = 0.4,
+                        help = "chance of spelling a word right at pretest")
+    parser.add_argument('--learning', type = float, default = 0.3,
+                        help = "how much more likely a right answer is "
+                               "after training")
+    parser.add_argument('--think-ms', type = float, default = 1500)
+    parser.add_argument('--ms-per-letter', type = float, default = 250)
+    parser.add_argument('--no-tracemalloc', action = 'store_true',
+                        help = "do not measure memory (tracemalloc slows "
+                               "everything down)")
+    parser.add_argument('--adaptive', action = 'store_true',
+                        help = "run the adaptive pretest")
+    parser.add_argument('--results', metavar = 'DIR',
+                        help = "append the results of the simulated "
+                               "participants to a results store in DIR")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    sessions = simulate(args.participants, args.seed,
+                        trace_memory = not args.no_tracemalloc,
+                        results_dir = args.results, adaptive = args.adaptive,
+                        accuracy = args.accuracy, learning = args.learning,
+                        think_ms = args.think_ms,
+                        ms_per_letter = args.ms_per_letter)
+    print_summary(sessions, time.perf_counter() - start)
+    return 0 if all(session.finished or session.excluded
+                    for session in sessions) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,267 @@
+""" Stimulus manifest for the phono-ortho-spelling project.
+
+Instead of globbing every word folder under Stimuli/Active each time the
+program starts, we keep a small JSON manifest (Stimuli/manifest.json)
+that lists, for each word, its picture, its talker recordings and the
+novel talker recording, together with their sizes and modification
+times.
+
+On startup the manifest is read once. A folder's modification time only
+changes when files are added, removed or renamed in it, not when a file
+is replaced in place, so we list Stimuli/Active (and stat
+Stimuli/pretest_talker) to compare the folder modification times with
+the ones stored in the manifest, and stat every file the manifest lists
+to compare its size and modification time. Only the word folders where
+anything changed (or that are new) are scanned again, and the manifest
+is rewritten if anything changed. That is a few hundred stats, but no
+folder is listed except Stimuli/Active.
+
+The manifest can also be rebuilt by hand by running
+
+    python stimuli.py
+
+from the python/ directory.
+
+`registry()` combines the manifest with what the lexicon (lexicon.py)
+knows about each word of the word list into one `Stimulus` per word. It
+is built the first time it is needed and then shared by every session
+in the process. Stimuli are immutable tuples and the registry is a
+read-only mapping, so it is safe to share between threads; everything
+that changes during a session lives in session.Noun.
+"""
+
+import os
+import json
+import threading
+from types import MappingProxyType
+from typing import Dict, List, Mapping, NamedTuple, Tuple
+
+import lexicon
+
+
+STIMULI_DIR = "Stimuli"
+ACTIVE_DIR = STIMULI_DIR + "/Active"
+NOVEL_TALKER_DIR = STIMULI_DIR + "/pretest_talker"
+MANIFEST_PATH = STIMULI_DIR + "/manifest.json"
+MANIFEST_VERSION = 1
+
+# Words with at least this many phonemes are 'long', the others 'short'
+LONG_WORD_PHONEMES = 9
+
+# Folders in Stimuli/Active that are not words
+IGNORED_FOLDERS = {'novel_talker'}
+
+
+class Stimulus(NamedTuple):
+    """ Everything about a word that is the same for every participant """
+    name: str
+    img: str
+    audios: Tuple[str, ...]
+    novel_talker: str
+    # 'short' or 'long'
+    length: str = ''
+    phonemes: int = 0
+    # Orthographic transparency, from 0 to 1
+    transparency: float = 0.0
+    phonology: str = ''
+    foils: Tuple[str, ...] = ()
+
+
+#==============================================================================
+# Scanning the stimulus folders
+#==============================================================================
+
+def _file_record(path: str, entry: os.DirEntry) -> List:
+    """ [path, size, mtime] for a file found with os.scandir """
+    st = entry.stat()
+    return [path, st.st_size, st.st_mtime]
+
+def _scan_word_folder(name: str, mtime: float) -> Dict:
+    """ List the picture and the talker recordings of a single word """
+    folder = f"{ACTIVE_DIR}/{name}"
+    img = f"{folder}/pic_{name.lower()}.jpg"
+    image, audios = None, []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            path = f"{folder}/{entry.name}"
+            if entry.name.lower().endswith('.wav'):
+                audios.append(_file_record(path, entry))
+            elif entry.name.lower().endswith('.jpg') and (
+                    image is None or path == img):
+                image = _file_record(path, entry)
+    audios.sort()
+    return {'mtime': mtime, 'img': image or [img, 0, 0.0], 'audios': audios}
+
+def _scan_novel_talkers(mtime: float) -> Dict:
+    """ List the novel talker recordings, keyed by lower-cased word """
+    files = {}
+    if os.path.isdir(NOVEL_TALKER_DIR):
+        with os.scandir(NOVEL_TALKER_DIR) as entries:
+            for entry in entries:
+                stem, ext = os.path.splitext(entry.name)
+                if ext.lower() == '.wav':
+                    word = stem.split('_')[-1].lower()
+                    files[word] = _file_record(
+                            f"{NOVEL_TALKER_DIR}/{entry.name}", entry)
+    return {'mtime': mtime, 'files': files}
+
+def _unchanged(record: List) -> bool:
+    """ Whether a file still has the size and modification time recorded
+    by _file_record """
+    path, size, mtime = record
+    try:
+        st = os.stat(path)
+    except OSError:
+        # A picture that was missing is recorded as [path, 0, 0.0]
+        return size == 0 and mtime == 0.0
+    return st.st_size == size and st.st_mtime == mtime
+
+def _dir_mtime(path: str) -> float:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return 0.0
+
+
+#==============================================================================
+# Reading, updating and writing the manifest
+#==============================================================================
+
+def read_manifest(path: str = MANIFEST_PATH) -> Dict:
+    """ Read the manifest from disk. Returns an empty manifest if the file
+    is missing, unreadable, or was written by another version. """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {'version': MANIFEST_VERSION, 'words': {}, 'novel_talker': None}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {'version': MANIFEST_VERSION, 'words': {}, 'novel_talker': None}
+    return manifest
+
+def write_manifest(manifest: Dict, path: str = MANIFEST_PATH):
+    """ Write the manifest atomically, so that a crash never leaves a
+    half-written file behind """
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, separators=(',', ':'), sort_keys=True)
+    os.replace(tmp, path)
+
+def update_manifest(manifest: Dict) -> bool:
+    """ Bring the manifest up to date with the stimulus folders, rescanning
+    only the word folders whose modification time has changed or where a
+    file's size or modification time has.
+
+    Returns True if the manifest was modified. """
+    changed = False
+    words = manifest['words']
+    seen = set()
+    with os.scandir(ACTIVE_DIR) as entries:
+        for entry in entries:
+            if not entry.is_dir() or entry.name in IGNORED_FOLDERS:
+                continue
+            seen.add(entry.name)
+            mtime = entry.stat().st_mtime
+            old = words.get(entry.name)
+            if (old is None or old['mtime'] != mtime
+                    or not all(map(_unchanged, [old['img']] + old['audios']))):
+                words[entry.name] = _scan_word_folder(entry.name, mtime)
+                changed = True
+    for name in set(words) - seen:
+        del words[name]
+        changed = True
+
+    mtime = _dir_mtime(NOVEL_TALKER_DIR)
+    old = manifest.get('novel_talker')
+    if (old is None or old['mtime'] != mtime
+            or not all(map(_unchanged, old['files'].values()))):
+        manifest['novel_talker'] = _scan_novel_talkers(mtime)
+        changed = True
+    return changed
+
+def load_manifest(path: str = MANIFEST_PATH) -> Dict:
+    """ Read the manifest, rescan any stale word folders and save it back
+    if anything changed """
+    manifest = read_manifest(path)
+    if update_manifest(manifest):
+        try:
+            write_manifest(manifest, path)
+        except OSError:
+            # A read-only stimulus folder should not stop the experiment
+            pass
+    return manifest
+
+
+#==============================================================================
+# The registry of stimuli
+#==============================================================================
+
+def load_registry(path: str = MANIFEST_PATH) -> Dict[str, Stimulus]:
+    """ Build the word -> Stimulus registry of stimulus files from the
+    manifest. The registry is keyed by the name of the word folder, e.g.
+    'Vacuole'. """
+    manifest = load_manifest(path)
+    novel = manifest['novel_talker']['files']
+    registry = {}
+    for name, word in manifest['words'].items():
+        novel_talker = novel.get(name.lower(),
+                [f"{NOVEL_TALKER_DIR}/pretest_talker_{name.lower()}.wav"])
+        registry[name] = Stimulus(
+                name = name,
+                img = word['img'][0],
+                audios = tuple(audio[0] for audio in word['audios']),
+                novel_talker = novel_talker[0])
+    return registry
+
+def lookup(registry: Mapping[str, Stimulus], name: str) -> Stimulus:
+    """ Look up a word in the registry. Words without a stimulus folder get
+    the default file names and no talker recordings, which is what the
+    old glob() based code did. """
+    try:
+        return registry[name]
+    except KeyError:
+        return Stimulus(
+                name = name,
+                img = f"{ACTIVE_DIR}/{name}/pic_{name.lower()}.jpg",
+                audios = (),
+                novel_talker =
+                    f"{NOVEL_TALKER_DIR}/pretest_talker_{name.lower()}.wav")
+
+def word_length(phonemes: int) -> str:
+    return 'long' if phonemes >= LONG_WORD_PHONEMES else 'short'
+
+def build_registry(manifest_path: str = MANIFEST_PATH,
+                   lex: lexicon.Lexicon = None) -> Mapping[str, Stimulus]:
+    """ word -> Stimulus for every word in the word list, keyed and ordered
+    like the word list, with names capitalised like the word folders """
+    files = load_registry(manifest_path)
+    lex = lex or lexicon.lexicon()
+    registry = {}
+    for word in lex.word_list:
+        entry = lex[word]
+        name = word.capitalize()
+        registry[name] = lookup(files, name)._replace(
+                length = word_length(entry.phonemes),
+                phonemes = entry.phonemes,
+                transparency = entry.transparency,
+                phonology = entry.phonology,
+                foils = entry.foils)
+    return MappingProxyType(registry)
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def registry() -> Mapping[str, Stimulus]:
+    """ The shared registry, built the first time it is asked for """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = build_registry()
+        return _registry
+
+
+if __name__ == '__main__':
+    manifest = read_manifest()
+    update_manifest(manifest)
+    write_manifest(manifest)
+    print(f"Wrote {MANIFEST_PATH} with {len(manifest['words'])} words")
@@ -0,0 +1,105 @@
+""" Checks that the difficulty tables count every row of the store once.
+
+    python -m pytest test_difficulty.py     (from the python/ directory)
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import difficulty
+import results
+
+
+def pretest(participant, answers):
+    """ Pretest rows: word -> what was typed """
+    return [results.Result(participant, 'pretest', word, 'high', 'short',
+                           spelling, int(spelling == word))
+            for word, spelling in answers.items()]
+
+def perception(participant, choices):
+    """ Perception rows: word -> the spelling chosen """
+    return [results.Result(participant, 'post_test_perception', word, 'low',
+                           'short', chosen, int(chosen == word))
+            for word, chosen in choices.items()]
+
+
+class TestUpdate(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = results.ResultsStore(self.directory.name)
+        self.tables = difficulty.DifficultyTables()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assertCountsWholeStore(self):
+        """ The tables hold what fitting them from scratch gives """
+        fitted = difficulty.DifficultyTables()
+        fitted.add(self.store.columns())
+        self.assertEqual(self.tables.miss_rates(), fitted.miss_rates())
+        self.assertEqual(self.tables.chosen, fitted.chosen)
+        self.assertEqual(dict(zip(self.tables.words, self.tables.shown)),
+                         dict(zip(fitted.words, fitted.shown)))
+
+    def test_append_then_update(self):
+        self.store.append(pretest('a', {'vacuole': 'vacuole',
+                                        'purine': 'purene'}))
+        self.assertEqual(self.tables.update(self.store), 2)
+        self.store.append(pretest('b', {'purine': 'pureen'}) +
+                          perception('b', {'purine': 'purene'}))
+        self.assertEqual(self.tables.update(self.store), 2)
+        self.assertEqual(self.tables.update(self.store), 0)
+        purine = self.tables.index['purine']
+        self.assertEqual(self.tables.n[purine], 2)
+        self.assertEqual(self.tables.misses[purine], 2)
+        self.assertEqual(self.tables.chosen, {('purine', 'purene'): 1})
+        self.assertCountsWholeStore()
+
+    def test_compact_then_update_counts_once(self):
+        self.store.append(pretest('a', {'vacuole': 'vacuol'}))
+        self.store.append(pretest('b', {'vacuole': 'vacuole'}))
+        self.tables.update(self.store)
+        self.store.compact()
+        self.assertEqual(self.tables.update(self.store), 0)
+        # A new chunk next to the merged one is counted on its own
+        self.store.append(pretest('c', {'vacuole': 'vakuole'}))
+        self.assertEqual(self.tables.update(self.store), 1)
+        self.assertEqual(self.tables.n[self.tables.index['vacuole']], 3)
+        self.store.compact()
+        self.assertEqual(self.tables.update(self.store), 0)
+        # Counted rows merged with new ones: everything is counted again
+        self.store.append(pretest('d', {'vacuole': 'vacuole'}))
+        self.store.compact()
+        self.assertEqual(self.tables.update(self.store), 4)
+        self.assertEqual(self.tables.n[self.tables.index['vacuole']], 4)
+        self.assertCountsWholeStore()
+
+    def test_deleted_chunk_refits(self):
+        first = self.store.append(pretest('a', {'kinesin': 'kinesen'}))
+        self.store.append(pretest('b', {'kinesin': 'kinesin'}))
+        self.tables.update(self.store)
+        os.remove(first)
+        self.assertEqual(self.tables.update(self.store), 1)
+        kinesin = self.tables.index['kinesin']
+        self.assertEqual(self.tables.n[kinesin], 1)
+        self.assertEqual(self.tables.misses[kinesin], 0)
+        self.assertCountsWholeStore()
+
+    def test_saved_tables_carry_on(self):
+        self.store.append(pretest('a', {'isotope': 'isotop'}))
+        self.tables.update(self.store)
+        path = difficulty.tables_path(self.store)
+        self.tables.save(path)
+        self.tables = difficulty.DifficultyTables.load(path)
+        self.store.compact()
+        self.store.append(pretest('b', {'isotope': 'isotope'}))
+        self.assertEqual(self.tables.update(self.store), 1)
+        np.testing.assert_array_equal(self.tables.n, [2])
+        self.assertCountsWholeStore()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+""" Checks of the grapheme-to-phoneme model on its own lexicon.
+
+    python -m pytest test_phonology.py     (from the python/ directory)
+"""
+
+import csv
+import unittest
+
+import phonology
+
+PHONOLOGY = 'Stimuli/orthography_and_phonology.csv'
+
+
+def read_lexicon():
+    with open(PHONOLOGY, newline = '', encoding = 'utf-8') as f:
+        return {row[0].strip(): row[1].strip()
+                for row in csv.reader(f) if len(row) > 1}
+
+
+class TestG2P(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.lexicon = read_lexicon()
+        cls.scorer = phonology.Scorer(phonology.G2P.from_lexicon(cls.lexicon))
+
+    def test_reproduces_lexicon(self):
+        wrong = {word: self.scorer.transcribe(word)
+                 for word, transcription in self.lexicon.items()
+                 if self.scorer.transcribe(word) != transcription}
+        self.assertEqual(wrong, {})
+
+    def test_correct_spellings_score_zero(self):
+        words = list(self.lexicon)
+        scores = self.scorer.score([self.lexicon[word] for word in words],
+                                   words)
+        self.assertEqual([distance for _, distance in scores],
+                         [0.0] * len(words))
+
+    def test_near_homophones_score_close(self):
+        for word, spelling in [('phosphorylation', 'phosphorylatione'),
+                               ('kinesin', 'kinesine'),
+                               ('glycolysis', 'glycolisis'),
+                               ('catalyst', 'katalist')]:
+            with self.subTest(spelling = spelling):
+                _, distance = self.scorer.score([self.lexicon[word]],
+                                                [spelling])[0]
+                self.assertLessEqual(distance, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
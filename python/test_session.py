@@ -0,0 +1,97 @@
+""" Checks of the design pairs and of how the training words are picked.
+
+    python -m pytest test_session.py     (from the python/ directory)
+"""
+
+import collections
+import random
+import types
+import unittest
+
+import lexicon
+import session
+
+
+class TestDesignPairs(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.lexicon = lexicon.lexicon()
+        cls.pairs = session.match_pairs(cls.lexicon)
+
+    def test_pairs_are_matched(self):
+        for a, b in self.pairs:
+            with self.subTest(pair = (a, b)):
+                self.assertEqual(self.lexicon[a].phonemes,
+                                 self.lexicon[b].phonemes)
+                self.assertLessEqual(
+                        abs(self.lexicon[a].transparency
+                            - self.lexicon[b].transparency),
+                        session.TRANSPARENCY_TOLERANCE + 1e-9)
+
+    def test_closest_words_are_paired(self):
+        self.assertIn(('catalyst', 'isotonic'), self.pairs)
+        self.assertIn(('chemiosmotic', 'monosaccharides'), self.pairs)
+
+    def test_words_without_a_match_are_left_out(self):
+        paired = {word for pair in self.pairs for word in pair}
+        self.assertEqual(len(paired), 2 * len(self.pairs))
+        # reducer (6 phonemes, 33%) and isotope (6, 50%) are too far apart
+        self.assertNotIn('reducer', paired)
+        self.assertNotIn('isotope', paired)
+        self.assertGreaterEqual(len(self.pairs),
+                                session.N_TRAINING_WORDS // 2)
+
+
+class TestTrainingWords(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pairs = session.match_pairs(lexicon.lexicon())
+
+    def test_only_fully_missed_pairs_are_trained(self):
+        misses = ['Catalyst', 'isotonic', 'purine', 'chlorophyll', 'reducer']
+        self.assertEqual(session.missed_pairs(misses, self.pairs),
+                         [('catalyst', 'isotonic')])
+        picked = session.pick_training_words(misses, rng = random.Random(0),
+                                             pairs = self.pairs)
+        self.assertEqual(picked, [('catalyst', 'isotonic')])
+
+    def test_pick_samples_whole_pairs(self):
+        misses = [word for pair in self.pairs for word in pair]
+        picked = session.pick_training_words(misses, rng = random.Random(1),
+                                             pairs = self.pairs)
+        self.assertEqual(len(picked), session.N_TRAINING_WORDS // 2)
+        self.assertEqual(len(set(picked)), len(picked))
+        for pair in picked:
+            self.assertIn(pair, self.pairs)
+
+    def test_enough_misses_needs_whole_pairs(self):
+        # Twelve misses: one word of every pair, and words in no pair
+        misses = ([a for a, b in self.pairs]
+                  + ['reducer', 'isotope', 'glycolysis'])[:12]
+        self.assertEqual(len(misses), session.N_TRAINING_WORDS)
+        self.assertFalse(session.enough_misses(misses, pairs = self.pairs))
+        # Twelve misses that are six whole pairs
+        six_pairs = [word for pair in self.pairs[:6] for word in pair]
+        self.assertTrue(session.enough_misses(six_pairs, pairs = self.pairs))
+        self.assertFalse(session.enough_misses(six_pairs[:-1],
+                                               pairs = self.pairs))
+
+    def test_partner_is_tested_next_or_last(self):
+        partner_of = session.partners(self.pairs)
+        a, b = self.pairs[0]
+        nouns = [types.SimpleNamespace(name = name.capitalize())
+                 for name in ('reducer', b, 'isotope')]
+        missed = collections.deque(nouns)
+        session.requeue_partner(missed, types.SimpleNamespace(name = a),
+                                True, partner_of)
+        self.assertEqual([noun.name.lower() for noun in missed],
+                         [b, 'reducer', 'isotope'])
+        spelled = collections.deque(nouns)
+        session.requeue_partner(spelled, types.SimpleNamespace(name = a),
+                                False, partner_of)
+        self.assertEqual([noun.name.lower() for noun in spelled],
+                         ['reducer', 'isotope', b])
+
+
+if __name__ == '__main__':
+    unittest.main()
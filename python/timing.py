@@ -0,0 +1,143 @@
+""" Per-trial latency instrumentation.
+
+Everything that affects when a participant sees or hears a stimulus is
+timed with time.perf_counter(), which is monotonic and has sub-millisecond
+resolution on every platform we run on (time.monotonic() only ticks every
+~15 ms on Windows):
+
+    image_decode            decoding (and scaling) a picture
+    audio_load              reading and decoding a WAV file
+    audio_play              from the start to the end of a clip
+    image_to_audio          training: picture on screen -> its sound starts
+    response_to_next_trial  Enter/click -> the next trial is on screen
+
+Each span is appended to output_timing/<participant>_timing.csv as soon as
+the session has a participant code (spans recorded before that are kept
+in memory and written when the file is opened). When the session ends,
+percentiles of every kind of span are written to
+output_timing/<participant>_timing_summary.csv and printed.
+"""
+
+import csv
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, NamedTuple, Optional
+
+OUTPUT_DIR = 'output_timing'
+
+PERCENTILES = (50, 90, 95, 99)
+
+now = time.perf_counter
+
+
+class Span(NamedTuple):
+    event: str
+    detail: str
+    start: float
+    end: float
+
+    @property
+    def ms(self) -> float:
+        return (self.end - self.start) * 1000
+
+
+def percentile(values: List[float], p: float) -> float:
+    """ Nearest-rank percentile of a sorted list """
+    rank = max(0, math.ceil(p / 100 * len(values)) - 1)
+    return values[rank]
+
+
+class TimingLog:
+    now = staticmethod(now)
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+        self._file = None
+        self._writer = None
+        self.name = None
+
+    def open(self, participant_code: str, output_dir: str = OUTPUT_DIR):
+        """ Start writing spans to the participant's timing file """
+        self.name = participant_code.replace(" ", "_")
+        os.makedirs(output_dir, exist_ok = True)
+        self.output_dir = output_dir
+        with self._lock:
+            self._file = open(os.path.join(output_dir,
+                                           self.name + "_timing.csv"),
+                              "w", newline = '')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(["Event", "Detail", "Start", "End", "ms"])
+            for span in self.spans:
+                self._write(span)
+            self._file.flush()
+
+    def _write(self, span: Span):
+        self._writer.writerow([span.event, span.detail, f"{span.start:.6f}",
+                               f"{span.end:.6f}", f"{span.ms:.3f}"])
+
+    def add(self, event: str, start: float, end: float, detail: str = ""):
+        """ Record a span that was timed elsewhere. Safe to call from any
+        thread. """
+        span = Span(event, str(detail), start, end)
+        with self._lock:
+            self.spans.append(span)
+            if self._writer is not None:
+                self._write(span)
+                self._file.flush()
+
+    @contextmanager
+    def span(self, event: str, detail: str = ""):
+        """ Time the body of a with-statement """
+        start = now()
+        try:
+            yield
+        finally:
+            self.add(event, start, now(), detail)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """ event -> count, min, percentiles, max and spread in ms """
+        durations = {}
+        with self._lock:
+            for span in self.spans:
+                durations.setdefault(span.event, []).append(span.ms)
+        summary = {}
+        for event, values in durations.items():
+            values.sort()
+            stats = {'n': len(values), 'min': values[0]}
+            for p in PERCENTILES:
+                stats[f'p{p}'] = percentile(values, p)
+            stats['max'] = values[-1]
+            stats['spread'] = values[-1] - values[0]
+            summary[event] = stats
+        return summary
+
+    def close(self) -> Optional[str]:
+        """ End the session: print the summary, write it next to the timing
+        file and close the file. Returns the summary file's path. """
+        summary = self.summary()
+        columns = ['n', 'min'] + [f'p{p}' for p in PERCENTILES] + ['max', 'spread']
+        print(f"{'Event':<24}" + "".join(f"{c:>10}" for c in columns))
+        for event, stats in sorted(summary.items()):
+            print(f"{event:<24}{stats['n']:>10}" +
+                  "".join(f"{stats[c]:>10.2f}" for c in columns[1:]))
+
+        with self._lock:
+            if self._file is None:
+                return None
+            self._file.close()
+            self._file = self._writer = None
+        path = os.path.join(self.output_dir, self.name + "_timing_summary.csv")
+        with open(path, "w", newline = '') as f:
+            writer = csv.writer(f)
+            writer.writerow(["Event"] + columns)
+            for event, stats in sorted(summary.items()):
+                writer.writerow([event, stats['n']] +
+                                [f"{stats[c]:.3f}" for c in columns[1:]])
+        return path
+
+
+timing = TimingLog()
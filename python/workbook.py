@@ -0,0 +1,66 @@
+""" Read rows straight out of Excel workbooks and CSV files.
+
+The pretest results are saved as .xlsx workbooks. We used to convert a
+workbook to a temporary CSV file in the working directory (pretest.csv,
+ld.csv) and then read that file back in. Instead, `read_rows` yields the
+rows of a sheet one at a time, reading the workbook in openpyxl's
+read-only (streaming) mode, so memory use does not grow with the size of
+the workbook and nothing is written to disk. CSV files are read the same
+way, so callers do not need to care which kind of file they were given.
+"""
+
+import csv
+import os
+from typing import Iterator, List, NamedTuple, Optional
+
+
+class PretestRow(NamedTuple):
+    """ One answer from the pretest """
+    word: str
+    answer: str
+    correct: int
+    condition: str
+
+
+def _cell_to_str(value) -> str:
+    if value is None:
+        return ""
+    return str(value)
+
+def read_rows(path: str, sheet: Optional[str] = None,
+              skip_header: bool = True) -> Iterator[List[str]]:
+    """ Yield the rows of a .xlsx sheet or .csv file as lists of strings.
+    `sheet` is the name of the worksheet to read; by default the first
+    one. Empty rows are skipped. """
+    if os.path.splitext(path)[1].lower() in ('.xlsx', '.xlsm'):
+        rows = _read_xlsx_rows(path, sheet)
+    else:
+        rows = _read_csv_rows(path)
+    if skip_header:
+        next(rows, None)
+    for row in rows:
+        if any(row):
+            yield row
+
+def _read_csv_rows(path: str) -> Iterator[List[str]]:
+    with open(path, newline='') as f:
+        yield from csv.reader(f)
+
+def _read_xlsx_rows(path: str, sheet: Optional[str]) -> Iterator[List[str]]:
+    import openpyxl
+    wb = openpyxl.load_workbook(path, read_only = True, data_only = True)
+    try:
+        ws = wb[sheet] if sheet is not None else wb.worksheets[0]
+        for row in ws.iter_rows(values_only = True):
+            yield [_cell_to_str(value) for value in row]
+    finally:
+        wb.close()
+
+def read_pretest(path: str, sheet: str = 'Pretest') -> Iterator[PretestRow]:
+    """ Yield the answers in a pretest workbook (or CSV export of one).
+    The rows are laid out as [index, word, answer, T/F, condition]. """
+    for row in read_rows(path, sheet):
+        yield PretestRow(word = row[1].strip(),
+                         answer = row[2].strip(),
+                         correct = int(float(row[3])),
+                         condition = row[4].strip())